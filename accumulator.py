@@ -0,0 +1,156 @@
+import numpy as np
+import pandas as pd
+
+# 数据点缓冲区的初始容量，写满后按倍数扩容
+INITIAL_CAPACITY = 1024
+
+
+class CountyMetricAccumulator:
+    """
+    县域 × 指标 数据点的紧凑累加器
+
+    - 县域和指标名称驻留为整数ID（字典查找），县域ID按首次出现顺序分配
+    - 数据点以COO形式追加到可增长的NumPy缓冲区: 县域ID、指标ID（int32）和取值（object，只保存引用）
+    - to_frame() 按"后写入者优先"去重后逐列构建结果表，数值列直接写入 float64 数组
+
+    内存占用和构建时间只与已填充的数据点数量有关（最终结果表本身除外），
+    不会为 县域 × 指标 的每个位置创建Python对象
+    """
+
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self._county_ids = {}
+        self._metric_ids = {}
+        self.county_names = []
+        self.metric_names = []
+        self._counties = np.empty(capacity, dtype=np.int32)
+        self._metrics = np.empty(capacity, dtype=np.int32)
+        self._values = np.empty(capacity, dtype=object)
+        self.size = 0
+
+    @staticmethod
+    def _intern(ids, names, name):
+        index = ids.get(name)
+        if index is None:
+            index = ids[name] = len(names)
+            names.append(name)
+        return index
+
+    def county_id(self, name):
+        """返回县域的整数ID，首次出现时分配新ID"""
+        return self._intern(self._county_ids, self.county_names, name)
+
+    def metric_id(self, name):
+        """返回指标的整数ID，首次出现时分配新ID"""
+        return self._intern(self._metric_ids, self.metric_names, name)
+
+    def add_counties(self, names):
+        """按顺序登记县域（包括没有任何数据的县域），返回它们的ID数组"""
+        return np.fromiter((self.county_id(name) for name in names), dtype=np.int32)
+
+    def add_metrics(self, names):
+        """登记指标，返回它们的ID数组"""
+        return np.fromiter((self.metric_id(name) for name in names), dtype=np.int32)
+
+    def _reserve(self, extra):
+        """保证缓冲区还能容纳 extra 个数据点，不足时按倍数扩容"""
+        needed = self.size + extra
+        if needed <= len(self._values):
+            return
+        capacity = max(needed, len(self._values) * 2)
+        for name in ('_counties', '_metrics', '_values'):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def append(self, county_id, metric_id, value):
+        """追加单个数据点"""
+        self._reserve(1)
+        self._counties[self.size] = county_id
+        self._metrics[self.size] = metric_id
+        self._values[self.size] = value
+        self.size += 1
+
+    def add_records(self, counties, metrics, values):
+        """
+        批量追加数据点
+
+        参数:
+        counties / metrics: 县域、指标名称的一维数组（object），逐个数据点对应
+        values: 取值的一维object数组
+        """
+        count = len(values)
+        if not count:
+            return
+        self._reserve(count)
+        end = self.size + count
+        self._counties[self.size:end] = self._intern_array(counties, self.county_id)
+        self._metrics[self.size:end] = self._intern_array(metrics, self.metric_id)
+        self._values[self.size:end] = values
+        self.size = end
+
+    @staticmethod
+    def _intern_array(names, intern):
+        """把名称数组转换为ID数组: 先在C层去重，只对不同的名称做字典查找"""
+        codes, uniques = pd.factorize(np.asarray(names, dtype=object))
+        ids = np.fromiter((intern(name) for name in uniques), dtype=np.int32, count=len(uniques))
+        return ids[codes]
+
+    def to_frame(self, index_name='县域'):
+        """
+        生成结果表: 第一列为县域（按首次出现顺序），其余列为排序后的指标；
+        同一县域同一指标出现多次时保留最后写入的值，类型推断与逐行构建 DataFrame 相同
+        """
+        n_counties = len(self.county_names)
+        metric_order = sorted(range(len(self.metric_names)), key=self.metric_names.__getitem__)
+        # 指标ID → 结果表中的列位置
+        column_of = np.empty(len(metric_order), dtype=np.int64)
+        column_of[metric_order] = np.arange(len(metric_order))
+
+        counties = self._counties[:self.size].astype(np.int64)
+        columns = column_of[self._metrics[:self.size]]
+        # 按 列 → 行 排序的位置键；倒序后取每个位置的第一次出现，即原顺序中的最后一次写入
+        flat = (columns * n_counties + counties)[::-1]
+        _, first = np.unique(flat, return_index=True)
+        keep = self.size - 1 - first
+        bounds = np.searchsorted(columns[keep], np.arange(len(metric_order) + 1))
+
+        names = np.empty(n_counties, dtype=object)
+        names[:] = self.county_names
+        arrays = [_infer_column(names)]
+        for position in range(len(metric_order)):
+            selected = keep[bounds[position]:bounds[position + 1]]
+            arrays.append(_build_column(n_counties, counties[selected], self._values[selected]))
+
+        result_df = pd.DataFrame(dict(enumerate(arrays)))
+        result_df.columns = [index_name] + [self.metric_names[i] for i in metric_order]
+        return result_df
+
+
+def _build_column(length, rows, values):
+    """
+    由一列的非空数据点构建完整的列
+
+    只含数值的列直接写入 float64 数组（与逐行构建时整数列遇到空值提升为浮点数一致）；
+    其他情况（文本、日期、混合类型、没有空值的整数列）交给pandas按相同规则推断类型
+    """
+    if len(values) < length:
+        kind = pd.api.types.infer_dtype(values, skipna=False)
+        if kind in ('floating', 'integer', 'mixed-integer-float'):
+            try:
+                numbers = values.astype(np.float64) if kind != 'integer' else values.astype(np.int64)
+            except (OverflowError, TypeError, ValueError):
+                numbers = None
+            if numbers is not None:
+                column = np.full(length, np.nan)
+                column[rows] = numbers
+                return column
+
+    column = np.full(length, np.nan, dtype=object)
+    column[rows] = values
+    return _infer_column(column)
+
+
+def _infer_column(column):
+    """对object列做与 pd.DataFrame(行列表) 相同的类型推断"""
+    return pd.Series(column, copy=False).infer_objects()
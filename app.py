@@ -1,14 +1,57 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory
+from flask import Flask, render_template, request, redirect, url_for, flash, send_file, jsonify
 import os
-import pandas as pd
-import numpy as np
+import logging
 from werkzeug.utils import secure_filename
 import tempfile
+import excel_engine
+from excel_engine import ResultMemo
+from job_queue import JobQueue, JobQueueFull
+from result_preview import excel_window, frame_window, parse_window_args
+from instrumentation import configure_logging, init_app
+from workspace import WorkspaceManager, init_app as init_workspaces
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'supersecretkey'
-app.config['UPLOAD_FOLDER'] = tempfile.gettempdir()
+# 工作区根目录: 每个请求的上传文件和处理结果保存在其中独立的子目录里，过期后由后台线程清理
+app.config['UPLOAD_FOLDER'] = os.environ.get('UPLOAD_FOLDER', os.path.join(tempfile.gettempdir(), 'excel_workspaces'))
+app.config['WORKSPACE_TTL_MINUTES'] = int(os.environ.get('WORKSPACE_TTL_MINUTES', '60'))
+app.config['WORKSPACE_MAX_MB'] = int(os.environ.get('WORKSPACE_MAX_MB', '1024'))
+app.config['JANITOR_INTERVAL_SECONDS'] = int(os.environ.get('JANITOR_INTERVAL_SECONDS', '60'))
+# 上传缓冲: 小于该大小的上传保存在内存中，超过后转存到临时文件
+app.config['UPLOAD_SPOOL_MB'] = float(os.environ.get('UPLOAD_SPOOL_MB', '4'))
 app.config['ALLOWED_EXTENSIONS'] = {'xlsx', 'xls'}
+# Excel读取引擎: auto（默认，按文件格式和大小选择，已安装 python-calamine 时优先使用）、openpyxl、xlrd 或 calamine
+app.config['EXCEL_READER'] = os.environ.get('EXCEL_READER', 'auto')
+# 后台任务模式: 处理进程数与最多排队的任务数
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', '2'))
+app.config['JOB_QUEUE_SIZE'] = int(os.environ.get('JOB_QUEUE_SIZE', '8'))
+# 任务状态目录: 多进程部署时各工作进程通过该目录共享任务记录和进度
+app.config['JOB_STATE_DIR'] = os.environ.get('JOB_STATE_DIR', os.path.join(tempfile.gettempdir(), 'excel_jobs'))
+# 单个任务的资源上限: 完整解析前检查的单元格数、处理时间（秒）和后台任务工作进程的内存（MB），0 表示不限制
+app.config['MAX_WORKBOOK_CELLS'] = int(os.environ.get('MAX_WORKBOOK_CELLS', '5000000'))
+app.config['JOB_MAX_SECONDS'] = int(os.environ.get('JOB_MAX_SECONDS', '240'))
+app.config['JOB_MAX_MEMORY_MB'] = int(os.environ.get('JOB_MAX_MEMORY_MB', '2048'))
+# 进程内结果缓存: 同步处理的结果表保留在内存中（MB），预览时直接截取窗口，不必重新读取结果文件，0 表示不保留
+app.config['RESULT_MEMORY_MB'] = int(os.environ.get('RESULT_MEMORY_MB', '256'))
+
+# 性能分析: 设置后带请求头 X-Profile: 1 的请求会保存 cProfile 结果到该目录
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR')
+
+# 请求耗时直方图、/metrics 接口和可选的 cProfile 钩子
+init_app(app)
+
+workspaces = WorkspaceManager(app.config['UPLOAD_FOLDER'], ttl_seconds=app.config['WORKSPACE_TTL_MINUTES'] * 60,
+                              max_bytes=app.config['WORKSPACE_MAX_MB'] * 1024 * 1024,
+                              sweep_interval=app.config['JANITOR_INTERVAL_SECONDS'])
+init_workspaces(app, workspaces, spool_bytes=int(app.config['UPLOAD_SPOOL_MB'] * 1024 * 1024))
+
+result_memory = ResultMemo(max_bytes=app.config['RESULT_MEMORY_MB'] * 1024 * 1024)
+job_queue = JobQueue(max_workers=app.config['JOB_WORKERS'], max_pending=app.config['JOB_QUEUE_SIZE'],
+                     state_dir=app.config['JOB_STATE_DIR'], max_seconds=app.config['JOB_MAX_SECONDS'],
+                     max_memory_mb=app.config['JOB_MAX_MEMORY_MB'])
 
 def allowed_file(filename):
     """检查文件是否为允许的类型"""
@@ -16,143 +59,26 @@ def allowed_file(filename):
 
 def process_excel_data(input_file, output_file):
     """
-    处理Excel数据，将多个表格整合为一个标准格式，确保县域名称在A列，指标在第一行
-    支持识别工作表中的所有表格区域，包括后续表格中的县域名称
-    
+    处理Excel数据并写出结果文件（不含行索引），由 excel_engine 统一实现；
+    完整解析前检查单元格数，每个工作表后检查处理时间
+
     参数:
-    input_file: 输入Excel文件路径
+    input_file: 输入Excel文件路径或上传缓冲区（二进制文件对象）
     output_file: 输出Excel文件路径
+
+    返回: 结果DataFrame；出错时记录失败的处理统计后抛出异常
     """
     try:
-        print(f"开始处理文件: {input_file}")
-        
-        # 尝试读取Excel文件（支持xlsx和xls格式）
-        try:
-            excel_file = pd.ExcelFile(input_file)
-            print(f"成功读取Excel文件，找到 {len(excel_file.sheet_names)} 个工作表")
-        except Exception as e:
-            print(f"读取Excel文件失败: {e}")
-            raise
-        
-        # 存储所有数据的字典
-        all_county_data = {}
-        all_metrics = set()
-        # 保存县域名称的原始顺序
-        original_county_order = []
-        total_tables = 0
-        
-        # 处理每个工作表
-        for sheet_name in excel_file.sheet_names:
-            print(f"\n处理工作表: {sheet_name}")
-            # 读取当前工作表
-            df = pd.read_excel(input_file, sheet_name=sheet_name)
-            print(f"工作表 '{sheet_name}' 形状: {df.shape}")
-            
-            # 首先找到所有表格的起始行
-            table_starts = []
-            for i in range(len(df)):
-                # 安全检查列是否存在
-                if len(df.columns) > 0 and pd.notna(df.iloc[i, 0]):
-                    cell_value = str(df.iloc[i, 0]).strip()
-                    # 检查是否为表格标题行
-                    if cell_value == '指标':
-                        # 检查B列是否为'单位'，确保是有效的表格头
-                        if len(df.columns) > 1 and pd.notna(df.iloc[i, 1]) and str(df.iloc[i, 1]).strip() == '单位':
-                            table_starts.append(i)
-                            print(f"  发现表格起始行: 第{i+1}行")
-            
-            total_tables += len(table_starts)
-            print(f"工作表 '{sheet_name}' 中发现 {len(table_starts)} 个表格区域")
-            
-            # 处理每个表格区域
-            for start_row in table_starts:
-                print(f"  处理表格区域，起始行: {start_row + 1}")
-                
-                # 提取县域名称（从C列开始的表头）
-                county_names = []
-                for j in range(2, len(df.columns)):  # 从第三列开始
-                    if pd.notna(df.iloc[start_row, j]):
-                        # 保留原始格式（包括可能的换行符）
-                        county_name = str(df.iloc[start_row, j]).strip()
-                        if county_name:  # 确保不为空字符串
-                            county_names.append(county_name)
-                            # 初始化该县域的数据字典
-                            if county_name not in all_county_data:
-                                all_county_data[county_name] = {}
-                                # 保留原始顺序
-                                if county_name not in original_county_order:
-                                    original_county_order.append(county_name)
-                                print(f"    添加新县域: '{county_name}'")
-                
-                print(f"  从该表格区域识别到 {len(county_names)} 个县域: {county_names}")
-                
-                # 处理当前表格的数据行
-                i = start_row + 1  # 从表头的下一行开始
-                
-                # 找到下一个表格的起始位置作为当前表格的结束
-                next_table_start = None
-                for next_start in table_starts:
-                    if next_start > start_row:
-                        next_table_start = next_start
-                        break
-                
-                # 确定当前表格的结束行
-                end_row = next_table_start if next_table_start is not None else len(df)
-                print(f"  当前表格处理范围: 行 {i+1} 到行 {end_row}")
-                
-                # 读取指标数据，直到遇到下一个表格开始或工作表结束
-                processed_rows = 0
-                while i < end_row:
-                    # 确保当前行有数据再处理
-                    if len(df.columns) > 0 and pd.notna(df.iloc[i, 0]):
-                        cell_value = str(df.iloc[i, 0]).strip()
-                        # 指标处理
-                        metric = cell_value
-                        # 跳过分类行（如"一、基本情况"等）
-                        if metric and not any(metric.startswith(prefix) for prefix in ['一、', '二、', '三、', '四、', '五、', '六、', '七、', '八、']):
-                            all_metrics.add(metric)
-                            # 读取每个县域的数据
-                            for j, county_name in enumerate(county_names):
-                                data_col = j + 2  # 数据从第三列开始
-                                if data_col < len(df.columns) and pd.notna(df.iloc[i, data_col]):
-                                    # 确保数据类型正确
-                                    data_value = df.iloc[i, data_col]
-                                    all_county_data[county_name][metric] = data_value
-                        processed_rows += 1
-                    i += 1
-                print(f"  表格区域处理完成，共处理 {processed_rows} 行数据")
-        
-        # 输出总统计信息
-        print(f"\n=== 总统计 ===")
-        print(f"- 总共处理 {total_tables} 个表格区域")
-        print(f"- 识别到 {len(all_county_data)} 个县域")
-        print(f"- 识别到 {len(all_metrics)} 个指标")
-        print(f"- 县域列表: {original_county_order}")
-        
-        # 创建新的数据框，注意转置结构
-        metrics_list = sorted(list(all_metrics))
-        
-        # 创建数据，让县域作为行，指标作为列
-        data = []
-        for county in original_county_order:  # 使用原始顺序
-            row_data = [county]  # 县域名称作为第一列数据
-            for metric in metrics_list:
-                row_data.append(all_county_data[county].get(metric, np.nan))
-            data.append(row_data)
-        
-        # 创建列名：第一列为'县域'，其余为指标名
-        columns = ['县域'] + metrics_list
-        
-        # 创建DataFrame
-        result_df = pd.DataFrame(data, columns=columns)
-        
-        # 保存结果，不包含默认索引
-        result_df.to_excel(output_file, index=False)
-        
-        return len(all_county_data), len(metrics_list)
-    
+        return excel_engine.process_excel_data(input_file, output_file, reader=app.config['EXCEL_READER'],
+                                               max_seconds=app.config['JOB_MAX_SECONDS'],
+                                               max_cells=app.config['MAX_WORKBOOK_CELLS'])
     except Exception as e:
-        raise Exception(f"处理过程中出现错误: {str(e)}")
+        logger.error(f"处理过程中出现错误: {e}")
+        raise
+
+def upload_id(filename):
+    """工作区内文件路径（<工作区ID>/<文件名>）对应的上传ID，即工作区ID"""
+    return filename.split('/', 1)[0]
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
@@ -171,21 +97,34 @@ def index():
         
         # 检查文件类型
         if file and allowed_file(file.filename):
-            # 保存上传的文件
+            # 每个上传使用独立的工作区，同名文件互不覆盖
             filename = secure_filename(file.filename)
-            input_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(input_path)
+            workspace = workspaces.create()
             
             # 处理文件
             output_filename = f"处理结果_{filename}"
-            output_path = os.path.join(app.config['UPLOAD_FOLDER'], output_filename)
+            output_path = workspace.file_path(output_filename)
+            
+            # 后台任务模式（表单字段或查询参数 async=1）: 立即返回任务ID；任务在其他进程中处理，需要保存上传文件
+            if (request.form.get('async') or request.args.get('async')) in ('1', 'true'):
+                input_path = workspace.file_path(f"upload{os.path.splitext(filename)[1].lower()}")
+                file.save(input_path)
+                try:
+                    job_id = job_queue.submit(input_path, output_path, index=False, reader=app.config['EXCEL_READER'],
+                                              max_cells=app.config['MAX_WORKBOOK_CELLS'],
+                                              display_filename=output_filename)
+                except JobQueueFull as e:
+                    return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
+                return jsonify({'job_id': job_id, 'status_url': url_for('job_status', job_id=job_id)}), 202
             
             try:
-                county_count, metric_count = process_excel_data(input_path, output_path)
-                flash(f'数据处理成功！共处理 {county_count} 个县域，{metric_count} 个指标')
-                return redirect(url_for('download_file', filename=output_filename))
+                # 直接解析上传缓冲区，不保存上传文件
+                result_df = process_excel_data(file.stream, output_path)
+                result_memory.put(workspace.id, result_df)
+                flash(f'数据处理成功！共处理 {len(result_df)} 个县域，{len(result_df.columns) - 1} 个指标')
+                return redirect(url_for('download_file', filename=workspace.relative(output_filename)))
             except Exception as e:
-                flash(str(e))
+                flash(f"处理过程中出现错误: {e}")
                 return redirect(request.url)
         else:
             flash('只支持 .xlsx 和 .xls 格式的文件')
@@ -193,31 +132,78 @@ def index():
     
     return render_template('index.html')
 
-@app.route('/download/<filename>')
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """查询后台任务的状态、逐工作表进度，完成后附带下载链接"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在或已过期'}), 404
+    
+    response = {
+        'job_id': job_id,
+        'state': job['state'],
+        'progress': job.get('progress'),
+        'result': job['result'],
+        'error': job['error'],
+    }
+    if job['state'] == 'done':
+        output_path = os.path.relpath(job['output_path'], workspaces.root).replace(os.sep, '/')
+        response['download_url'] = url_for('download_file', filename=output_path)
+    return jsonify(response)
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """取消后台任务: 排队中的任务立即取消，处理中的任务会在短时间内中断"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在或已过期'}), 404
+    if job['state'] not in ('queued', 'running'):
+        return jsonify({'job_id': job_id, 'state': job['state'], 'error': '任务已结束，无法取消'}), 409
+    
+    job = job_queue.cancel(job_id)
+    return jsonify({'job_id': job_id, 'state': job['state'], 'cancel_requested': job.get('cancel_requested', False)}), \
+        200 if job['state'] == 'cancelled' else 202
+
+@app.route('/download/<path:filename>')
 def download_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename, as_attachment=True)
+    """下载工作区内的文件，filename 为 <工作区ID>/<文件名>"""
+    file_path = workspaces.resolve(filename)
+    if file_path is None:
+        flash('下载失败: 文件不存在或已被删除')
+        return redirect(url_for('index'))
+    return send_file(file_path, as_attachment=True)
 
-@app.route('/preview/<filename>')
+@app.route('/preview/<path:filename>')
 def preview_file(filename):
+    """预览页面，表格数据由页面通过 /api/preview/<filename> 按窗口加载"""
+    # 只接受工作区内的文件，防止目录遍历；输出文件名含中文（处理结果_...），不改写文件名
+    file_path = workspaces.resolve(filename)
+    if file_path is None:
+        flash('预览失败: 文件不存在或已被删除')
+        return redirect(url_for('index'))
+    
+    return render_template('preview.html',
+                           preview_api=url_for('preview_window', filename=filename),
+                           download_url=url_for('download_file', filename=filename),
+                           filename=filename)
+
+@app.route('/api/preview/<path:filename>')
+def preview_window(filename):
+    """
+    返回结果文件的一个 行 × 列 窗口（JSON），参数 row_offset/row_limit/col_offset/col_limit
+    结果表仍保留在进程内存中时直接截取窗口，否则只读取结果文件中窗口内的行，不加载整个文件
+    """
+    file_path = workspaces.resolve(filename)
+    if file_path is None:
+        result_memory.discard(upload_id(filename))
+        return jsonify({'error': '文件不存在或已被删除'}), 404
     try:
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        df = pd.read_excel(file_path)
-        
-        # 获取前10行数据用于预览
-        preview_data = df.head(10).to_html(classes='table table-striped table-hover', index=True)
-        
-        # 获取基本统计信息
-        stats = {
-            '行数': len(df),
-            '列数': len(df.columns),
-            '指标数量': len(df),
-            '县域列表': list(df.columns)
-        }
-        
-        return render_template('preview.html', preview_data=preview_data, stats=stats, filename=filename)
+        result_df = result_memory.get(upload_id(filename))
+        if result_df is not None:
+            return jsonify(frame_window(result_df, **parse_window_args(request.args)))
+        return jsonify(excel_window(file_path, **parse_window_args(request.args)))
     except Exception as e:
-        flash(f'预览失败: {str(e)}')
-        return redirect(url_for('index'))
+        return jsonify({'error': f'预览失败: {str(e)}'}), 400
 
 if __name__ == '__main__':
     # 确保上传文件夹存在
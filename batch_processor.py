@@ -0,0 +1,171 @@
+import os
+import sys
+import time
+import logging
+import argparse
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from excel_engine import process_workbook, ENGINES
+from output_writers import write_excel
+from workbook_loader import READERS
+from instrumentation import new_stats, record_processing, configure_logging
+
+logger = logging.getLogger(__name__)
+
+EXCEL_EXTENSIONS = ('.xlsx', '.xls')
+
+
+def collect_input_files(inputs):
+    """
+    展开输入: 目录中的所有Excel文件（按文件名排序）以及直接给出的文件
+
+    参数:
+    inputs: 文件或目录路径列表
+    """
+    files = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                # 跳过Excel打开文件时产生的 ~$ 临时文件
+                if name.lower().endswith(EXCEL_EXTENSIONS) and not name.startswith('~$'):
+                    files.append(os.path.join(path, name))
+        else:
+            files.append(path)
+    return files
+
+
+def province_name(file_path):
+    """以文件名（不含扩展名）作为省份名称，例如 '四川省.xlsx' → '四川省'"""
+    return os.path.splitext(os.path.basename(file_path))[0]
+
+
+def process_batch(inputs, engine='vectorized', max_workers=None, provinces=None, reader=None, limits=None):
+    """
+    并行处理多个工作簿，并把各省的县域行合并为一张带'省份'列的结果表
+
+    每个工作簿在独立的工作进程中处理，单个文件失败只记录在汇总中，不会中断其他文件；
+    工作进程意外退出时只有导致退出的文件记为失败（见 _run_files）
+
+    参数:
+    inputs: 文件或目录路径列表
+    engine: 提取引擎，见 data_processor.extract_county_data
+    max_workers: 进程数，默认为CPU核数
+    provinces: 可选的 {文件路径: 省份名称}，未给出的文件使用文件名作为省份
+    reader: Excel读取引擎，见 data_processor.extract_county_data
+    limits: 可选的每个文件的资源上限 {'max_cells', 'max_seconds', 'max_memory_mb'}，见 excel_engine.process_workbook
+
+    返回: (合并后的DataFrame, 每个文件的处理汇总列表)
+    """
+    files = collect_input_files(inputs)
+    provinces = provinces or {}
+    results = {}
+    summary = {}
+
+    if files:
+        for path, outcome in _run_files(files, max_workers, engine, reader, limits):
+            province = provinces.get(path, province_name(path))
+            if isinstance(outcome, Exception):
+                summary[path] = {'file': path, 'province': province, 'status': 'failed', 'error': str(outcome)}
+                logger.error("处理失败: %s: %s", path, outcome)
+                record_processing(new_stats(engine), status='failed')
+                continue
+            result_df, seconds, stats = outcome
+            record_processing(stats)
+            results[path] = result_df
+            summary[path] = {
+                'file': path,
+                'province': province,
+                'status': 'ok',
+                'counties': len(result_df),
+                'metrics': len(result_df.columns) - 1,
+                'seconds': round(seconds, 3),
+            }
+            logger.info("处理完成: %s（%d 个县域，%.2f 秒）", path, len(result_df), seconds)
+
+    # 按输入顺序合并，指标列取并集并排序，与单个工作簿的输出格式一致
+    frames = []
+    for path in files:
+        if path in results:
+            frames.append(results[path].assign(省份=summary[path]['province']))
+    if frames:
+        combined = pd.concat(frames, ignore_index=True)
+        metrics = sorted(set(combined.columns) - {'省份', '县域'})
+        combined = combined[['省份', '县域'] + metrics]
+    else:
+        combined = pd.DataFrame(columns=['省份', '县域'])
+
+    return combined, [summary[path] for path in files]
+
+
+def _run_files(files, max_workers, *args):
+    """
+    在进程池中处理各文件，按完成顺序产出 (文件路径, (结果DataFrame, 耗时秒数, 处理统计) 或异常)
+
+    一个工作进程意外退出（例如原生扩展内存分配失败）会让进程池中所有未完成的文件都以 BrokenProcessPool 失败，
+    无法区分是哪个文件导致的；这些文件随后逐个在新的单进程池中重新处理，只有再次导致退出的文件记为失败
+    """
+    crashed = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_process_one, path, *args): path for path in files}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except BrokenProcessPool:
+                crashed.append(futures[future])
+            except Exception as e:
+                yield futures[future], e
+
+    for path in sorted(crashed, key=files.index):
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            try:
+                yield path, executor.submit(_process_one, path, *args).result()
+            except BrokenProcessPool:
+                yield path, RuntimeError('处理进程意外退出（可能超出了内存上限）')
+            except Exception as e:
+                yield path, e
+
+
+def _process_one(file_path, engine, reader=None, limits=None):
+    """在工作进程中处理单个工作簿，返回 (结果DataFrame, 耗时秒数, 处理统计)；limits 见 process_batch"""
+    start = time.perf_counter()
+    # 工作进程专用，由看门狗中断超时或超出内存上限的文件
+    result_df, _, stats = process_workbook(file_path, engine=engine, reader=reader, interrupt=True, **(limits or {}))
+    return result_df, time.perf_counter() - start, stats
+
+
+def print_summary(summary):
+    """打印每个文件的成功/失败汇总"""
+    succeeded = [item for item in summary if item['status'] == 'ok']
+    print(f"\n=== 批量处理汇总: 成功 {len(succeeded)} 个，失败 {len(summary) - len(succeeded)} 个 ===")
+    for item in summary:
+        if item['status'] == 'ok':
+            print(f"[成功] {item['province']}: {item['counties']} 个县域，{item['metrics']} 个指标，{item['seconds']} 秒")
+        else:
+            print(f"[失败] {item['province']}: {item['error']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='批量处理多个省份的Excel工作簿并合并为一张表')
+    parser.add_argument('inputs', nargs='+', help='Excel文件或包含Excel文件的目录')
+    parser.add_argument('-o', '--output', default='批量处理结果.xlsx', help='合并结果的输出文件（默认: 批量处理结果.xlsx）')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='并行进程数（默认: CPU核数）')
+    parser.add_argument('--engine', choices=ENGINES, default='vectorized', help='提取引擎（默认: vectorized）')
+    parser.add_argument('--reader', choices=('auto',) + tuple(READERS), default=None,
+                        help='Excel读取引擎（默认: 环境变量 EXCEL_READER，未设置时为 auto）')
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    combined, summary = process_batch(args.inputs, engine=args.engine, max_workers=args.workers, reader=args.reader)
+    print_summary(summary)
+    if not summary:
+        print("错误: 没有找到任何Excel文件")
+        return 1
+
+    write_excel(combined, args.output, index=False)
+    print(f"合并结果已保存到: {args.output}（{len(combined)} 行）")
+    return 0 if all(item['status'] == 'ok' for item in summary) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
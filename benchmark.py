@@ -0,0 +1,242 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import platform
+import argparse
+import tempfile
+import statistics
+import tracemalloc
+import contextlib
+import pandas as pd
+from data_processor import _detect_regions, _extract_regions
+from excel_engine import process_excel_data
+from accumulator import CountyMetricAccumulator
+from output_writers import write_excel
+from workbook_loader import open_workbook, available_readers, READERS
+from synthetic_workbook import generate_workbook
+
+# 计时的处理阶段，与 process_excel_data 的执行顺序一致
+STAGES = ('load', 'detect', 'extract', 'pivot', 'write')
+
+# 合成工作簿的规模，参数见 synthetic_workbook.generate_workbook
+SCENARIOS = {
+    'small': {'sheets': 2, 'tables_per_sheet': 2, 'counties_per_table': 10, 'metrics': 30},
+    'typical': {'sheets': 6, 'tables_per_sheet': 3, 'counties_per_table': 25, 'metrics': 80},
+    'wide': {'sheets': 2, 'tables_per_sheet': 2, 'counties_per_table': 150, 'metrics': 60},
+    'many_sheets': {'sheets': 40, 'tables_per_sheet': 2, 'counties_per_table': 10, 'metrics': 30},
+    'sparse': {'sheets': 4, 'tables_per_sheet': 4, 'counties_per_table': 30, 'metrics': 100, 'sparsity': 0.8},
+    'large': {'sheets': 10, 'tables_per_sheet': 5, 'counties_per_table': 40, 'metrics': 200},
+}
+# 默认运行的场景，'large' 耗时较长，需要时通过 --scenario 指定
+DEFAULT_SCENARIOS = ('small', 'typical', 'wide', 'many_sheets', 'sparse')
+
+# 低于这些差值的变化视为测量噪声，不算退化
+MIN_SECONDS_DELTA = 0.01
+MIN_PEAK_KB_DELTA = 256
+
+
+@contextlib.contextmanager
+def _stage(name, timings, peaks):
+    """记录一个阶段的耗时；tracemalloc 开启时同时记录该阶段新增的内存峰值（KB）"""
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    yield
+    timings[name] = time.perf_counter() - start
+    if tracing:
+        peaks[name] = (tracemalloc.get_traced_memory()[1] - before) / 1024
+
+
+def run_pipeline(input_file, output_file, reader='auto'):
+    """
+    分阶段执行与 process_excel_data（vectorized 引擎）相同的处理流程
+
+    参数:
+    reader: Excel读取引擎，见 workbook_loader.open_workbook
+
+    返回: (结果DataFrame, {阶段: 秒数}, {阶段: 内存峰值KB}, 实际使用的读取引擎)，未开启 tracemalloc 时内存峰值为空
+    """
+    timings = {}
+    peaks = {}
+
+    with _stage('load', timings, peaks):
+        with open_workbook(input_file, reader=reader) as workbook:
+            frames = [workbook.read_sheet(sheet_name) for sheet_name in workbook.sheet_names]
+            used_reader = workbook.reader
+
+    with _stage('detect', timings, peaks):
+        regions = [_detect_regions(df) for df in frames]
+
+    with _stage('extract', timings, peaks):
+        sheets = [_extract_regions(df, sheet_regions) for df, sheet_regions in zip(frames, regions)]
+
+    with _stage('pivot', timings, peaks):
+        accumulator = CountyMetricAccumulator()
+        for sheet in sheets:
+            accumulator.add_counties(sheet['counties'])
+            accumulator.add_metrics(sheet['metrics'])
+            accumulator.add_records(sheet['record_counties'], sheet['record_metrics'], sheet['record_values'])
+        result_df = accumulator.to_frame()
+
+    with _stage('write', timings, peaks):
+        write_excel(result_df, output_file, index=False)
+
+    return result_df, timings, peaks, used_reader
+
+
+def scenario_workbook(name, params, work_dir):
+    """返回场景对应的合成工作簿路径，不存在时生成；文件名包含参数哈希，参数变化后自动重新生成"""
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()[:10]
+    path = os.path.join(work_dir, f"bench_{name}_{digest}.xlsx")
+    if not os.path.exists(path):
+        generate_workbook(path, **params)
+    return path
+
+
+def run_scenario(name, params, work_dir, repeat=3, reader='auto'):
+    """运行一个场景: 各阶段取 repeat 次的中位数耗时，另外单独运行一次测量内存峰值"""
+    input_file = scenario_workbook(name, params, work_dir)
+    output_file = os.path.join(work_dir, f"bench_{name}_output.xlsx")
+
+    runs = []
+    for _ in range(repeat):
+        result_df, timings, _, used_reader = run_pipeline(input_file, output_file, reader)
+        runs.append(timings)
+
+    # tracemalloc 会明显拖慢执行，内存峰值单独测量，不影响计时
+    tracemalloc.start()
+    try:
+        _, _, peaks, _ = run_pipeline(input_file, output_file, reader)
+    finally:
+        tracemalloc.stop()
+
+    # 完整调用 process_excel_data 的耗时，包含日志输出等阶段之外的开销
+    start = time.perf_counter()
+    process_excel_data(input_file, output_file, reader=reader)
+    end_to_end = time.perf_counter() - start
+
+    stages = {
+        stage: {
+            'seconds': round(statistics.median(run[stage] for run in runs), 4),
+            'peak_kb': round(peaks[stage], 1),
+        }
+        for stage in STAGES
+    }
+    return {
+        'params': params,
+        'reader': used_reader,
+        'file_kb': round(os.path.getsize(input_file) / 1024, 1),
+        'counties': len(result_df),
+        'metrics': len(result_df.columns) - 1,
+        'stages': stages,
+        'total_seconds': round(sum(stage['seconds'] for stage in stages.values()), 4),
+        'end_to_end_seconds': round(end_to_end, 4),
+    }
+
+
+def run_benchmarks(scenario_names=DEFAULT_SCENARIOS, repeat=3, work_dir=None, reader='auto'):
+    """运行选定的场景，返回可JSON序列化的结果；reader 为Excel读取引擎"""
+    work_dir = work_dir or os.path.join(tempfile.gettempdir(), 'excel_benchmarks')
+    os.makedirs(work_dir, exist_ok=True)
+
+    results = {
+        'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'readers': available_readers(),
+        'scenarios': {},
+    }
+    for name in scenario_names:
+        print(f"运行场景: {name} {SCENARIOS[name]}")
+        scenario = run_scenario(name, SCENARIOS[name], work_dir, repeat=repeat, reader=reader)
+        results['scenarios'][name] = scenario
+        print(f"  {scenario['counties']} 个县域，{scenario['metrics']} 个指标，读取引擎 {scenario['reader']}，"
+              f"合计 {scenario['total_seconds']} 秒（端到端 {scenario['end_to_end_seconds']} 秒）")
+        for stage, measured in scenario['stages'].items():
+            print(f"    {stage:<8} {measured['seconds']:>8.4f} 秒  峰值 {measured['peak_kb']:>10.1f} KB")
+    return results
+
+
+def compare_with_baseline(results, baseline, threshold=0.2):
+    """
+    与基线比较每个场景每个阶段的耗时和内存峰值
+
+    参数:
+    threshold: 允许的相对增长比例，例如0.2表示比基线慢（或多占用内存）20%以上视为退化
+
+    返回: 退化项列表，每项为 {'scenario', 'stage', 'metric', 'baseline', 'current', 'ratio'}
+    """
+    regressions = []
+    for name, scenario in results['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name)
+        # 场景参数或读取引擎不同时结果不可比
+        if base is None or base.get('params') != scenario['params'] or base.get('reader', 'openpyxl') != scenario['reader']:
+            continue
+        for stage, current in scenario['stages'].items():
+            previous = base['stages'].get(stage)
+            if previous is None:
+                continue
+            for metric, min_delta in (('seconds', MIN_SECONDS_DELTA), ('peak_kb', MIN_PEAK_KB_DELTA)):
+                old, new = previous[metric], current[metric]
+                if new > old * (1 + threshold) and new - old > min_delta:
+                    regressions.append({
+                        'scenario': name,
+                        'stage': stage,
+                        'metric': metric,
+                        'baseline': old,
+                        'current': new,
+                        'ratio': round(new / old, 2) if old else None,
+                    })
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='用合成工作簿测试处理流程各阶段的耗时和内存峰值')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help=f"要运行的场景，可重复指定（默认: {', '.join(DEFAULT_SCENARIOS)}）")
+    parser.add_argument('--repeat', type=int, default=3, help='每个场景的重复次数，取中位数（默认: 3）')
+    parser.add_argument('--output', default='benchmark_results.json', help='结果文件（默认: benchmark_results.json）')
+    parser.add_argument('--baseline', default='benchmark_baseline.json', help='基线文件（默认: benchmark_baseline.json）')
+    parser.add_argument('--threshold', type=float, default=0.2, help='判定退化的相对增长比例（默认: 0.2）')
+    parser.add_argument('--save-baseline', action='store_true', help='把本次结果保存为新的基线')
+    parser.add_argument('--reader', choices=('auto',) + tuple(READERS), default='auto',
+                        help='Excel读取引擎（默认: auto）；与基线使用的引擎不同时不做比较')
+    parser.add_argument('--work-dir', default=None, help='合成工作簿的存放目录（默认: 系统临时目录）')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.scenario or DEFAULT_SCENARIOS, repeat=args.repeat, work_dir=args.work_dir,
+                             reader=args.reader)
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, threshold=args.threshold)
+        results['baseline'] = {'file': args.baseline, 'threshold': args.threshold, 'regressions': regressions}
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存到: {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"基线已保存到: {args.baseline}")
+        return 0
+
+    if regressions:
+        print(f"\n发现 {len(regressions)} 项性能退化（阈值 {args.threshold:.0%}）:")
+        for item in regressions:
+            print(f"  [{item['scenario']}] {item['stage']} {item['metric']}: {item['baseline']} → {item['current']}（×{item['ratio']}）")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,43 +1,334 @@
-import pandas as pd
+import re
 import os
+import sys
+import json
+import html
+import time
+import argparse
+from workbook_loader import open_workbook, _convert_cell
+from layout_rules import default_rules
+
+# 处理耗时估算: vectorized 引擎每秒处理的单元格数（行数×列数）以及每个工作表的固定开销（秒），
+# 由 benchmark.py 的合成工作簿在参考机器上测得
+CELLS_PER_SECOND = 150000
+SECONDS_PER_SHEET = 0.01
+
+# xlsx 原始XML中指定列的单元格（{columns} 为列字母的候选，如 A），以及任意单元格、行、取值和文本；
+# {p} 为工作表元素的命名空间前缀（如 OpenXML SDK 写出的 x:，通常为空），按工作表检测后代入
+_COLUMN_CELL = rb'<{p}c\b(?P<attrs>[^>]*?\br="(?P<column>{columns})(?P<row>\d+)"[^>]*?)(?:/>|>(?P<body>.*?)</{p}c>)'
+# 单元格的 r 属性都写在最前面时（绝大多数写出程序如此）使用的快速版本
+_COLUMN_CELL_FAST = rb'<{p}c r="(?P<column>{columns})(?P<row>\d+)"(?P<attrs>[^>]*?)(?:/>|>(?P<body>.*?)</{p}c>)'
+_ANY_CELL = rb'<{p}c\b([^>]*?\br="([A-Z]+)\d+"[^>]*?)(?:/>|>(.*?)</{p}c>)'
+_LAST_ROW = rb'<{p}row\b[^>]*?\br="(\d+)"'
+_ELEMENT_PREFIX = re.compile(rb'<(\w+:)?sheetData\b')
+_CELL_TYPE = re.compile(rb'\bt="(\w+)"')
+_VALUE = re.compile(rb'<(?:\w+:)?v>(.*?)</(?:\w+:)?v>', re.S)
+_TEXT = re.compile(rb'<(?:\w+:)?t\b[^>]*>(.*?)</(?:\w+:)?t>', re.S)
+_DIMENSION = re.compile(rb'<(?:\w+:)?dimension\b[^>]*\bref="[A-Z]*\d*:?([A-Z]+)\d+"')
+
+
+def probe_workbook(source, reader=None, rules=None):
+    """
+    快速探查工作簿结构，不完整解析工作表
+
+    xlsx 文件直接扫描工作表XML中指标列（默认规则下为A列）的单元格，只对表头候选行读取整行，
+    按与提取引擎相同的版式规则定位表格区域、县域表头和行范围；其他格式退回到逐行解析。同时估算处理规模和耗时，
+    上传流程可以据此在几毫秒内拒绝过大或无法识别的工作簿，而不必先占用一个处理进程
+
+    参数:
+    source: Excel文件路径、二进制文件对象或已打开的 ExcelWorkbook
+    reader: Excel读取引擎，见 workbook_loader.open_workbook（只影响非xlsx文件的逐行解析）
+    rules: 版式规则（layout_rules.RuleBook），None 表示使用默认规则
+
+    返回: {'sheets': [...], 'totals': {...}, 'estimate': {...}, 'issues': [...], 'ok': bool, 'method', 'probe_seconds'}；
+    行号均为Excel中的行号（从1开始，第1行为列名行，不参与识别）
+    """
+    started = time.perf_counter()
+    rules = default_rules() if rules is None else rules
+    workbook = open_workbook(source, reader=reader)
+    try:
+        sheets = []
+        method = 'xml'
+        for sheet_name in workbook.sheet_names:
+            raw = workbook.sheet_xml(sheet_name)
+            if raw is None:
+                method = 'parsed'
+                sheets.append(_probe_parsed_sheet(workbook, sheet_name, rules))
+            else:
+                sheets.append(_probe_xml_sheet(sheet_name, *raw, rules))
+    finally:
+        # 只关闭由本函数打开的工作簿，调用方传入的工作簿由调用方负责
+        if workbook is not source:
+            workbook.close()
+
+    counties = set()
+    metrics = set()
+    for sheet in sheets:
+        for table in sheet['tables']:
+            counties.update(table['counties'])
+        metrics.update(sheet.pop('metric_names'))
+    totals = {
+        'sheets': len(sheets),
+        'tables': sum(len(sheet['tables']) for sheet in sheets),
+        'counties': len(counties),
+        'metrics': len(metrics),
+        'rows': sum(sheet['rows'] for sheet in sheets),
+        'cells': sum(sheet['cells'] for sheet in sheets),
+        'records_max': sum(len(table['counties']) * table['metric_rows'] for sheet in sheets for table in sheet['tables']),
+    }
+
+    issues = [f"工作表 '{sheet['name']}': {issue}" for sheet in sheets for issue in sheet['issues']]
+    if not totals['tables']:
+        issues.append("没有找到符合版式规则的表头行（如'指标|单位'），工作簿格式无法识别")
+    elif not totals['counties']:
+        issues.append('表头行中没有县域名称')
+
+    return {
+        'method': method,
+        'sheets': sheets,
+        'totals': totals,
+        'estimate': {
+            'seconds': round(totals['cells'] / CELLS_PER_SECOND + totals['sheets'] * SECONDS_PER_SHEET, 3),
+            'result_cells': totals['counties'] * totals['metrics'],
+        },
+        'issues': issues,
+        'ok': bool(totals['tables'] and totals['counties']),
+        'probe_seconds': round(time.perf_counter() - started, 4),
+    }
+
+
+def _probe_xml_sheet(sheet_name, xml, shared_strings, rules):
+    """扫描xlsx工作表XML中指标列的单元格；指标列为表头标记的行再读取整行，检查单位列和县域名称"""
+    label_columns = sorted({rule.label_column for rule in rules})
+    header_labels = set().union(*(rule.header_labels for rule in rules))
+    prefix = _element_prefix(xml)
+    fast = xml.count(b'<' + prefix + b'c ') == xml.count(b'<' + prefix + b'c r="')
+    pattern = _pattern(_COLUMN_CELL_FAST if fast else _COLUMN_CELL, prefix, tuple(label_columns))
+
+    cells = {}
+    positions = {}
+    for match in pattern.finditer(xml):
+        attrs, column, row, body = match.group('attrs', 'column', 'row', 'body')
+        value = _xml_cell_value(attrs, body, shared_strings)
+        if value is not None:
+            row = int(row)
+            cells.setdefault(row, {})[_column_index(column)] = value
+            positions.setdefault(row, match.start())
+
+    columns = []
+    for row in sorted(cells):
+        values = cells[row]
+        if any(str(value).strip() in header_labels for value in values.values()):
+            row_values = _xml_row_values(xml, positions[row], shared_strings, 0, prefix)
+            values = {index: value for index, value in enumerate(row_values) if value is not None}
+        columns.append((row, values))
+
+    last = _pattern(_LAST_ROW, prefix).match(xml, max(xml.rfind(b'<' + prefix + b'row '), 0))
+    last_row = int(last.group(1)) if last else 0
+    dimension = _DIMENSION.search(xml[:2048])
+    width = _column_index(dimension.group(1)) + 1 if dimension else 0
+
+    def header_row(row, first):
+        return _xml_row_values(xml, positions[row], shared_strings, first, prefix)
+
+    sheet = _classify_rows(sheet_name, columns, header_row, last_row, rules)
+    sheet['cols'] = max(width, sheet['cols'])
+    sheet['cells'] = sheet['rows'] * sheet['cols']
+    return sheet
+
+
+_patterns = {}
+
+
+def _pattern(template, prefix, columns=()):
+    """
+    编译XML正则表达式模板，按模板、命名空间前缀和列组合缓存
+
+    参数:
+    template: _COLUMN_CELL 等模板
+    prefix: 工作表元素的命名空间前缀，见 _element_prefix
+    columns: 只匹配这些列（从0开始的列号）的单元格，用于含 {columns} 的模板
+    """
+    key = (template, prefix, columns)
+    if key not in _patterns:
+        letters = b'|'.join(_column_letters(index).encode('ascii') for index in columns)
+        _patterns[key] = re.compile(template.replace(b'{p}', prefix).replace(b'{columns}', letters), re.S)
+    return _patterns[key]
+
+
+def _element_prefix(xml):
+    """工作表XML中元素的命名空间前缀（如 b'x:'），默认命名空间（绝大多数写出程序）为 b''"""
+    match = _ELEMENT_PREFIX.search(xml)
+    return (match.group(1) or b'') if match else b''
+
+
+def _probe_parsed_sheet(workbook, sheet_name, rules):
+    """非xlsx文件: 逐行解析工作表，规则与 _probe_xml_sheet 相同"""
+    rows = {}
+    columns = []
+    wanted = rules.columns
+    for index, row in enumerate(workbook.sheet_rows(sheet_name)):
+        # 第1行为列名行，数据从第2行开始
+        rows[index + 2] = row
+        values = {column: row[column] for column in wanted if column < len(row) and row[column] is not None}
+        if values:
+            columns.append((index + 2, values))
+    sheet = _classify_rows(sheet_name, columns, lambda row, first: rows[row][first:], len(rows) + 1, rules)
+    shape = workbook.sheet_shapes.get(sheet_name)
+    if shape is not None:
+        sheet['rows'], sheet['cols'] = shape[0] + 1, max(shape[1], sheet['cols'])
+    sheet['cells'] = sheet['rows'] * sheet['cols']
+    return sheet
+
+
+def _classify_rows(sheet_name, columns, header_values, last_row, rules):
+    """
+    按 data_processor 的版式规则识别表头行和指标行
+
+    参数:
+    columns: [(行号, {列号: 值})]，按行号排序，只包含版式规则用到的列
+    header_values: header_values(行号, 起始列号) 返回表头行从起始列起的单元格值
+    last_row: 工作表最后一行的行号
+    rules: 版式规则（layout_rules.RuleBook）
+    """
+    tables = []
+    metric_names = set()
+    layout = None
+    cols = 0
+    width = max(rules.columns) + 1
+    for row, cells in columns:
+        if row == 1:
+            continue
+        values = [cells.get(index) for index in range(width)]
+        # 每一行都按全部规则集识别表头，各表格区域按其表头的规则集识别指标行
+        rule = rules.match_row(values)
+        if rule is not None:
+            layout = rule
+            counties = [name for name in (str(v).strip() for v in header_values(row, rule.first_county_column)
+                                          if v is not None) if name]
+            tables.append({'header_row': row, 'first_row': row + 1, 'last_row': last_row, 'layout': rule.name,
+                           'counties': counties, 'metric_rows': 0})
+            cols = max(cols, len(counties) + rule.first_county_column)
+            if len(tables) > 1:
+                tables[-2]['last_row'] = row - 1
+            continue
+        if layout is None or cells.get(layout.label_column) is None:
+            continue
+        metric = str(cells[layout.label_column]).strip()
+        if metric and not layout.is_ignored(metric):
+            tables[-1]['metric_rows'] += 1
+            metric_names.add(metric)
+
+    issues = []
+    for table in tables:
+        if not table['counties']:
+            issues.append(f"第{table['header_row']}行的表头没有县域名称")
+        elif len(set(table['counties'])) < len(table['counties']):
+            issues.append(f"第{table['header_row']}行的表头有重复的县域名称")
+        if not table['metric_rows']:
+            issues.append(f"第{table['header_row']}行的表格没有指标行")
+
+    return {
+        'name': sheet_name,
+        'layout': tables[0]['layout'] if tables else None,
+        'rows': last_row,
+        'cols': cols,
+        'tables': tables,
+        'issues': issues,
+        'metric_names': metric_names,
+    }
+
+
+def _xml_row_values(xml, position, shared_strings, first, prefix=b''):
+    """读取 position 处单元格所在行中第 first 列起的单元格值（按列位置，空单元格为None）"""
+    start = xml.rfind(b'<' + prefix + b'row', 0, position)
+    end = xml.find(b'</' + prefix + b'row>', position)
+    values = {}
+    for cell in _pattern(_ANY_CELL, prefix).finditer(xml, start, end if end != -1 else len(xml)):
+        attrs, column, body = cell.groups()
+        index = _column_index(column)
+        if index >= first:
+            values[index] = _xml_cell_value(attrs, body, shared_strings)
+    return [values.get(index) for index in range(first, max(values, default=first - 1) + 1)]
+
+
+def _xml_cell_value(attrs, body, shared_strings):
+    """把单元格XML转换为与 pd.read_excel 相同规则的取值（缺失值为None）"""
+    if not body:
+        return None
+    kind = _CELL_TYPE.search(attrs)
+    kind = kind.group(1) if kind else b'n'
+    if kind == b'inlineStr':
+        return _convert_cell(html.unescape(b''.join(_TEXT.findall(body)).decode('utf-8')))
+    value = _VALUE.search(body)
+    if value is None:
+        return None
+    text = html.unescape(value.group(1).decode('utf-8'))
+    if kind == b's':
+        return _convert_cell(str(shared_strings[int(text)]))
+    if kind in (b'str', b'e'):
+        return _convert_cell(text)
+    if kind == b'b':
+        return text == '1'
+    try:
+        return _convert_cell(float(text))
+    except ValueError:
+        return _convert_cell(text)
+
+
+def _column_index(letters):
+    """列字母转换为从0开始的列号，例如 b'A' → 0，b'AB' → 27"""
+    index = 0
+    for letter in letters.decode('ascii') if isinstance(letters, bytes) else letters:
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+
+def _column_letters(index):
+    """从0开始的列号转换为列字母，例如 0 → 'A'，27 → 'AB'"""
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
 
 # 检查Excel文件结构
 def check_excel_structure(file_path):
-    print(f"检查文件: {file_path}")
-    
-    # 读取所有工作表
-    excel_file = pd.ExcelFile(file_path)
-    print(f"工作表数量: {len(excel_file.sheet_names)}")
-    print(f"工作表名称: {excel_file.sheet_names}")
-    
-    for sheet_name in excel_file.sheet_names:
-        print(f"\n检查工作表: {sheet_name}")
-        df = pd.read_excel(file_path, sheet_name=sheet_name)
-        print(f"工作表形状: {df.shape}")
-        print(f"列数: {df.shape[1]}")
-        print(f"行数: {df.shape[0]}")
-        
-        # 查找所有包含'指标'的行
-        print("\n包含'指标'的行:")
-        for i in range(min(100, len(df))):  # 只检查前100行
-            if pd.notna(df.iloc[i, 0]):
-                cell_value = str(df.iloc[i, 0]).strip()
-                if '指标' in cell_value:
-                    print(f"第{i+1}行, A列值: '{cell_value}'")
-                    # 打印该行的所有列值
-                    print(f"该行所有值: {[str(df.iloc[i, j]).strip() if pd.notna(df.iloc[i, j]) else 'NaN' for j in range(min(10, len(df.columns)))]}")
-        
-        # 查看前20行数据结构
-        print("\n前20行数据:")
-        print(df.head(20).to_string(max_rows=20, max_cols=10))
-        
-        # 查看工作表末尾20行
-        print("\n末尾20行数据:")
-        print(df.tail(20).to_string(max_rows=20, max_cols=10))
+    probe = probe_workbook(file_path)
+    totals = probe['totals']
+    print(f"检查文件: {file_path}（{probe['method']}，耗时 {probe['probe_seconds']} 秒）")
+    print(f"工作表数量: {totals['sheets']}，表格区域: {totals['tables']}，县域: {totals['counties']}，指标: {totals['metrics']}")
+    print(f"规模: {totals['rows']} 行，{totals['cells']} 个单元格，最多 {totals['records_max']} 个数据点；"
+          f"预计处理 {probe['estimate']['seconds']} 秒")
+
+    for sheet in probe['sheets']:
+        layout = f"，版式: {sheet['layout']}" if sheet['layout'] else ''
+        print(f"\n工作表: {sheet['name']}（{sheet['rows']} 行 × {sheet['cols']} 列{layout}）")
+        for table in sheet['tables']:
+            counties = table['counties']
+            preview = '、'.join(counties[:5]) + ('…' if len(counties) > 5 else '')
+            print(f"  第{table['header_row']}行表头，数据行 {table['first_row']}-{table['last_row']}，"
+                  f"{table['metric_rows']} 个指标行，{len(counties)} 个县域: {preview}")
+
+    if probe['issues']:
+        print("\n问题:")
+        for issue in probe['issues']:
+            print(f"  {issue}")
+    return probe
+
 
 if __name__ == "__main__":
-    file_path = r"F:\桌面\海南省.xls"
-    if os.path.exists(file_path):
-        check_excel_structure(file_path)
+    parser = argparse.ArgumentParser(description='快速探查Excel工作簿的表格区域、县域表头和处理规模')
+    parser.add_argument('file_path', nargs='?', default=r"F:\桌面\海南省.xls", help='Excel文件')
+    parser.add_argument('--json', action='store_true', help='以JSON格式输出探查结果')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.file_path):
+        print(f"错误: 文件不存在 - {args.file_path}")
+        sys.exit(1)
+    if args.json:
+        print(json.dumps(probe_workbook(args.file_path), ensure_ascii=False, indent=2))
     else:
-        print(f"错误: 文件不存在 - {file_path}")
\ No newline at end of file
+        check_excel_structure(args.file_path)
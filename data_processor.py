@@ -1,165 +1,664 @@
 import pandas as pd
 import numpy as np
-import os
-from tqdm import tqdm
+import io
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from workbook_loader import open_workbook
+from accumulator import CountyMetricAccumulator
+from instrumentation import new_stats, timed
+from layout_rules import default_rules
 
-def process_excel_data(input_file, output_file):
+logger = logging.getLogger(__name__)
+
+# 可选的提取引擎：vectorized 为默认的向量化引擎，stream 为逐行流式读取的恒定内存模式，
+# loop 为逐单元格扫描的参考实现
+ENGINES = ('vectorized', 'stream', 'loop')
+
+# 引擎版本：提取规则或结果格式发生变化时递增，使按内容缓存的旧结果失效
+ENGINE_VERSION = '3'
+
+# 长表格式（iter_records）每条记录的字段: 县域、指标、单位、取值、工作表名称
+RECORD_FIELDS = ('county', 'metric', 'unit', 'value', 'sheet')
+
+
+def cache_salt(engine):
+    """按内容缓存提取结果时附加的版本信息: 引擎、引擎版本和当前版式规则的签名"""
+    return f"{engine}|{ENGINE_VERSION}|{default_rules().signature}"
+
+
+def extract_county_data(input_file, engine='vectorized', progress=None, sheet_workers=1, stats=None,
+                        sheet_cache=None, reader=None):
     """
-    处理Excel数据，将多个表格整合为一个标准格式，确保县域名称在A列，指标在第一行
-    支持识别工作表中的所有表格区域，包括后续表格中的县域名称
-    
+    从Excel工作簿中提取所有表格区域，返回 县域 × 指标 的结果表，不写任何文件
+    （写出结果由 output_writers 中的输出函数负责）
+
     参数:
-    input_file: 输入Excel文件路径
-    output_file: 输出Excel文件路径
+    input_file: 输入Excel文件路径、二进制文件对象，或已打开的 ExcelWorkbook
+    engine: 提取引擎，'vectorized'（默认）、'stream'（逐行流式读取，不持有整个工作表）
+            或 'loop'（逐单元格扫描的参考实现，与 vectorized 输出一致）
+    progress: 可选的进度回调 progress(已完成工作表数, 工作表总数, 工作表名称)，每处理完一个工作表调用一次
+    sheet_workers: 并行提取工作表的进程数，默认1（顺序执行）；仅 vectorized 和 stream 引擎支持，
+                   并行与顺序执行的结果完全一致
+    stats: 可选的统计记录（instrumentation.new_stats），填入各阶段耗时、扫描的行数/单元格数、
+           表格区域数等；并行提取时各阶段耗时为所有工作进程的累计值
+    sheet_cache: 可选的工作表级缓存（sheet_cache.SheetCache），用于增量处理修订后的工作簿：
+                 内容指纹未变的工作表直接复用上次的提取结果，只重新提取变化的工作表；
+                 仅 vectorized 和 stream 引擎支持，结果与完整处理完全一致
+    reader: Excel读取引擎（workbook_loader.READERS 或 'auto'），None 表示使用默认设置；
+            传入已打开的 ExcelWorkbook 时不起作用
+
+    返回: 结果DataFrame，第一列为'县域'（按原始顺序），其余列为排序后的指标；
+    出错时直接抛出异常
     """
+    logger.info("开始处理文件: %s", input_file)
+
+    if engine not in ENGINES:
+        raise ValueError(f"不支持的提取引擎: {engine}，可选: {', '.join(ENGINES)}")
+    if stats is None:
+        stats = new_stats(engine)
+    stats['engine'] = engine
+
+    # 尝试读取Excel文件（支持xlsx和xls格式）
     try:
-        print(f"开始处理文件: {input_file}")
-        
-        # 尝试读取Excel文件（支持xlsx和xls格式）
-        try:
-            excel_file = pd.ExcelFile(input_file)
-            print(f"成功读取Excel文件，找到 {len(excel_file.sheet_names)} 个工作表")
-        except Exception as e:
-            print(f"读取Excel文件失败: {e}")
-            raise
-        
-        # 存储所有数据的字典
-        all_county_data = {}
-        all_metrics = set()
-        # 保存县域名称的原始顺序
-        original_county_order = []
-        total_tables = 0
-        
-        # 处理每个工作表
-        for sheet_name in excel_file.sheet_names:
-            print(f"\n处理工作表: {sheet_name}")
-            # 读取当前工作表
-            df = pd.read_excel(input_file, sheet_name=sheet_name)
-            print(f"工作表 '{sheet_name}' 形状: {df.shape}")
-            
-            # 首先找到所有表格的起始行
-            table_starts = []
-            for i in range(len(df)):
-                # 安全检查列是否存在
-                if len(df.columns) > 0 and pd.notna(df.iloc[i, 0]):
-                    cell_value = str(df.iloc[i, 0]).strip()
-                    # 检查是否为表格标题行
-                    if cell_value == '指标':
-                        # 检查B列是否为'单位'，确保是有效的表格头
-                        if len(df.columns) > 1 and pd.notna(df.iloc[i, 1]) and str(df.iloc[i, 1]).strip() == '单位':
-                            table_starts.append(i)
-                            print(f"  发现表格起始行: 第{i+1}行")
-            
-            total_tables += len(table_starts)
-            print(f"工作表 '{sheet_name}' 中发现 {len(table_starts)} 个表格区域")
-            
-            # 处理每个表格区域
-            for start_row in table_starts:
-                print(f"  处理表格区域，起始行: {start_row + 1}")
-                
-                # 提取县域名称（从C列开始的表头）
-                county_names = []
-                for j in range(2, len(df.columns)):  # 从第三列开始
-                    if pd.notna(df.iloc[start_row, j]):
-                        # 保留原始格式（包括可能的换行符）
-                        county_name = str(df.iloc[start_row, j]).strip()
-                        if county_name:  # 确保不为空字符串
-                            county_names.append(county_name)
-                            # 初始化该县域的数据字典
-                            if county_name not in all_county_data:
-                                all_county_data[county_name] = {}
-                                # 保留原始顺序
-                                if county_name not in original_county_order:
-                                    original_county_order.append(county_name)
-                                print(f"    添加新县域: '{county_name}'")
-                
-                print(f"  从该表格区域识别到 {len(county_names)} 个县域: {county_names}")
-                
-                # 处理当前表格的数据行
-                i = start_row + 1  # 从表头的下一行开始
-                
-                # 找到下一个表格的起始位置作为当前表格的结束
-                next_table_start = None
-                for next_start in table_starts:
-                    if next_start > start_row:
-                        next_table_start = next_start
-                        break
-                
-                # 确定当前表格的结束行
-                end_row = next_table_start if next_table_start is not None else len(df)
-                print(f"  当前表格处理范围: 行 {i+1} 到行 {end_row}")
-                
-                # 读取指标数据，直到遇到下一个表格开始或工作表结束
-                processed_rows = 0
-                while i < end_row:
-                    # 确保当前行有数据再处理
-                    if len(df.columns) > 0 and pd.notna(df.iloc[i, 0]):
-                        cell_value = str(df.iloc[i, 0]).strip()
-                        # 指标处理
-                        metric = cell_value
-                        # 跳过分类行（如"一、基本情况"等）
-                        if metric and not any(metric.startswith(prefix) for prefix in ['一、', '二、', '三、', '四、', '五、', '六、', '七、', '八、']):
-                            all_metrics.add(metric)
-                            # 读取每个县域的数据
-                            for j, county_name in enumerate(county_names):
-                                data_col = j + 2  # 数据从第三列开始
-                                if data_col < len(df.columns) and pd.notna(df.iloc[i, data_col]):
-                                    # 确保数据类型正确
-                                    data_value = df.iloc[i, data_col]
-                                    all_county_data[county_name][metric] = data_value
-                        processed_rows += 1
-                    i += 1
-                print(f"  表格区域处理完成，共处理 {processed_rows} 行数据")
-        
-        # 输出总统计信息
-        print(f"\n=== 总统计 ===")
-        print(f"- 总共处理 {total_tables} 个表格区域")
-        print(f"- 识别到 {len(all_county_data)} 个县域")
-        print(f"- 识别到 {len(all_metrics)} 个指标")
-        print(f"- 县域列表: {original_county_order}")
-        
-        # 创建新的数据框，注意转置结构
-        print("开始构建新的数据框...")
-        metrics_list = sorted(list(all_metrics))
-        
-        # 创建数据，让县域作为行，指标作为列
-        data = []
-        for county in original_county_order:  # 使用原始顺序
-            row_data = [county]  # 县域名称作为第一列数据
-            for metric in metrics_list:
-                row_data.append(all_county_data[county].get(metric, np.nan))
-            data.append(row_data)
-        
-        # 创建列名：第一列为'县域'，其余为指标名
-        columns = ['县域'] + metrics_list
-        
-        # 创建DataFrame
-        result_df = pd.DataFrame(data, columns=columns)
-        
-        # 保存结果，不包含默认索引
-        print(f"保存结果到: {output_file}")
-        result_df.to_excel(output_file, index=False)
-        
-        print("数据处理完成!")
-        print(f"共处理 {len(all_county_data)} 个县域")
-        print(f"共提取 {len(metrics_list)} 个唯一指标")
-        print(f"县域名称按原始顺序排列在A列")
-        
-        return result_df
-    
+        with timed(stats['stages'], 'load'):
+            workbook = open_workbook(input_file, reader=reader)
+        logger.debug("成功读取Excel文件（%s），找到 %d 个工作表", workbook.reader, len(workbook.sheet_names))
     except Exception as e:
-        print(f"处理过程中出现错误: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.error("读取Excel文件失败: %s", e)
+        raise
+
+    try:
+        if engine == 'loop':
+            result_df = _process_with_loop(workbook, progress, stats)
+        else:
+            result_df = _process_by_sheet(workbook, engine, progress, sheet_workers, stats, sheet_cache)
+    finally:
+        # 只关闭由本函数打开的工作簿，调用方传入的工作簿由调用方负责
+        if workbook is not input_file:
+            workbook.close()
+
+    stats['sheets'] = len(workbook.sheet_names)
+    if stats['sheets_reused']:
+        logger.info("增量处理: %d 个工作表内容未变，复用上次的提取结果", stats['sheets_reused'])
+    stats['counties'] = len(result_df)
+    stats['metrics'] = len(result_df.columns) - 1
+    logger.info("提取完成: %d 个表格区域，%d 个县域，%d 个指标",
+                stats['regions'], stats['counties'], stats['metrics'])
+    logger.debug("县域列表: %s", result_df['县域'].tolist())
+
+    return result_df
+
+
+def iter_records(input_file, reader=None, rules=None, progress=None):
+    """
+    以长表格式逐条产出工作簿中的数据点 (县域, 指标, 单位, 取值, 工作表名称)，字段名见 RECORD_FIELDS
+
+    数据点直接来自逐行的区域扫描（与 stream 引擎相同，取值与结果表一致），不构建 县域 × 指标 的结果表，
+    每读完一个工作表即产出该表的数据点；同一 (县域, 指标) 出现多次时按出现顺序全部产出
+    （结果表中保留最后一次的取值）。单位取自指标行中版式规则的 unit_column 列，没有时为None
+
+    参数:
+    input_file: 输入Excel文件路径、二进制文件对象，或已打开的 ExcelWorkbook
+    reader: Excel读取引擎，见 extract_county_data；只有 openpyxl 读取的 xlsx 逐行读取，
+            其他引擎每次解析一个工作表
+    rules: 版式规则（layout_rules.RuleBook），None 表示使用默认规则
+    progress: 可选的进度回调 progress(已完成工作表数, 工作表总数, 工作表名称)，每处理完一个工作表调用一次
+
+    返回: 生成器，每项为 (county, metric, unit, value, sheet) 元组
+    """
+    workbook = open_workbook(input_file, reader=reader)
+    try:
+        total = len(workbook.sheet_names)
+        for done, sheet_name in enumerate(workbook.sheet_names, 1):
+            rows = workbook.sheet_rows(sheet_name)
+            for county, metric, unit, value in _iter_row_records(rows, rules, rows.column_types):
+                yield county, metric, unit, value, sheet_name
+            if progress is not None:
+                progress(done, total, sheet_name)
+    finally:
+        # 只关闭由本函数打开的工作簿，调用方传入的工作簿由调用方负责
+        if workbook is not input_file:
+            workbook.close()
+
+
+def _process_by_sheet(workbook, engine, progress=None, sheet_workers=1, stats=None, sheet_cache=None):
+    """
+    向量化/流式提取引擎：逐个工作表提取出该表的县域、指标和非空数据点，
+    再按工作表顺序并入紧凑累加器（accumulator.CountyMetricAccumulator），最后一次性生成 县域 × 指标 的结果表
+
+    - vectorized: 用整列掩码定位表头和指标行，按位置切片每个表格区域
+    - stream: 逐行读取工作表，实时识别表头行，任何时刻都不持有整个工作表，
+      内存占用只与结果中的非空数据点数量有关。pd.read_excel 按整列推断的类型（数字文本、含空值的整数列等）
+      在读完工作表后按各列记录的推断依据换算（见 workbook_loader.ColumnTypes），结果与 vectorized 完全一致
+
+    sheet_workers 大于1时各工作表在独立的工作进程中并行提取，合并顺序不变，
+    因此县域顺序和重复指标的取值与顺序执行完全一致。提供 sheet_cache 时，
+    指纹命中的工作表复用缓存中的提取结果，同样按当前的工作表顺序合并
+
+    返回: result_df；各阶段耗时和扫描规模累加到 stats 中
+    """
+    if stats is None:
+        stats = new_stats(engine)
+
+    # 每个工作表的提取结果只取决于该表的内容，指纹命中的工作表不再读取
+    fingerprints = {}
+    reused = {}
+    if sheet_cache is not None:
+        with timed(stats['stages'], 'load'):
+            for sheet_name in workbook.sheet_names:
+                fingerprint = workbook.sheet_fingerprint(sheet_name, salt=cache_salt(engine))
+                fingerprints[sheet_name] = fingerprint
+                sheet = sheet_cache.get(fingerprint) if fingerprint else None
+                if sheet is not None:
+                    reused[sheet_name] = sheet
+    pending = [sheet_name for sheet_name in workbook.sheet_names if sheet_name not in reused]
+
+    if sheet_workers and sheet_workers > 1 and len(pending) > 1:
+        scanned = _scan_sheets_parallel(workbook, engine, sheet_workers, pending)
+    else:
+        scanned = ((sheet_name, _scan_workbook_sheet(workbook, sheet_name, engine)) for sheet_name in pending)
+    sheets = _merge_sheet_order(workbook.sheet_names, reused, scanned, fingerprints, sheet_cache)
+
+    accumulator = CountyMetricAccumulator()
+    for sheet_name, sheet in _track_sheets(workbook, sheets, progress):
+        workbook.sheet_shapes[sheet_name] = sheet['shape']
+        if sheet_name in reused:
+            # 复用的工作表没有被扫描，只计入表格区域数
+            stats['sheets_reused'] += 1
+            _add_sheet_stats(stats, None, sheet['tables'], {})
+        else:
+            _add_sheet_stats(stats, sheet['shape'], sheet['tables'], sheet['timings'])
+        logger.debug("工作表 '%s' 形状: %s，发现 %d 个表格区域%s", sheet_name, sheet['shape'], sheet['tables'],
+                     '（复用）' if sheet_name in reused else '')
+
+        # 按工作表顺序并入累加器，县域顺序和"后写入者优先"的规则与逐单元格扫描一致
+        with timed(stats['stages'], 'pivot'):
+            accumulator.add_counties(sheet['counties'])
+            accumulator.add_metrics(sheet['metrics'])
+            accumulator.add_records(sheet['record_counties'], sheet['record_metrics'], sheet['record_values'])
+
+    with timed(stats['stages'], 'pivot'):
+        return accumulator.to_frame()
+
+
+def _merge_sheet_order(sheet_names, reused, scanned, fingerprints, sheet_cache):
+    """按工作表顺序产出 (工作表名称, 提取结果)，交替取复用的结果和新提取的结果；新提取的结果写入缓存"""
+    scanned = iter(scanned)
+    for sheet_name in sheet_names:
+        if sheet_name in reused:
+            yield sheet_name, reused[sheet_name]
+            continue
+        _, sheet = next(scanned)
+        fingerprint = fingerprints.get(sheet_name)
+        if fingerprint:
+            sheet_cache.put(fingerprint, {key: value for key, value in sheet.items() if key != 'timings'})
+        yield sheet_name, sheet
+
+
+def _add_sheet_stats(stats, shape, tables, timings):
+    """把单个工作表的形状、表格区域数和各阶段耗时累加到统计记录"""
+    if shape is not None:
+        stats['rows_scanned'] += int(shape[0])
+        stats['cells_scanned'] += int(shape[0]) * int(shape[1])
+    stats['regions'] += tables
+    for stage, seconds in timings.items():
+        stats['stages'][stage] = stats['stages'].get(stage, 0.0) + seconds
+
+
+def _scan_workbook_sheet(workbook, sheet_name, engine):
+    """用指定引擎提取单个工作表，结果中附带该表的形状和各阶段耗时（stream 引擎边读边提取，耗时计入 extract）"""
+    timings = {}
+    if engine == 'stream':
+        with timed(timings, 'extract'):
+            rows = workbook.sheet_rows(sheet_name)
+            sheet = _scan_rows(rows, column_types=rows.column_types)
+    else:
+        with timed(timings, 'load'):
+            df = workbook.read_sheet(sheet_name)
+        with timed(timings, 'detect'):
+            regions = _detect_regions(df)
+        with timed(timings, 'extract'):
+            sheet = _extract_regions(df, regions)
+    sheet['shape'] = workbook.sheet_shapes.get(sheet_name)
+    sheet['timings'] = timings
+    return sheet
+
+
+# 并行提取时每个工作进程各自打开一次工作簿，供分配到该进程的所有工作表共用
+_worker_workbook = None
+
+
+def _init_sheet_worker(source, reader):
+    global _worker_workbook
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    _worker_workbook = open_workbook(source, reader=reader)
+
+
+def _scan_sheet_in_worker(sheet_name, engine):
+    return _scan_workbook_sheet(_worker_workbook, sheet_name, engine)
+
+
+def _scan_sheets_parallel(workbook, engine, sheet_workers, sheet_names=None):
+    """在进程池中并行提取各工作表（默认全部工作表），按工作表顺序产出 (工作表名称, 提取结果)"""
+    source = workbook.source
+    if hasattr(source, 'read'):
+        # 文件对象无法在进程间共享，改为把文件内容传给工作进程
+        source.seek(0)
+        source = source.read()
+
+    sheet_names = workbook.sheet_names if sheet_names is None else sheet_names
+    with ProcessPoolExecutor(max_workers=min(sheet_workers, len(sheet_names)),
+                             initializer=_init_sheet_worker, initargs=(source, workbook.reader)) as executor:
+        # map 按提交顺序返回结果，保证合并顺序与顺序执行一致
+        yield from zip(sheet_names, executor.map(_scan_sheet_in_worker, sheet_names,
+                                                 [engine] * len(sheet_names)))
+
+
+def _walk_rows(rows, rules=None):
+    """
+    按版式规则遍历工作表的行，产出表头行和指标行: (行号, 版式, 当前表格的县域列号, 指标, 行)，表头行的指标为None
+
+    行号从0开始，按 rows 中的位置计数；县域列号为表头行中县域名称非空的列。
+    rules 为版式规则（layout_rules.RuleBook），None 表示使用默认规则；
+    每一行都按全部规则集识别表头，遇到表头即按该表头的规则集开始新的表格区域，
+    同一工作表中的各表格区域可以使用不同的版式
+    """
+    rules = default_rules() if rules is None else rules
+    # 当前表格区域的版式规则，None 表示尚未遇到表头
+    layout = None
+    counties = None
+
+    for index, row in enumerate(rows):
+        if not row:
+            continue
+
+        # 表头行: 由版式规则识别，县域名称从 first_county_column 列开始
+        rule = rules.match_row(row)
+        if rule is not None:
+            layout = rule
+            counties = [column for column in range(layout.first_county_column, len(row))
+                        if row[column] is not None and str(row[column]).strip()]
+            yield index, layout, counties, None, row
+            continue
+        if layout is None or len(row) <= layout.label_column or row[layout.label_column] is None:
+            continue
+        metric = str(row[layout.label_column]).strip()
+
+        # 跳过空指标、分类行（如"一、基本情况"等）以及规则中需要跳过的行
+        if not metric or layout.is_ignored(metric):
+            continue
+        yield index, layout, counties, metric, row
+
+
+def _scan_rows(rows, rules=None, column_types=None, units=False):
+    """
+    流式扫描单个工作表的行，返回与 _scan_sheet 相同结构的提取结果，版式规则见 _walk_rows
+
+    column_types 为逐行读取时记录的各列类型推断依据（workbook_loader.ColumnTypes），读完工作表后
+    据此把县域表头、指标名称和数据点换算为整表读取（vectorized 引擎）的取值；None 表示 rows 中已经是最终取值。
+    units 为True时另外返回 'record_units': 各数据点所在指标行的单位（没有时为None）
+    """
+    # 保留下来的单元格（县域表头、指标名称、数据点）的行号、列号和取值，按出现顺序排列
+    cell_rows = []
+    cell_columns = []
+    cell_values = []
+    # 县域表头、指标名称和单位单元格在 cell_values 中的位置
+    header_cells = []
+    label_cells = []
+    unit_cells = []
+    # 数据点所属的县域和指标（表头和指标名称单元格的位置）以及取值的位置
+    record_counties = []
+    record_metrics = []
+    record_values = []
+    record_units = []
+    tables = 0
+    first_layout = None
+    slots = ()
+
+    for index, layout, counties, metric, row in _walk_rows(rows, rules):
+        if metric is None:
+            slots = range(len(cell_values), len(cell_values) + len(counties))
+            header_cells.extend(slots)
+            cell_rows.extend([index] * len(counties))
+            cell_columns.extend(counties)
+            cell_values.extend(row[column] for column in counties)
+            tables += 1
+            first_layout = first_layout or layout.name
+            continue
+        label = len(cell_values)
+        label_cells.append(label)
+        cell_rows.append(index)
+        cell_columns.append(layout.label_column)
+        cell_values.append(row[layout.label_column])
+        unit = None
+        if units and layout.unit_column is not None and len(row) > layout.unit_column \
+                and row[layout.unit_column] is not None:
+            unit = len(cell_values)
+            unit_cells.append(unit)
+            cell_rows.append(index)
+            cell_columns.append(layout.unit_column)
+            cell_values.append(row[layout.unit_column])
+        # 第k个县域的数据取自第 first_county_column + k 列
+        first = layout.first_county_column
+        for offset, (value, slot) in enumerate(zip(row[first:], slots)):
+            if value is not None:
+                record_counties.append(slot)
+                record_metrics.append(label)
+                record_values.append(len(cell_values))
+                if units:
+                    record_units.append(unit)
+                cell_rows.append(index)
+                cell_columns.append(first + offset)
+                cell_values.append(value)
+
+    if column_types is not None:
+        cell_values = _normalize_cells(column_types, cell_rows, cell_columns, cell_values)
+    names = {cell: str(cell_values[cell]).strip() for cell in header_cells + label_cells + unit_cells}
+
+    sheet = {
+        'tables': tables,
+        'layout': first_layout,
+        'counties': [names[cell] for cell in header_cells],
+        'metrics': list({names[cell] for cell in label_cells}),
+        'record_counties': _object_array([names[cell] for cell in record_counties]),
+        'record_metrics': _object_array([names[cell] for cell in record_metrics]),
+        'record_values': _object_array([cell_values[cell] for cell in record_values]),
+    }
+    if units:
+        sheet['record_units'] = _object_array([(names[unit] or None) if unit is not None else None
+                                               for unit in record_units])
+    return sheet
+
+
+def _normalize_cells(column_types, rows, columns, values):
+    """按整列的类型推断换算逐行读取时保留下来的单元格值（见 workbook_loader.ColumnTypes），返回新的取值列表"""
+    pending = {column for column in set(columns) if column_types.needs_conversion(column)}
+    if not pending:
+        return values
+    members = {}
+    for position, column in enumerate(columns):
+        if column in pending:
+            members.setdefault(column, []).append(position)
+    values = list(values)
+    for column, positions in members.items():
+        converted = column_types.convert(column, [rows[p] for p in positions], [values[p] for p in positions])
+        for position, value in zip(positions, converted):
+            values[position] = value
+    return values
+
+
+def _iter_row_records(rows, rules=None, column_types=None):
+    """
+    逐条产出单个工作表中的数据点 (县域, 指标, 单位, 取值)，顺序与 _scan_rows 的数据点一致
+
+    取值按整列推断的类型换算（见 _scan_rows），要读完工作表才能确定，因此每个工作表读完后才产出该表的数据点
+    """
+    sheet = _scan_rows(rows, rules, column_types, units=True)
+    yield from zip(sheet['record_counties'], sheet['record_metrics'], sheet['record_units'], sheet['record_values'])
+
+
+def _track_sheets(workbook, sheets, progress):
+    """逐个转发工作表，并在调用方处理完每个工作表后报告进度"""
+    total = len(workbook.sheet_names)
+    for done, (sheet_name, sheet) in enumerate(sheets, 1):
+        yield sheet_name, sheet
+        if progress is not None:
+            progress(done, total, sheet_name)
+
+
+def _object_array(values):
+    """把Python值列表转换为一维object数组（不会把序列类的值展开为多维）"""
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def _column_text(column):
+    """将一列单元格转换为去除首尾空白的文本，空单元格保持为NaN"""
+    present = column.notna()
+    text = column[present].astype(object).map(str).str.strip()
+    return text.reindex(column.index)
+
+
+def _scan_sheet(df, rules=None):
+    """
+    扫描单个工作表，返回该表的县域（按表头出现顺序）、指标以及所有非空数据点
+
+    数据点按 区域 → 行 → 县域 的顺序排列，与逐单元格扫描的写入顺序一致，
+    因此后续按"后写入者优先"去重即可得到相同的结果
+    """
+    return _extract_regions(df, _detect_regions(df, rules))
+
+
+def _detect_regions(df, rules=None):
+    """
+    定位工作表中的表格区域: 用整列掩码找出表头行和指标行，并把指标行划分到所属的区域
+
+    表头行和分类行由版式规则（layout_rules.RuleBook，None 表示默认规则）识别；
+    每一行都按全部规则集识别表头（同一行匹配多个规则集时取排在前面的），
+    每个表格区域按其表头的规则集识别指标行
+
+    返回: {'layouts', 'table_starts', 'metric_rows', 'metric_text', 'region_bounds'}，
+    第 r 个区域的版式为 layouts[r]，指标行为 metric_rows[region_bounds[r]:region_bounds[r + 1]]；
+    工作表中没有表头时返回None
+    """
+    rules = default_rules() if rules is None else rules
+    if len(df) == 0:
         return None
 
+    # 指标列的文本只转换一次，供所有规则集共用；单位列只在候选行上检查
+    texts = {}
+
+    def cell_value(row, column):
+        return df.iat[row, column]
+
+    # 每行匹配的第一个规则集的序号，-1 表示不是表头；倒序写入，排在前面的规则集优先
+    rule_list = list(rules)
+    header_rule = np.full(len(df), -1)
+    for index in range(len(rule_list) - 1, -1, -1):
+        rule = rule_list[index]
+        if len(df.columns) < rule.min_columns:
+            continue
+        if rule.label_column not in texts:
+            texts[rule.label_column] = _column_text(df.iloc[:, rule.label_column])
+        header_rule[rule.header_rows(texts[rule.label_column], cell_value)] = index
+    table_starts = np.flatnonzero(header_rule >= 0)
+    if len(table_starts) == 0:
+        return None
+    region_rule = header_rule[table_starts]
+
+    # 每行所属的表格区域及其规则集（第一个表头之前为-1）
+    row_region = np.searchsorted(table_starts, np.arange(len(df)), side='right') - 1
+    row_rule = np.where(row_region >= 0, region_rule[np.maximum(row_region, 0)], -1)
+
+    # 指标行: 所属区域规则集的指标列非空、不是分类行或需要跳过的行（表头本身除外）
+    is_metric = np.zeros(len(df), dtype=bool)
+    metric_text = np.empty(len(df), dtype=object)
+    for index in np.unique(region_rule):
+        rule = rule_list[index]
+        labels = texts[rule.label_column]
+        in_region = row_rule == index
+        filled = (labels.notna() & labels.ne('')).to_numpy(dtype=bool) & ~rule.ignore_mask(labels)
+        is_metric |= in_region & filled
+        metric_text[in_region] = labels.to_numpy(dtype=object)[in_region]
+    is_metric[table_starts] = False
+    metric_rows = np.flatnonzero(is_metric)
+
+    return {
+        'layouts': [rule_list[index] for index in region_rule],
+        'table_starts': table_starts,
+        'metric_rows': metric_rows,
+        'metric_text': metric_text,
+        'region_bounds': np.searchsorted(row_region[metric_rows], np.arange(len(table_starts) + 1), side='left'),
+    }
+
+
+def _extract_regions(df, regions):
+    """按 _detect_regions 定位的区域切片取出县域、指标和非空数据点"""
+    empty = np.empty(0, dtype=object)
+    sheet = {
+        'tables': 0,
+        'layout': None,
+        'counties': [],
+        'metrics': [],
+        'record_counties': empty,
+        'record_metrics': empty,
+        'record_values': empty,
+    }
+    if regions is None:
+        return sheet
+
+    table_starts = regions['table_starts']
+    metric_rows = regions['metric_rows']
+    metric_text = regions['metric_text']
+    region_bounds = regions['region_bounds']
+    layouts = regions['layouts']
+    sheet['tables'] = len(table_starts)
+    sheet['layout'] = layouts[0].name
+    sheet['metrics'] = metric_text[metric_rows].tolist()
+
+    values = df.to_numpy(dtype=object)
+    record_counties = []
+    record_metrics = []
+    record_values = []
+    for region, start_row in enumerate(table_starts):
+        # 县域名称: 表头行 first_county_column 列起的非空文本，保留原始格式（包括可能的换行符）
+        first = layouts[region].first_county_column
+        header = values[start_row, first:]
+        header = header[pd.notna(header)]
+        names = [name for name in (str(v).strip() for v in header) if name]
+        sheet['counties'].extend(names)
+
+        rows = metric_rows[region_bounds[region]:region_bounds[region + 1]]
+        if not names or len(rows) == 0:
+            continue
+
+        # 第k个县域的数据取自第 first_county_column + k 列
+        block = values[np.ix_(rows, np.arange(first, first + len(names)))]
+        row_idx, col_idx = np.nonzero(pd.notna(block))
+        record_counties.append(np.asarray(names, dtype=object)[col_idx])
+        record_metrics.append(metric_text[rows[row_idx]])
+        record_values.append(block[row_idx, col_idx])
+
+    if record_values:
+        sheet['record_counties'] = np.concatenate(record_counties)
+        sheet['record_metrics'] = np.concatenate(record_metrics)
+        sheet['record_values'] = np.concatenate(record_values)
+    return sheet
+
+
+def _process_with_loop(workbook, progress=None, stats=None, rules=None):
+    """
+    逐单元格扫描的参考引擎，保留用于校验向量化引擎的输出
+
+    返回: result_df；读取、扫描和构建结果表的耗时累加到 stats 中（扫描计入 extract）
+    """
+    if stats is None:
+        stats = new_stats('loop')
+    rules = default_rules() if rules is None else rules
+    stages = stats['stages']
+    # 县域/指标驻留为整数ID，数据点按写入顺序追加（县域ID按首次出现顺序分配，即原始顺序）
+    accumulator = CountyMetricAccumulator()
+
+    # 处理每个工作表；读取耗时由 _read_sheets_timed 计入 load，其余计入 extract
+    scan_started = time.perf_counter()
+    load_before = stages.get('load', 0.0)
+    for sheet_name, df in _track_sheets(workbook, _read_sheets_timed(workbook, stages), progress):
+        logger.debug("处理工作表: %s，形状: %s", sheet_name, df.shape)
+
+        # 首先找到所有表格的起始行；每个表头行按全部规则集识别，决定其表格区域的版式规则
+        table_starts = []
+        layouts = []
+        for i in range(len(df)):
+            row = [None if pd.isna(value) else value for value in df.iloc[i]]
+            # 检查是否为表格标题行（如A列'指标'、B列'单位'）
+            rule = rules.match_row(row)
+            if rule is not None:
+                table_starts.append(i)
+                layouts.append(rule)
+                logger.debug("  发现表格起始行: 第%d行（版式规则: %s）", i + 1, rule.name)
+
+        _add_sheet_stats(stats, df.shape, len(table_starts), {})
+        logger.debug("工作表 '%s' 中发现 %d 个表格区域", sheet_name, len(table_starts))
+
+        # 处理每个表格区域
+        for start_row, layout in zip(table_starts, layouts):
+            logger.debug("  处理表格区域，起始行: %d", start_row + 1)
+
+            # 提取县域名称（从 first_county_column 列开始的表头）
+            first = layout.first_county_column
+            county_names = []
+            county_ids = []
+            for j in range(first, len(df.columns)):
+                if pd.notna(df.iloc[start_row, j]):
+                    # 保留原始格式（包括可能的换行符）
+                    county_name = str(df.iloc[start_row, j]).strip()
+                    if county_name:  # 确保不为空字符串
+                        county_names.append(county_name)
+                        known_counties = len(accumulator.county_names)
+                        county_ids.append(accumulator.county_id(county_name))
+                        if len(accumulator.county_names) > known_counties:
+                            logger.debug("    添加新县域: '%s'", county_name)
+
+            logger.debug("  从该表格区域识别到 %d 个县域: %s", len(county_names), county_names)
+
+            # 处理当前表格的数据行
+            i = start_row + 1  # 从表头的下一行开始
+
+            # 找到下一个表格的起始位置作为当前表格的结束
+            next_table_start = None
+            for next_start in table_starts:
+                if next_start > start_row:
+                    next_table_start = next_start
+                    break
+
+            # 确定当前表格的结束行
+            end_row = next_table_start if next_table_start is not None else len(df)
+            logger.debug("  当前表格处理范围: 行 %d 到行 %d", i + 1, end_row)
+
+            # 读取指标数据，直到遇到下一个表格开始或工作表结束
+            processed_rows = 0
+            while i < end_row:
+                # 确保当前行有数据再处理
+                if pd.notna(df.iloc[i, layout.label_column]):
+                    cell_value = str(df.iloc[i, layout.label_column]).strip()
+                    # 指标处理
+                    metric = cell_value
+                    # 跳过分类行（如"一、基本情况"等）以及规则中需要跳过的行
+                    if metric and not layout.is_ignored(metric):
+                        metric_id = accumulator.metric_id(metric)
+                        # 读取每个县域的数据
+                        for j, county_id in enumerate(county_ids):
+                            data_col = j + first  # 数据从 first_county_column 列开始
+                            if data_col < len(df.columns) and pd.notna(df.iloc[i, data_col]):
+                                # 确保数据类型正确
+                                data_value = df.iloc[i, data_col]
+                                accumulator.append(county_id, metric_id, data_value)
+                    processed_rows += 1
+                i += 1
+            logger.debug("  表格区域处理完成，共处理 %d 行数据", processed_rows)
+    stages['extract'] = (stages.get('extract', 0.0) + time.perf_counter() - scan_started
+                         - (stages.get('load', 0.0) - load_before))
+
+    # 创建新的数据框: 县域作为行（原始顺序），排序后的指标作为列
+    logger.debug("开始构建新的数据框...")
+    pivot_started = time.perf_counter()
+    result_df = accumulator.to_frame()
+    stages['pivot'] = stages.get('pivot', 0.0) + time.perf_counter() - pivot_started
+    return result_df
+
+
+def _read_sheets_timed(workbook, stages):
+    """按顺序读取各工作表，读取耗时累加到 stages['load']"""
+    for sheet_name in workbook.sheet_names:
+        with timed(stages, 'load'):
+            df = workbook.read_sheet(sheet_name)
+        yield sheet_name, df
+
 if __name__ == "__main__":
-    input_file = r"F:\桌面\数据处理\四川省2.xlsx"
-    output_file = "四川省数据整理结果.xlsx"
-    
-    # 检查输入文件是否存在
-    if not os.path.exists(input_file):
-        print(f"错误: 找不到输入文件 {input_file}")
-        print("请确保文件路径正确，或者修改脚本中的input_file变量")
-    else:
-        process_sichuan_data(input_file, output_file)
\ No newline at end of file
+    # 命令行入口在 excel_engine 中，这里保留 python data_processor.py 的用法
+    from excel_engine import main
+
+    raise SystemExit(main())
@@ -0,0 +1,213 @@
+import os
+import sys
+import logging
+import argparse
+import threading
+from collections import OrderedDict
+from data_processor import extract_county_data, iter_records, cache_salt, ENGINES, RECORD_FIELDS
+from workbook_loader import open_workbook, READERS
+from output_writers import write_result, stream_result, stream_records, OUTPUT_FORMATS, RECORD_FORMATS
+from resource_guard import JobGuard, ResourceLimitExceeded, JobCancelled, check_cell_budget
+from sheet_cache import SheetCache
+from instrumentation import new_stats, timed, record_processing, configure_logging
+
+logger = logging.getLogger(__name__)
+
+# 处理引擎的稳定接口: Web应用（main.py、app.py）、后台任务、批量处理和命令行都只通过这些名称使用引擎，
+# data_processor 等模块中的其他函数属于内部实现，可能随时调整
+__all__ = [
+    'process_workbook', 'process_excel_data', 'ResultMemo',
+    'iter_records', 'stream_result', 'stream_records', 'write_result', 'cache_salt',
+    'ResourceLimitExceeded', 'JobCancelled',
+    'ENGINES', 'READERS', 'OUTPUT_FORMATS', 'RECORD_FORMATS', 'RECORD_FIELDS',
+]
+
+# 进程内结果缓存的默认内存预算（MB）
+DEFAULT_MEMO_MB = 256
+
+
+def process_workbook(source, output_path=None, output_format='xlsx', index=False, engine='vectorized', reader=None,
+                     sheet_workers=1, sheet_cache=None, progress=None, max_seconds=None, max_cells=None,
+                     max_memory_mb=None, cancelled=None, interrupt=False, stats=None):
+    """
+    处理一个工作簿: 解析 → 提取 → （可选）写出结果文件，工作簿只解析一次；整个过程受资源上限约束
+
+    参数:
+    source: 输入Excel文件路径或二进制文件对象（如上传缓冲区）
+    output_path: 结果文件路径，None 表示不写出
+    output_format: 结果文件格式，见 output_writers.OUTPUT_FORMATS
+    index: 写出结果文件时是否包含行索引
+    engine / reader / sheet_workers / sheet_cache: 见 data_processor.extract_county_data
+    progress: 可选的进度回调 progress(已完成工作表数, 工作表总数, 工作表名称)
+    max_seconds / max_memory_mb / cancelled / interrupt: 处理时间、内存上限和取消标记，见 resource_guard.JobGuard
+    max_cells: 完整解析之前检查的单元格数上限，None 或 0 表示不检查（已经过上传预检时不必重复检查）
+    stats: 可选的统计记录，None 时新建
+
+    返回: (结果DataFrame, 原始工作簿结构统计, 处理统计)；出错时直接抛出异常
+    （超出资源上限为 ResourceLimitExceeded，被取消为 JobCancelled）。
+    处理统计不会自动计入 /metrics，由调用方所在的进程调用 instrumentation.record_processing
+    """
+    stats = new_stats(engine) if stats is None else stats
+    guard = JobGuard(max_seconds=max_seconds, max_memory_mb=max_memory_mb, cancelled=cancelled, interrupt=interrupt)
+
+    def report(done, total, sheet_name):
+        if progress is not None:
+            progress(done, total, sheet_name)
+        # 不能在主线程中中断时，每处理完一个工作表检查一次处理时间和取消标记
+        guard.check()
+
+    with guard:
+        # 排队期间已被取消的任务不再处理
+        guard.check()
+        with open_workbook(source, reader=reader) as workbook:
+            check_cell_budget(workbook, max_cells)
+            result_df = extract_county_data(workbook, engine=engine, progress=report, sheet_workers=sheet_workers,
+                                            stats=stats, sheet_cache=sheet_cache)
+            workbook_stats = workbook.stats
+        if output_path is not None:
+            with timed(stats['stages'], 'write'):
+                write_result(result_df, output_path, output_format, index=index)
+            stats['output_bytes'] = os.path.getsize(output_path)
+    return result_df, workbook_stats, stats
+
+
+def process_excel_data(input_file, output_file, engine='vectorized', sheet_workers=1, sheet_cache=None, reader=None,
+                       max_seconds=None, max_cells=None):
+    """
+    处理Excel数据，将多个表格整合为一个标准格式，确保县域名称在A列，指标在第一行
+    支持识别工作表中的所有表格区域，包括后续表格中的县域名称
+
+    参数:
+    input_file: 输入Excel文件路径或二进制文件对象
+    output_file: 输出Excel文件路径
+    engine / sheet_workers / sheet_cache / reader / max_seconds / max_cells: 见 process_workbook
+
+    返回: 结果DataFrame；出错时记录失败的处理统计后抛出异常
+    """
+    stats = new_stats(engine)
+    try:
+        result_df, _, stats = process_workbook(input_file, output_file, engine=engine, sheet_workers=sheet_workers,
+                                               sheet_cache=sheet_cache, reader=reader, max_seconds=max_seconds,
+                                               max_cells=max_cells, stats=stats)
+    except Exception:
+        record_processing(stats, status='failed')
+        raise
+    record_processing(stats)
+    logger.info("数据处理完成! 共处理 %d 个县域，共提取 %d 个唯一指标，结果保存到: %s",
+                len(result_df), len(result_df.columns) - 1, output_file)
+    return result_df
+
+
+def frame_bytes(result_df):
+    """结果表占用的内存（字节），包括文本等Python对象本身"""
+    return int(result_df.memory_usage(index=True, deep=True).sum())
+
+
+class ResultMemo:
+    """
+    进程内的结果表LRU缓存，以上传ID（如结果缓存键）为键，按结果表实际占用的内存限制总大小
+
+    同一结果的预览翻页、重新下载和格式转换直接使用内存中的结果表，不必从临时目录重新读取或解析xlsx。
+    缓存只在当前进程中有效（每个Web工作进程各有一份），多线程共用；取出的结果表与其他请求共享，调用方不应修改
+
+    参数:
+    max_bytes: 内存预算（字节），超出时淘汰最久未使用的结果；单个超过预算的结果表不缓存，0 表示不缓存
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MEMO_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """取出缓存的结果表并刷新其最近使用时间，未命中时返回None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, result_df):
+        """缓存结果表，随后按内存预算淘汰最久未使用的条目"""
+        size = frame_bytes(result_df)
+        with self._lock:
+            self._discard(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (result_df, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+
+    def get_or_load(self, key, loader):
+        """
+        取出缓存的结果表，未命中时调用 loader(key) 读取并缓存
+
+        loader 抛出的异常（如结果已过期）直接传给调用方；并发的未命中可能各自读取一次
+        """
+        result_df = self.get(key)
+        if result_df is None:
+            result_df = loader(key)
+            self.put(key, result_df)
+        return result_df
+
+    def discard(self, key):
+        """移除一个结果（如其工作区已被清理）"""
+        with self._lock:
+            self._discard(key)
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def stats(self):
+        """缓存的条目数、内存占用和命中/未命中次数"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+def main(argv=None):
+    configure_logging()
+
+    parser = argparse.ArgumentParser(description='整理单个Excel工作簿；批量处理多个工作簿请使用 batch_processor.py')
+    parser.add_argument('input_file', nargs='?', default=r"F:\桌面\数据处理\四川省2.xlsx", help='输入Excel文件')
+    parser.add_argument('-o', '--output', default="四川省数据整理结果.xlsx", help='输出Excel文件')
+    parser.add_argument('--engine', choices=ENGINES, default='vectorized', help='提取引擎（默认: vectorized）')
+    parser.add_argument('--sheet-workers', type=int, default=1, help='并行提取工作表的进程数（默认: 1）')
+    parser.add_argument('--sheet-cache', default=None,
+                        help='工作表级缓存目录：再次处理修订后的工作簿时只重新提取内容变化的工作表')
+    parser.add_argument('--reader', choices=('auto',) + tuple(READERS), default=None,
+                        help='Excel读取引擎（默认: 环境变量 EXCEL_READER，未设置时为 auto）')
+    args = parser.parse_args(argv)
+
+    # 检查输入文件是否存在
+    if not os.path.exists(args.input_file):
+        logger.error("错误: 找不到输入文件 %s，请确保文件路径正确，或者在命令行中指定输入文件", args.input_file)
+        return 1
+
+    sheet_cache = SheetCache(args.sheet_cache) if args.sheet_cache else None
+    try:
+        process_excel_data(args.input_file, args.output, engine=args.engine, sheet_workers=args.sheet_workers,
+                           sheet_cache=sheet_cache, reader=args.reader)
+    except Exception as e:
+        logger.exception("处理过程中出现错误: %s", e)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
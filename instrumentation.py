@@ -0,0 +1,218 @@
+import os
+import json
+import time
+import uuid
+import bisect
+import logging
+import cProfile
+import threading
+import contextlib
+
+logger = logging.getLogger(__name__)
+
+# 延迟直方图的桶边界（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# 启动耗时直方图的桶边界（秒）
+STARTUP_BUCKETS = (0.25, 0.5, 1, 2, 3, 5, 10, 30)
+# 处理阶段，与 data_processor 中的计时一致；stream 引擎的读取计入 extract
+STAGES = ('load', 'detect', 'extract', 'pivot', 'write')
+
+
+def configure_logging(level=None):
+    """
+    配置日志输出格式和级别，级别默认取环境变量 LOG_LEVEL（默认 INFO）
+
+    INFO 只输出每个文件/任务的汇总信息，逐工作表、逐区域的明细在 DEBUG 级别
+    """
+    level = (level or os.environ.get('LOG_LEVEL', 'INFO')).upper()
+    logging.basicConfig(level=level, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+
+class Counter:
+    """单调递增的计数器，可带标签"""
+
+    type_name = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in sorted(self._values.items())]
+
+
+class Histogram:
+    """累积直方图，按Prometheus的格式输出 _bucket / _sum / _count"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                samples.append((f"{self.name}_bucket", key + (le,), cumulative))
+            samples.append((f"{self.name}_sum", key, total))
+            samples.append((f"{self.name}_count", key, cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    进程内的指标注册表，按Prometheus文本格式（text/plain; version=0.0.4）输出
+
+    每个进程各自计数；多进程部署时由Prometheus分别抓取各进程，或在前面加聚合
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help_text, labelnames=()):
+        metric = Counter(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            labelnames = metric.labelnames + (('le',) if metric.type_name == 'histogram' else ())
+            for sample_name, key, value in metric.samples():
+                label_text = ','.join(f'{name}="{_escape_label(value)}"' for name, value in zip(labelnames, key))
+                lines.append(f"{sample_name}{{{label_text}}} {_format_value(value)}" if label_text
+                             else f"{sample_name} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+REGISTRY = MetricsRegistry()
+REQUEST_LATENCY = REGISTRY.histogram('excel_http_request_duration_seconds', 'HTTP请求耗时', ('endpoint', 'method', 'status'))
+STAGE_LATENCY = REGISTRY.histogram('excel_stage_duration_seconds', '每个文件各处理阶段的耗时', ('stage',))
+FILES_PROCESSED = REGISTRY.counter('excel_files_processed_total', '处理完成的工作簿数', ('engine', 'status'))
+ROWS_SCANNED = REGISTRY.counter('excel_rows_scanned_total', '扫描的工作表行数')
+CELLS_SCANNED = REGISTRY.counter('excel_cells_scanned_total', '扫描的工作表单元格数（行数×列数）')
+REGIONS_FOUND = REGISTRY.counter('excel_regions_found_total', '识别到的表格区域数')
+OUTPUT_BYTES = REGISTRY.counter('excel_output_bytes_total', '写出的结果文件字节数')
+# 由 serve.py 在父进程中记录一次，fork 出的工作进程各自带着这条记录
+STARTUP_DURATION = REGISTRY.histogram('excel_app_startup_seconds', '应用启动（导入并创建应用）耗时', buckets=STARTUP_BUCKETS)
+
+
+def new_stats(engine=None):
+    """创建一次处理的统计记录，由 extract_county_data 和写出结果的调用方逐步填充"""
+    return {
+        'engine': engine,
+        'stages': {},
+        'sheets': 0,
+        'sheets_reused': 0,
+        'rows_scanned': 0,
+        'cells_scanned': 0,
+        'regions': 0,
+        'counties': 0,
+        'metrics': 0,
+        'output_bytes': 0,
+    }
+
+
+@contextlib.contextmanager
+def timed(stages, stage):
+    """把代码块的耗时累加到 stages[stage]（秒）"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages[stage] = stages.get(stage, 0.0) + time.perf_counter() - start
+
+
+def record_processing(stats, status='ok'):
+    """把一次处理的统计计入进程内的指标，并输出一行结构化日志（JSON）"""
+    FILES_PROCESSED.inc(engine=stats.get('engine') or '', status=status)
+    if status == 'ok':
+        for stage, seconds in stats['stages'].items():
+            STAGE_LATENCY.observe(seconds, stage=stage)
+        ROWS_SCANNED.inc(stats['rows_scanned'])
+        CELLS_SCANNED.inc(stats['cells_scanned'])
+        REGIONS_FOUND.inc(stats['regions'])
+        OUTPUT_BYTES.inc(stats['output_bytes'])
+    stages = {stage: round(seconds, 4) for stage, seconds in stats['stages'].items()}
+    logger.info('处理统计 %s', json.dumps(dict(stats, stages=stages, status=status), ensure_ascii=False, default=str))
+
+
+def init_app(app):
+    """
+    为Flask应用注册请求耗时直方图、/metrics 接口以及可选的 cProfile 钩子
+
+    设置了 app.config['PROFILE_DIR'] 时，带请求头 X-Profile: 1 的请求会被 cProfile 记录，
+    结果保存为 PROFILE_DIR 下的 .prof 文件（可用 snakeviz 或 pstats 查看）
+    """
+    from flask import request, g, Response
+
+    profile_dir = app.config.get('PROFILE_DIR')
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+
+    @app.before_request
+    def _start_request():
+        g.request_started = time.perf_counter()
+        if profile_dir and request.headers.get('X-Profile') == '1':
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def _finish_request(response):
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            path = os.path.join(profile_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{request.endpoint or 'unknown'}-"
+                                             f"{uuid.uuid4().hex[:8]}.prof")
+            profiler.dump_stats(path)
+            logger.info('请求性能分析已保存: %s', path)
+        started = g.pop('request_started', None)
+        if started is not None:
+            REQUEST_LATENCY.observe(time.perf_counter() - started, endpoint=request.endpoint or 'unknown',
+                                    method=request.method, status=response.status_code)
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,351 @@
+import os
+import json
+import string
+import logging
+import threading
+import time
+import uuid
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, CancelledError
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from excel_engine import process_workbook, JobCancelled
+from result_cache import summarize_result
+from instrumentation import new_stats, record_processing
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFull(Exception):
+    """等待中的任务已达上限，调用方应稍后重试"""
+
+
+class JobQueue:
+    """
+    后台处理任务队列：上传请求只提交任务并立即返回任务ID，
+    由有界的进程池执行 解析 → 转换 → 写出，任务状态和逐工作表进度可随时查询
+
+    同时运行和排队的任务总数有上限，超过上限时 submit 抛出 JobQueueFull，
+    由路由返回503让客户端稍后重试，而不是无限堆积。工作进程意外退出（例如被系统因内存不足终止）时，
+    进程池中的任务记为失败，随后的任务使用新的进程池，不影响之后提交的任务
+
+    参数:
+    max_workers: 进程池大小
+    max_pending: 除正在运行的任务外，最多允许排队等待的任务数
+    max_history: 最多保留的任务记录数，超过后丢弃最早的已结束任务
+    result_cache: 可选的 ResultCache，提交时指定了 cache_key 的任务完成后写入缓存
+    sheet_cache: 可选的 SheetCache，任务只重新提取内容变化的工作表（见 data_processor.extract_county_data）
+    result_store: 可选的 ResultStore，提交时指定了 province 和 cache_key 的任务完成后把结果追加到结果库
+    state_dir: 可选的任务状态目录。多进程部署（如 serve.py 的多个工作进程）时每个进程各有一个队列，
+               任务记录和进度同时写入该目录，查询落到其他进程时从这里读取；取消请求也通过该目录传递
+    max_seconds: 每个任务的处理时间上限（秒），从任务开始处理时计时，None 表示不限制
+    max_memory_mb: 每个任务的内存上限（MB），由工作进程按常驻内存检查（见 resource_guard.JobGuard），None 表示不限制
+    """
+
+    def __init__(self, max_workers=2, max_pending=8, max_history=500, result_cache=None, sheet_cache=None,
+                 result_store=None, state_dir=None, max_seconds=None, max_memory_mb=None):
+        self.result_cache = result_cache
+        self.sheet_cache = sheet_cache
+        self.result_store = result_store
+        self.state_dir = state_dir
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_history = max_history
+        self.limits = {'max_seconds': max_seconds, 'max_memory_mb': max_memory_mb}
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._futures = {}
+        self._executor = None
+        self._manager = None
+        self._progress = None
+        self._cancelled = None
+
+    def _ensure_started(self):
+        """首次提交任务时才启动进程池，避免在导入或开发服务器重载时创建子进程"""
+        if self._executor is None:
+            self._manager = multiprocessing.Manager()
+            self._progress = self._manager.dict()
+            self._cancelled = self._manager.dict()
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+
+    def _replace_executor(self, broken):
+        """工作进程意外退出后进程池不能再使用，换一个新的进程池（调用方持有 self._lock）"""
+        if self._executor is broken:
+            logger.error("处理进程意外退出，重新创建进程池")
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            broken.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, input_path, output_path, engine='vectorized', index=True, cache_key=None,
+               sheet_workers=1, province=None, reader=None, max_cells=None, **info):
+        """
+        提交一个处理任务
+
+        参数:
+        input_path: 上传文件路径
+        output_path: 处理结果的保存路径
+        engine: 提取引擎，见 data_processor.extract_county_data
+        index: 写出结果时是否包含行索引
+        cache_key: 结果缓存键，任务完成后由工作进程写入 result_cache
+        sheet_workers: 任务内部并行提取工作表的进程数
+        province: 省份名称，任务完成后以 cache_key 为结果ID追加到 result_store
+        reader: Excel读取引擎，见 workbook_loader.open_workbook
+        max_cells: 单元格数上限，工作进程在完整解析之前检查（见 resource_guard.check_cell_budget）；
+                   上传已经过预检时传 None
+        info: 附加信息（如下载时显示的文件名），原样保存在任务记录中
+
+        返回: 任务ID
+        """
+        if not self._slots.acquire(blocking=False):
+            raise JobQueueFull(f"处理队列已满（最多 {self.max_workers + self.max_pending} 个任务），请稍后重试")
+
+        job_id = uuid.uuid4().hex
+        try:
+            with self._lock:
+                self._ensure_started()
+                self._add_job(job_id, 'queued', output_path, None, dict(info, engine=engine))
+            cache = (self.result_cache, cache_key) if self.result_cache is not None and cache_key else None
+            store = (self.result_store, province, cache_key) if self.result_store is not None and province and cache_key else None
+            args = (_run_job, job_id, input_path, output_path, engine, index, self._progress, cache, sheet_workers,
+                    self.sheet_cache, self.state_dir, store, reader, dict(self.limits, max_cells=max_cells),
+                    self._cancelled)
+            executor = self._executor
+            try:
+                future = executor.submit(*args)
+            except BrokenProcessPool:
+                # 进程池已损坏但还没有任务结束回调来替换它
+                with self._lock:
+                    self._replace_executor(executor)
+                    executor = self._executor
+                future = executor.submit(*args)
+        except Exception:
+            with self._lock:
+                self._jobs.pop(job_id, None)
+            self._slots.release()
+            raise
+        with self._lock:
+            self._futures[job_id] = future
+        future.add_done_callback(partial(self._finish, job_id, executor))
+        return job_id
+
+    def cancel(self, job_id):
+        """
+        取消任务: 排队中的任务直接移出队列，处理中的任务由工作进程在 resource_guard.POLL_SECONDS 秒内中断；
+        由其他进程提交的任务通过状态目录传递取消请求
+
+        返回: 任务状态的快照（处理中的任务带 cancel_requested），任务不存在时返回None
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            future = self._futures.get(job_id)
+        if job is None:
+            job = self._get_published(job_id)
+            if job is not None and job['state'] in ('queued', 'running'):
+                _write_state(_state_path(self.state_dir, job_id, 'cancel'), {'requested_at': time.time()})
+                job['cancel_requested'] = True
+            return job
+        if job['state'] not in ('queued', 'running'):
+            return self.get(job_id)
+
+        # 排队中的任务直接取消，done 回调把状态记为 cancelled
+        if future is None or not future.cancel():
+            self._cancelled[job_id] = True
+            if self.state_dir:
+                _write_state(_state_path(self.state_dir, job_id, 'cancel'), {'requested_at': time.time()})
+            with self._lock:
+                if job_id in self._jobs:
+                    self._jobs[job_id]['cancel_requested'] = True
+        logger.info("已请求取消任务 %s", job_id)
+        return self.get(job_id)
+
+    def add_completed(self, output_path, result, **info):
+        """
+        登记一个已经完成的任务（例如命中结果缓存的上传），不占用进程池，
+        客户端可以和普通任务一样通过任务ID查询结果
+
+        返回: 任务ID
+        """
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._add_job(job_id, 'done', output_path, result, info)
+            self._jobs[job_id]['finished_at'] = time.time()
+        return job_id
+
+    def _add_job(self, job_id, state, output_path, result, info):
+        self._jobs[job_id] = {
+            'id': job_id,
+            'state': state,
+            'created_at': time.time(),
+            'finished_at': None,
+            'output_path': output_path,
+            'result': result,
+            'error': None,
+            **info,
+        }
+        self._publish(self._jobs[job_id])
+        self._trim_history()
+
+    def _publish(self, job):
+        """把任务记录写入状态目录，供其他进程查询"""
+        if self.state_dir:
+            _write_state(_state_path(self.state_dir, job['id']), job)
+
+    def _finish(self, job_id, executor, future):
+        self._slots.release()
+        if self._cancelled is not None:
+            self._cancelled.pop(job_id, None)
+        with self._lock:
+            self._futures.pop(job_id, None)
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job['finished_at'] = time.time()
+            stats = None
+            try:
+                # 工作进程的处理统计在Web进程中计入 /metrics
+                job['result'], stats = future.result()
+                job['state'] = 'done'
+            except (CancelledError, JobCancelled):
+                job['state'] = 'cancelled'
+                job['error'] = '任务已取消'
+                logger.info("任务 %s 已取消", job_id)
+            except BrokenProcessPool:
+                job['state'] = 'failed'
+                job['error'] = '处理进程意外退出（可能超出了内存上限），任务未完成，请稍后重试'
+                logger.error("任务 %s 处理失败: 处理进程意外退出", job_id)
+                self._replace_executor(executor)
+            except Exception as e:
+                job['state'] = 'failed'
+                job['error'] = str(e)
+                logger.error("任务 %s 处理失败: %s", job_id, e)
+            self._publish(job)
+        if self.state_dir and os.path.exists(_state_path(self.state_dir, job_id, 'cancel')):
+            os.remove(_state_path(self.state_dir, job_id, 'cancel'))
+        record_processing(stats or new_stats(job.get('engine')), status='ok' if stats else job['state'])
+
+    def _trim_history(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job['state'] in ('done', 'failed', 'cancelled')]
+        while len(self._jobs) > self.max_history and finished:
+            job_id = finished.pop(0)
+            self._jobs.pop(job_id, None)
+            if self._progress is not None:
+                self._progress.pop(job_id, None)
+                self._cancelled.pop(job_id, None)
+            if self.state_dir:
+                for path in (_state_path(self.state_dir, job_id), _state_path(self.state_dir, job_id, 'progress'),
+                             _state_path(self.state_dir, job_id, 'cancel')):
+                    if os.path.exists(path):
+                        os.remove(path)
+
+    def get(self, job_id):
+        """返回任务状态的快照（字典），任务不存在时返回None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            job = dict(job) if job is not None else None
+        if job is None:
+            return self._get_published(job_id)
+
+        progress = self._progress.get(job_id) if self._progress is not None else None
+        if progress:
+            job['progress'] = progress
+            if job['state'] == 'queued':
+                job['state'] = 'running'
+        return job
+
+    def _get_published(self, job_id):
+        """从状态目录读取由其他进程提交的任务，任务不存在时返回None"""
+        if not self.state_dir or len(job_id) != 32 or not all(c in string.hexdigits for c in job_id):
+            return None
+        job = _read_state(_state_path(self.state_dir, job_id))
+        if job is None:
+            return None
+        progress = _read_state(_state_path(self.state_dir, job_id, 'progress'))
+        if progress and job['state'] in ('queued', 'running'):
+            job['progress'] = progress
+            job['state'] = 'running'
+        return job
+
+    def shutdown(self):
+        """等待正在运行的任务结束并关闭进程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._manager.shutdown()
+            self._executor = None
+
+
+def _state_path(state_dir, job_id, kind='job'):
+    return os.path.join(state_dir, f"{job_id}.{kind}.json")
+
+
+def _write_state(path, data):
+    """先写临时文件再改名，读取方不会读到写了一半的文件"""
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, default=str)
+    os.replace(temp_path, path)
+
+
+def _read_state(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _run_job(job_id, input_path, output_path, engine, index, progress_store, cache=None, sheet_workers=1,
+             sheet_cache=None, state_dir=None, store=None, reader=None, limits=None, cancel_flags=None):
+    """
+    在工作进程中执行单个任务，进度通过共享字典回报给Web进程（设置了 state_dir 时同时写入状态目录）；
+    cache 为 (ResultCache, 缓存键)，store 为 (ResultStore, 省份, 结果ID)，
+    limits 为 {'max_seconds', 'max_memory_mb', 'max_cells'}，cancel_flags 为共享的取消标记字典
+
+    超出资源预算时抛出 resource_guard.ResourceLimitExceeded，被取消时抛出 resource_guard.JobCancelled
+
+    返回: (结果汇总, 处理统计)
+    """
+    limits = limits or {}
+    progress_store[job_id] = {'sheets_done': 0, 'sheets_total': None, 'sheet': None}
+    stats = new_stats(engine)
+    started = time.monotonic()
+
+    def cancelled():
+        if cancel_flags is not None and cancel_flags.get(job_id):
+            return True
+        return bool(state_dir) and os.path.exists(_state_path(state_dir, job_id, 'cancel'))
+
+    def report(done, total, sheet_name):
+        # 进度只写入任务状态，不在服务进程的标准错误上绘制进度条
+        elapsed = time.monotonic() - started
+        progress_store[job_id] = {
+            'sheets_done': done,
+            'sheets_total': total,
+            'sheet': sheet_name,
+            'elapsed': round(elapsed, 3),
+            'rate': round(done / elapsed, 3) if elapsed > 0 else None,
+        }
+        if state_dir:
+            _write_state(_state_path(state_dir, job_id, 'progress'), progress_store[job_id])
+
+    # 工作进程专用，由看门狗中断超时或被取消的任务
+    result_df, workbook_stats, stats = process_workbook(
+        input_path, output_path, index=index, engine=engine, reader=reader, sheet_workers=sheet_workers,
+        sheet_cache=sheet_cache, progress=report, max_seconds=limits.get('max_seconds'),
+        max_cells=limits.get('max_cells'), max_memory_mb=limits.get('max_memory_mb'),
+        cancelled=cancelled, interrupt=True, stats=stats)
+
+    summary = summarize_result(result_df, workbook_stats, output_path)
+    if cache is not None:
+        result_cache, cache_key = cache
+        result_cache.put(cache_key, result_df, output_path, summary)
+    if store is not None:
+        result_store, province, result_id = store
+        try:
+            result_store.append(province, result_id, result_df)
+        except Exception as e:
+            # 结果库只是附加的查询副本，写入失败不影响任务本身
+            logger.error("任务 %s 写入结果库失败: %s", job_id, e)
+    return summary, stats
@@ -0,0 +1,222 @@
+import os
+import re
+import sys
+import json
+import hashlib
+import argparse
+import numpy as np
+
+# 分类行（如"一、基本情况"、"九、其他"、"十二、附表"），这些行不是指标，需要跳过
+DEFAULT_CATEGORY_PATTERN = r'^[一二三四五六七八九十]+、'
+# 注释和资料来源行，不是指标
+DEFAULT_SKIP_PATTERNS = (r'^注[:：]', r'^资料来源')
+
+# 内置的版式规则集，按优先顺序排列。每个规则集描述一种表格版式:
+#   label_column: 指标名称所在的列（从0开始），表头标记也在这一列
+#   header_labels: 表头行在 label_column 中的标记
+#   unit_column / unit_labels: 表头行中单位标记所在的列及其取值，unit_column 为 None 时表头只看 label_column
+#   first_county_column: 县域名称（表头行）和对应数据开始的列
+#   category_pattern / skip_patterns: 指标列匹配这些正则表达式的行不是指标
+BUILTIN_RULE_SETS = [
+    {
+        'name': 'standard',
+        'description': "A列'指标'、B列'单位'的表头行，C列起为县域",
+        'label_column': 0,
+        'header_labels': ['指标'],
+        'unit_column': 1,
+        'unit_labels': ['单位'],
+        'first_county_column': 2,
+        'category_pattern': DEFAULT_CATEGORY_PATTERN,
+        'skip_patterns': list(DEFAULT_SKIP_PATTERNS),
+    },
+    {
+        'name': 'project',
+        'description': "A列'项目'、B列'单位'的表头行，C列起为县域",
+        'label_column': 0,
+        'header_labels': ['项目'],
+        'unit_column': 1,
+        'unit_labels': ['单位'],
+        'first_county_column': 2,
+        'category_pattern': DEFAULT_CATEGORY_PATTERN,
+        'skip_patterns': list(DEFAULT_SKIP_PATTERNS),
+    },
+    {
+        'name': 'shifted_unit',
+        'description': "A列'指标'或'项目'、C列'单位'的表头行（B列为代码或说明），D列起为县域",
+        'label_column': 0,
+        'header_labels': ['指标', '项目'],
+        'unit_column': 2,
+        'unit_labels': ['单位'],
+        'first_county_column': 3,
+        'category_pattern': DEFAULT_CATEGORY_PATTERN,
+        'skip_patterns': list(DEFAULT_SKIP_PATTERNS),
+    },
+]
+
+# 规则文件: JSON数组，每个元素为一个规则集（字段同 BUILTIN_RULE_SETS），排在内置规则集之前
+RULES_FILE = os.environ.get('LAYOUT_RULES')
+
+
+class LayoutRules:
+    """
+    编译后的单个版式规则集: 表头标记为集合，分类和跳过规则合并为一个正则表达式，
+    整列匹配（vectorized 引擎）和逐行匹配（stream/loop 引擎）使用同一套判断
+
+    参数:
+    spec: 规则集字典，字段见 BUILTIN_RULE_SETS
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.name = spec['name']
+        self.label_column = int(spec.get('label_column', 0))
+        self.header_labels = frozenset(spec['header_labels'])
+        unit_column = spec.get('unit_column')
+        self.unit_column = int(unit_column) if unit_column is not None else None
+        self.unit_labels = frozenset(spec.get('unit_labels') or ())
+        default_first = (self.unit_column if self.unit_column is not None else self.label_column) + 1
+        self.first_county_column = int(spec.get('first_county_column', default_first))
+        patterns = [spec.get('category_pattern', DEFAULT_CATEGORY_PATTERN)] + list(spec.get('skip_patterns', ()))
+        patterns = [pattern for pattern in patterns if pattern]
+        self._ignore = re.compile('|'.join(f'(?:{pattern})' for pattern in patterns)) if patterns else None
+        # 识别表头需要的最少列数
+        self.min_columns = max(self.label_column, self.unit_column if self.unit_column is not None else 0) + 1
+        if self.unit_column is not None and not self.unit_labels:
+            raise ValueError(f"版式规则 {self.name}: 指定了 unit_column 但没有 unit_labels")
+
+    def header_rows(self, label_text, cell_value):
+        """
+        整列识别表头行: 先按指标列筛出候选行，只在候选行上检查单位列
+
+        参数:
+        label_text: 指标列去除首尾空白的文本（pd.Series，空单元格为NaN）
+        cell_value: cell_value(行, 列) 返回单元格的原始值
+
+        返回: 表头行的行号数组（升序）
+        """
+        rows = np.flatnonzero(label_text.isin(self.header_labels).to_numpy(dtype=bool))
+        if self.unit_column is not None and len(rows):
+            rows = rows[[self._is_unit(cell_value(row, self.unit_column)) for row in rows]]
+        return rows
+
+    def ignore_mask(self, label_text):
+        """整列判断分类行和需要跳过的行"""
+        if self._ignore is None:
+            return np.zeros(len(label_text), dtype=bool)
+        return label_text.str.contains(self._ignore, na=False).to_numpy(dtype=bool)
+
+    def _is_unit(self, value):
+        return value is not None and value == value and str(value).strip() in self.unit_labels
+
+    def is_header_row(self, row):
+        """逐行判断表头行；row 为单元格值列表（空单元格为None）"""
+        if len(row) < self.min_columns:
+            return False
+        label = row[self.label_column]
+        if label is None or str(label).strip() not in self.header_labels:
+            return False
+        return self.unit_column is None or self._is_unit(row[self.unit_column])
+
+    def is_ignored(self, label):
+        """逐行判断分类行和需要跳过的行；label 为去除首尾空白的指标文本"""
+        return self._ignore is not None and self._ignore.search(label) is not None
+
+    def canonical(self):
+        """影响提取结果的规则内容（不含说明），用于计算签名"""
+        return {
+            'name': self.name,
+            'label_column': self.label_column,
+            'header_labels': sorted(self.header_labels),
+            'unit_column': self.unit_column,
+            'unit_labels': sorted(self.unit_labels),
+            'first_county_column': self.first_county_column,
+            'ignore': self._ignore.pattern if self._ignore is not None else None,
+        }
+
+
+class RuleBook:
+    """
+    按优先顺序排列的一组版式规则集
+
+    每一行都按全部规则集识别表头（同一行同时匹配多个规则集时取排在前面的），
+    每个表头开始一个新的表格区域，该区域按其表头的规则集提取；同一工作表中可以混用多种版式
+
+    参数:
+    specs: 规则集字典列表
+    """
+
+    def __init__(self, specs):
+        self.rules = [LayoutRules(spec) for spec in specs]
+        names = [rule.name for rule in self.rules]
+        if len(set(names)) != len(names):
+            raise ValueError(f"版式规则集名称重复: {', '.join(names)}")
+        canonical = json.dumps([rule.canonical() for rule in self.rules], ensure_ascii=False, sort_keys=True)
+        # 签名参与结果缓存键和工作表指纹，规则变化后旧的缓存结果不再命中
+        self.signature = hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16]
+
+    def __iter__(self):
+        return iter(self.rules)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def match_row(self, row):
+        """返回第一个把该行识别为表头的规则集，都不匹配时返回None"""
+        for rule in self.rules:
+            if rule.is_header_row(row):
+                return rule
+        return None
+
+    @property
+    def columns(self):
+        """识别表头需要读取的列（指标列和单位列）"""
+        columns = set()
+        for rule in self.rules:
+            columns.add(rule.label_column)
+            if rule.unit_column is not None:
+                columns.add(rule.unit_column)
+        return sorted(columns)
+
+
+def load_rule_specs(path=None):
+    """读取规则文件中的规则集（排在内置规则集之前）；path 为None时只使用内置规则集"""
+    specs = []
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            custom = json.load(f)
+        if not isinstance(custom, list):
+            raise ValueError(f"版式规则文件应为规则集数组: {path}")
+        specs.extend(custom)
+    return specs + BUILTIN_RULE_SETS
+
+
+def compile_rules(specs):
+    """编译规则集，规则集的字段有误或名称重复时抛出 ValueError；返回 RuleBook"""
+    return RuleBook(specs)
+
+
+_default_rules = None
+
+
+def default_rules():
+    """默认的规则（环境变量 LAYOUT_RULES 指定的规则文件 + 内置规则集），首次使用时编译一次"""
+    global _default_rules
+    if _default_rules is None:
+        _default_rules = compile_rules(load_rule_specs(RULES_FILE))
+    return _default_rules
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='列出版式规则集（内置规则集及 LAYOUT_RULES 规则文件）')
+    parser.add_argument('--rules', default=RULES_FILE, help='规则文件（默认: 环境变量 LAYOUT_RULES）')
+    args = parser.parse_args(argv)
+
+    rulebook = compile_rules(load_rule_specs(args.rules))
+    print(f"版式规则签名: {rulebook.signature}")
+    for rule in rulebook:
+        print(f"  {rule.name}: {rule.spec.get('description', '')}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
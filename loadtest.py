@@ -0,0 +1,686 @@
+import io
+import os
+import re
+import sys
+import json
+import html
+import time
+import uuid
+import random
+import shutil
+import socket
+import zipfile
+import platform
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+import importlib.util
+from urllib.parse import urlsplit, quote, parse_qs
+from benchmark import SCENARIOS, scenario_workbook
+
+# 每个模拟用户依次执行的操作: 上传处理、预览页面、预览窗口（JSON）、下载xlsx、转换为CSV下载
+OPERATIONS = ('upload', 'preview_page', 'preview_window', 'download', 'download_csv')
+# 默认的工作簿组合: 场景名称（见 benchmark.SCENARIOS）→ 占上传次数的比例
+DEFAULT_MIX = {'small': 0.8, 'large': 0.2}
+# 报告的延迟分位数
+PERCENTILES = (50, 95, 99)
+# 采样服务进程内存（RSS）的间隔（秒）
+RSS_INTERVAL = 0.5
+# 等待服务启动的最长时间（秒）
+READY_TIMEOUT = 60
+# 后台任务模式下查询任务状态的间隔（秒）
+JOB_POLL_SECONDS = 0.2
+# 单个HTTP请求的超时（秒），应大于服务端的 WEB_TIMEOUT
+REQUEST_TIMEOUT = 600
+
+# 与基线比较时，低于这些差值的变化视为测量噪声，不算退化
+MIN_SECONDS_DELTA = 0.05
+MIN_RSS_MB_DELTA = 20
+
+
+def parse_mix(text):
+    """解析工作簿组合，如 'small=0.8,large=0.2'，比例会被归一化"""
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"未知的场景: {name}，可选: {', '.join(sorted(SCENARIOS))}")
+        mix[name] = float(weight) if weight else 1.0
+    total = sum(mix.values())
+    if total <= 0:
+        raise ValueError('工作簿组合的比例之和必须大于0')
+    return {name: weight / total for name, weight in mix.items()}
+
+
+def parse_slos(text):
+    """
+    解析延迟目标，如 'upload:p95=5,download:p99=0.5'（秒）；操作名为 all 时针对所有请求
+
+    返回: [(操作, 分位数, 秒数), ...]
+    """
+    slos = []
+    for item in filter(None, (part.strip() for part in (text or '').split(','))):
+        match = re.fullmatch(r'(\w+):p(\d+)=([\d.]+)', item)
+        if not match or (match.group(1) not in OPERATIONS and match.group(1) != 'all') \
+                or int(match.group(2)) not in PERCENTILES:
+            raise ValueError(f"无法识别的延迟目标: {item}，格式为 操作:p95=秒数，"
+                             f"操作: {', '.join(OPERATIONS)} 或 all，分位数: {', '.join(f'p{p}' for p in PERCENTILES)}")
+        slos.append((match.group(1), int(match.group(2)), float(match.group(3))))
+    return slos
+
+
+def percentile(sorted_values, pct):
+    """最近秩法计算分位数，sorted_values 为升序列表"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-pct * len(sorted_values) // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def unique_upload(data, tag):
+    """
+    返回内容哈希不同、表格内容相同的xlsx: 只改写zip的注释，不重新压缩
+
+    每次上传都使用不同的字节，结果缓存不会命中，测到的是完整的处理路径
+    """
+    buffer = io.BytesIO(data)
+    with zipfile.ZipFile(buffer, 'a') as archive:
+        archive.comment = tag.encode('ascii')
+    return buffer.getvalue()
+
+
+def encode_multipart(fields, files):
+    """
+    编码 multipart/form-data 请求体
+
+    参数:
+    fields: {字段名: 文本}
+    files: {字段名: (文件名, 字节内容)}
+
+    返回: (请求体字节, Content-Type)
+    """
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode('utf-8'))
+    for name, (filename, content) in files.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: application/octet-stream\r\n\r\n'.encode('utf-8'))
+        parts.append(content)
+        parts.append(b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode('utf-8'))
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class HttpClient:
+    """单个模拟用户的HTTP客户端: 复用一个 keep-alive 连接，不跟随重定向，连接断开时重连一次"""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.connection = None
+
+    def request(self, method, path, body=None, headers=None):
+        """发送请求并读完响应，返回 (状态码, 响应头, 响应体)"""
+        for attempt in (1, 2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=REQUEST_TIMEOUT)
+            try:
+                self.connection.request(method, path, body=body, headers=headers or {})
+                response = self.connection.getresponse()
+                return response.status, response.headers, response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # keep-alive 连接被服务端关闭，重连后重试一次
+                self.close()
+                if attempt == 2:
+                    raise
+            except Exception:
+                self.close()
+                raise
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class Recorder:
+    """线程安全地记录每个请求的操作名称、耗时和错误"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = []
+
+    def add(self, operation, seconds, error=None):
+        with self._lock:
+            self.samples.append((operation, seconds, error))
+
+
+def _timed_request(client, recorder, operation, method, path, check, **kwargs):
+    """
+    发送一个请求并记录耗时；check(状态码, 响应头, 响应体) 返回错误说明，None 表示成功
+
+    返回: 成功时为 (响应头, 响应体)，失败时为None
+    """
+    started = time.perf_counter()
+    try:
+        status, headers, body = client.request(method, path, **kwargs)
+        error = check(status, headers, body)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    recorder.add(operation, time.perf_counter() - started, error)
+    return None if error else (headers, body)
+
+
+def _expect_ok(status, headers, body):
+    return None if status == 200 else f"HTTP {status}"
+
+
+def _upload_sync(client, recorder, filename, data):
+    """同步上传: 成功时返回结果页面中的 (下载路径, 显示名称, 结果ID, 预览接口)"""
+    body, content_type = encode_multipart({}, {'file': (filename, data)})
+    links = {}
+
+    def check(status, headers, body):
+        # 处理失败时服务端 flash 错误并重定向回上传页面
+        if status in (301, 302, 303):
+            return f"HTTP {status} 重定向（处理失败）"
+        if status != 200:
+            return f"HTTP {status}"
+        page = body.decode('utf-8', errors='replace')
+        match = re.search(r'href="(/download/[^"?]+)\?display_name=([^"&]*)&result=([^"&]+)&format=csv"', page)
+        api = re.search(r'data-api="([^"]*)"', page)
+        if match is None:
+            return '结果页面中没有下载链接'
+        links.update(path=html.unescape(match.group(1)), name=html.unescape(match.group(2)),
+                     result=html.unescape(match.group(3)), api=html.unescape(api.group(1)) if api else None)
+        return None
+
+    if _timed_request(client, recorder, 'upload', 'POST', '/', check, body=body,
+                      headers={'Content-Type': content_type}) is None:
+        return None
+    return links
+
+
+def _upload_async(client, recorder, filename, data):
+    """后台任务模式上传: 提交后轮询任务状态直到完成，耗时按提交到完成计算"""
+    body, content_type = encode_multipart({'async': '1'}, {'file': (filename, data)})
+    started = time.perf_counter()
+    try:
+        status, _, response = client.request('POST', '/', body=body, headers={'Content-Type': content_type})
+        if status != 202:
+            raise RuntimeError(f"HTTP {status}")
+        job_id = json.loads(response)['job_id']
+        while True:
+            status, _, response = client.request('GET', f'/jobs/{job_id}')
+            if status != 200:
+                raise RuntimeError(f"任务状态 HTTP {status}")
+            job = json.loads(response)
+            if job['state'] not in ('queued', 'running'):
+                break
+            time.sleep(JOB_POLL_SECONDS)
+        if job['state'] != 'done':
+            raise RuntimeError(f"任务{job['state']}: {job.get('error')}")
+    except Exception as e:
+        recorder.add('upload', time.perf_counter() - started, str(e) or type(e).__name__)
+        return None
+    recorder.add('upload', time.perf_counter() - started)
+
+    parts = urlsplit(job['download_url'])
+    query = parse_qs(parts.query)
+    result_id = query.get('result', [''])[0]
+    return {'path': parts.path, 'name': query.get('display_name', [''])[0], 'result': result_id,
+            'api': f'/api/results/{result_id}/preview' if result_id else None}
+
+
+def run_session(client, recorder, filename, data, use_async=False):
+    """
+    一个模拟用户的完整操作: 上传处理 → 预览页面 → 预览窗口 → 下载xlsx → 下载CSV，
+    上传失败时后续操作不再执行
+    """
+    upload = _upload_async if use_async else _upload_sync
+    links = upload(client, recorder, filename, data)
+    if links is None:
+        return
+
+    path = quote(links['path'])
+    name = quote(links['name'])
+    result = quote(links['result'])
+    _timed_request(client, recorder, 'preview_page', 'GET',
+                   f"/preview?result={result}&filename={quote(links['path'][len('/download/'):])}", _expect_ok)
+    if links['api']:
+        _timed_request(client, recorder, 'preview_window', 'GET',
+                       f"{quote(links['api'])}?row_offset=0&row_limit=50&col_offset=0&col_limit=20", _expect_ok)
+    _timed_request(client, recorder, 'download', 'GET', f'{path}?display_name={name}', _expect_ok)
+    _timed_request(client, recorder, 'download_csv', 'GET',
+                   f'{path}?display_name={name}&result={result}&format=csv', _expect_ok)
+
+
+def free_port():
+    """返回本机一个空闲的TCP端口"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(run_dir, workers, threads, repeat_uploads=False):
+    """
+    用 serve.py 在本机启动 main.py 的应用，状态目录（工作区、缓存、结果库、任务状态）都放在 run_dir 中，
+    与正式部署的数据互不干扰；服务输出写入 run_dir/server.log
+
+    返回: (服务进程, 服务地址)
+    """
+    port = free_port()
+    env = dict(os.environ)
+    env.update({
+        'WEB_APP': 'main',
+        'WEB_HOST': '127.0.0.1',
+        'WEB_PORT': str(port),
+        'WEB_WORKERS': str(workers),
+        'WEB_THREADS': str(threads),
+        'UPLOAD_FOLDER': os.path.join(run_dir, 'workspaces'),
+        'RESULT_CACHE_DIR': os.path.join(run_dir, 'result_cache'),
+        'SHEET_CACHE_DIR': os.path.join(run_dir, 'sheet_cache'),
+        'RESULT_STORE_DIR': os.path.join(run_dir, 'result_store'),
+        'JOB_STATE_DIR': os.path.join(run_dir, 'jobs'),
+        # 每次上传的内容都不同时，工作表级缓存会让重复的合成工作表变得很便宜，测不到真实的处理开销
+        'INCREMENTAL_SHEETS': '1' if repeat_uploads else '0',
+        'LOG_LEVEL': env.get('LOG_LEVEL', 'WARNING'),
+    })
+    log = open(os.path.join(run_dir, 'server.log'), 'wb')
+    process = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'serve.py')],
+                               env=env, stdout=log, stderr=subprocess.STDOUT)
+    log.close()
+    return process, f'http://127.0.0.1:{port}'
+
+
+def server_missing():
+    """serve.py 在本平台使用的WSGI服务器未安装时返回其名称，否则返回None"""
+    server = 'waitress' if os.name == 'nt' else 'gunicorn'
+    return None if importlib.util.find_spec(server) is not None else server
+
+
+def wait_ready(base_url, process=None, timeout=READY_TIMEOUT):
+    """
+    等待服务可以响应 /metrics，再确认上传页面可以正常渲染（例如模板缺失时所有上传都会失败）；
+    超时、服务进程退出或上传页面出错时抛出 RuntimeError
+    """
+    client = HttpClient(base_url)
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            if process is not None and process.poll() is not None:
+                raise RuntimeError(f"服务进程已退出（退出码 {process.returncode}）")
+            try:
+                if client.request('GET', '/metrics')[0] == 200:
+                    break
+            except OSError:
+                pass
+            if time.monotonic() >= deadline:
+                raise RuntimeError(f"服务在 {timeout} 秒内没有就绪: {base_url}")
+            time.sleep(0.2)
+        status = client.request('GET', '/')[0]
+        if status != 200:
+            raise RuntimeError(f"服务已启动，但上传页面返回 HTTP {status}，上传将全部失败")
+    finally:
+        client.close()
+
+
+def stop_server(process):
+    """正常停止服务（gunicorn 会等待进行中的请求完成），超时后强制结束"""
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def process_tree_rss(pid):
+    """进程及其所有子进程（如 gunicorn 的工作进程和任务进程）的常驻内存之和（字节），无法读取时返回None"""
+    try:
+        parents = {}
+        for entry in os.listdir('/proc'):
+            if entry.isdigit():
+                try:
+                    with open(f'/proc/{entry}/stat') as f:
+                        # 进程名可能包含空格和括号，父进程号位于最后一个')'之后的第二个字段
+                        parents.setdefault(int(f.read().rsplit(')', 1)[1].split()[1]), []).append(int(entry))
+                except (OSError, IndexError, ValueError):
+                    continue
+    except OSError:
+        return None
+
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        pending.extend(parents.get(current, ()))
+        try:
+            with open(f'/proc/{current}/statm') as f:
+                total += int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, IndexError, ValueError):
+            continue
+    return total
+
+
+class RssSampler:
+    """后台线程每 RSS_INTERVAL 秒采样一次服务进程树的常驻内存（仅 Linux）"""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='rss-sampler', daemon=True)
+
+    def __enter__(self):
+        self._sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        return False
+
+    def _run(self):
+        while not self._stop.wait(RSS_INTERVAL):
+            self._sample()
+
+    def _sample(self):
+        rss = process_tree_rss(self.pid)
+        if rss is not None:
+            self.samples.append(rss / 1024 / 1024)
+
+    def summary(self):
+        if not self.samples:
+            return None
+        return {
+            'start': round(self.samples[0], 1),
+            'peak': round(max(self.samples), 1),
+            'end': round(self.samples[-1], 1),
+        }
+
+
+def summarize(samples, duration):
+    """按操作汇总请求数、错误率、吞吐量和延迟分位数（秒）；all 为所有请求合计"""
+    groups = {operation: [] for operation in OPERATIONS}
+    for operation, seconds, error in samples:
+        groups[operation].append((seconds, error))
+    groups['all'] = [(seconds, error) for _, seconds, error in samples]
+
+    summary = {}
+    for operation, entries in groups.items():
+        if not entries:
+            continue
+        latencies = sorted(seconds for seconds, _ in entries)
+        errors = sum(1 for _, error in entries if error)
+        summary[operation] = {
+            'count': len(entries),
+            'errors': errors,
+            'error_rate': round(errors / len(entries), 4),
+            'per_second': round(len(entries) / duration, 2) if duration else None,
+            'mean': round(sum(latencies) / len(latencies), 4),
+            **{f'p{pct}': round(percentile(latencies, pct), 4) for pct in PERCENTILES},
+            'max': round(latencies[-1], 4),
+        }
+    return summary
+
+
+def check_slos(results, slos, max_error_rate):
+    """检查延迟目标和错误率，返回未达标项的说明列表"""
+    violations = []
+    for operation, pct, limit in slos:
+        measured = results['operations'].get(operation, {}).get(f'p{pct}')
+        if measured is not None and measured > limit:
+            violations.append(f"{operation} p{pct} 延迟 {measured} 秒，目标 {limit} 秒")
+    for operation, measured in results['operations'].items():
+        if measured['error_rate'] > max_error_rate:
+            violations.append(f"{operation} 错误率 {measured['error_rate']:.2%}，上限 {max_error_rate:.2%}")
+    return violations
+
+
+def compare_with_baseline(results, baseline, threshold=0.2):
+    """
+    与基线比较各操作的 p95/p99 延迟和服务内存峰值；并发数、工作簿组合或上传模式不同时结果不可比
+
+    返回: 退化项列表，每项为 {'operation', 'metric', 'baseline', 'current', 'ratio'}
+    """
+    keys = ('concurrency', 'mix', 'async', 'repeat_uploads', 'server')
+    if any(baseline.get(key) != results.get(key) for key in keys):
+        return []
+
+    checks = []
+    for operation, current in results['operations'].items():
+        previous = baseline.get('operations', {}).get(operation)
+        if previous is not None:
+            for metric in ('p95', 'p99'):
+                checks.append((operation, metric, previous[metric], current[metric], MIN_SECONDS_DELTA))
+    if results.get('rss_mb') and baseline.get('rss_mb'):
+        checks.append(('server', 'rss_peak_mb', baseline['rss_mb']['peak'], results['rss_mb']['peak'], MIN_RSS_MB_DELTA))
+
+    regressions = []
+    for operation, metric, old, new, min_delta in checks:
+        if new > old * (1 + threshold) and new - old > min_delta:
+            regressions.append({
+                'operation': operation,
+                'metric': metric,
+                'baseline': old,
+                'current': new,
+                'ratio': round(new / old, 2) if old else None,
+            })
+    return regressions
+
+
+def run_load(base_url, workbooks, mix, sessions, concurrency, duration=None, use_async=False,
+             repeat_uploads=False, warmup=1, seed=0, server_pid=None):
+    """
+    以 concurrency 个并发用户执行 sessions 次完整操作（或运行到 duration 秒为止），
+    每次按 mix 的比例随机选择一个场景的工作簿上传
+
+    参数:
+    workbooks: {场景名称: xlsx字节内容}
+    repeat_uploads: 为True时重复上传相同的字节（测量结果缓存命中的路径），否则每次上传的内容哈希都不同
+    warmup: 正式计时前每个场景先顺序执行的次数，不计入结果
+    server_pid: 服务进程号，提供时采样其进程树的内存
+
+    返回: 可JSON序列化的结果
+    """
+    rnd = random.Random(seed)
+    names = list(mix)
+    plan = rnd.choices(names, weights=[mix[name] for name in names], k=sessions)
+    run_tag = uuid.uuid4().hex[:12]
+
+    def payload(name, index):
+        data = workbooks[name]
+        return data if repeat_uploads else unique_upload(data, f'{run_tag}-{index}')
+
+    # 预热: 加载各工作进程的惰性初始化，结果不计入统计
+    client = HttpClient(base_url)
+    for name in names:
+        for index in range(warmup):
+            run_session(client, Recorder(), f'{name}.xlsx', payload(name, f'warmup-{name}-{index}'), use_async)
+    client.close()
+
+    recorder = Recorder()
+    lock = threading.Lock()
+    next_index = iter(range(sessions))
+    completed = []
+
+    def user():
+        client = HttpClient(base_url)
+        try:
+            while True:
+                with lock:
+                    index = next(next_index, None)
+                if index is None or (duration and time.perf_counter() - started > duration):
+                    return
+                name = plan[index]
+                run_session(client, recorder, f'{name}.xlsx', payload(name, index), use_async)
+                with lock:
+                    completed.append(name)
+        finally:
+            client.close()
+
+    sampler = RssSampler(server_pid) if server_pid else None
+    started = time.perf_counter()
+    users = [threading.Thread(target=user, name=f'user-{i}', daemon=True) for i in range(concurrency)]
+    if sampler is not None:
+        sampler.__enter__()
+    try:
+        for thread in users:
+            thread.start()
+        for thread in users:
+            thread.join()
+    finally:
+        elapsed = time.perf_counter() - started
+        if sampler is not None:
+            sampler.__exit__(None, None, None)
+
+    errors = {}
+    for operation, _, error in recorder.samples:
+        if error:
+            errors[f'{operation}: {error}'] = errors.get(f'{operation}: {error}', 0) + 1
+    return {
+        'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'url': base_url,
+        'concurrency': concurrency,
+        'mix': {name: round(weight, 4) for name, weight in mix.items()},
+        'async': use_async,
+        'repeat_uploads': repeat_uploads,
+        'sessions': len(completed),
+        'sessions_by_scenario': {name: completed.count(name) for name in names},
+        'duration_seconds': round(elapsed, 3),
+        'sessions_per_second': round(len(completed) / elapsed, 3) if elapsed else None,
+        'operations': summarize(recorder.samples, elapsed),
+        'errors': dict(sorted(errors.items(), key=lambda item: -item[1])),
+        'rss_mb': sampler.summary() if sampler is not None else None,
+    }
+
+
+def print_report(results):
+    print(f"\n{results['sessions']} 次操作（{results['concurrency']} 个并发用户），耗时 {results['duration_seconds']} 秒，"
+          f"{results['sessions_per_second']} 次/秒")
+    print(f"  {'操作':<16}{'请求数':>8}{'错误率':>9}{'次/秒':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'最大':>9}")
+    for operation, measured in results['operations'].items():
+        print(f"  {operation:<16}{measured['count']:>8}{measured['error_rate']:>9.2%}{measured['per_second']:>9}"
+              f"{measured['p50']:>9.3f}{measured['p95']:>9.3f}{measured['p99']:>9.3f}{measured['max']:>9.3f}")
+    if results['rss_mb']:
+        rss = results['rss_mb']
+        print(f"  服务内存（RSS，含子进程）: 开始 {rss['start']} MB，峰值 {rss['peak']} MB，结束 {rss['end']} MB")
+    for message, count in list(results['errors'].items())[:10]:
+        print(f"  错误 ×{count}: {message}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='并发负载测试: 在本机启动服务，模拟多个用户同时上传、预览和下载')
+    parser.add_argument('--url', default=None, help='测试已经运行的服务（如 http://127.0.0.1:5000），不指定时用 serve.py 启动一个')
+    parser.add_argument('--server-pid', type=int, default=None, help='配合 --url 使用: 采样该进程树的内存')
+    parser.add_argument('--workers', type=int, default=2, help='启动服务时的工作进程数（默认: 2）')
+    parser.add_argument('--threads', type=int, default=4, help='启动服务时每个工作进程的线程数（默认: 4）')
+    parser.add_argument('--concurrency', type=int, default=10, help='并发用户数（默认: 10）')
+    parser.add_argument('--sessions', type=int, default=100, help='完整操作的总次数（默认: 100）')
+    parser.add_argument('--duration', type=float, default=None, help='最多运行的秒数，到时不再开始新的操作')
+    parser.add_argument('--mix', default=','.join(f'{name}={weight}' for name, weight in DEFAULT_MIX.items()),
+                        help=f"工作簿组合，场景见 benchmark.py（默认: small=0.8,large=0.2）")
+    parser.add_argument('--async', dest='use_async', action='store_true', help='以后台任务模式上传（轮询 /jobs/<id>）')
+    parser.add_argument('--repeat-uploads', action='store_true', help='重复上传相同的内容，测量结果缓存命中的路径')
+    parser.add_argument('--warmup', type=int, default=1, help='计时前每个场景预热的次数（默认: 1）')
+    parser.add_argument('--seed', type=int, default=0, help='工作簿组合的随机种子（默认: 0）')
+    parser.add_argument('--slo', default=None, help="延迟目标，如 'upload:p95=5,download:p99=0.5'（秒），未达标时退出码为1")
+    parser.add_argument('--max-error-rate', type=float, default=0.0, help='允许的错误率（默认: 0）')
+    parser.add_argument('--output', default='loadtest_results.json', help='结果文件（默认: loadtest_results.json）')
+    parser.add_argument('--baseline', default='loadtest_baseline.json', help='基线文件（默认: loadtest_baseline.json）')
+    parser.add_argument('--threshold', type=float, default=0.2, help='判定退化的相对增长比例（默认: 0.2）')
+    parser.add_argument('--save-baseline', action='store_true', help='把本次结果保存为新的基线')
+    parser.add_argument('--work-dir', default=None, help='合成工作簿和服务状态的存放目录（默认: 系统临时目录）')
+    args = parser.parse_args(argv)
+
+    try:
+        mix = parse_mix(args.mix)
+        slos = parse_slos(args.slo)
+    except ValueError as e:
+        parser.error(str(e))
+
+    missing = server_missing() if args.url is None else None
+    if missing:
+        print(f"负载测试失败: 未安装 {missing}，无法用 serve.py 启动服务；"
+              f"请先执行 pip install {missing}，或用 --url 测试已经运行的服务", file=sys.stderr)
+        return 2
+
+    work_dir = args.work_dir or os.path.join(tempfile.gettempdir(), 'excel_loadtest')
+    os.makedirs(work_dir, exist_ok=True)
+    workbooks = {}
+    for name in mix:
+        with open(scenario_workbook(name, SCENARIOS[name], work_dir), 'rb') as f:
+            workbooks[name] = f.read()
+        print(f"场景 {name}: {len(workbooks[name]) / 1024:.1f} KB，占 {mix[name]:.0%}")
+
+    process = None
+    run_dir = None
+    base_url = args.url
+    server_pid = args.server_pid
+    try:
+        if base_url is None:
+            run_dir = tempfile.mkdtemp(prefix='run_', dir=work_dir)
+            process, base_url = start_server(run_dir, args.workers, args.threads, args.repeat_uploads)
+            server_pid = process.pid
+            print(f"启动服务: {base_url}（{args.workers} 个工作进程 × {args.threads} 个线程）")
+        wait_ready(base_url, process)
+        results = run_load(base_url, workbooks, mix, args.sessions, args.concurrency, duration=args.duration,
+                           use_async=args.use_async, repeat_uploads=args.repeat_uploads,
+                           warmup=args.warmup, seed=args.seed, server_pid=server_pid)
+    except RuntimeError as e:
+        if run_dir is not None:
+            print(f"服务日志: {os.path.join(run_dir, 'server.log')}", file=sys.stderr)
+            run_dir = None
+        print(f"负载测试失败: {e}", file=sys.stderr)
+        return 2
+    finally:
+        if process is not None:
+            stop_server(process)
+        if run_dir is not None:
+            shutil.rmtree(run_dir, ignore_errors=True)
+
+    results['server'] = {'workers': args.workers, 'threads': args.threads} if args.url is None else {'url': args.url}
+    print_report(results)
+
+    violations = check_slos(results, slos, args.max_error_rate)
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, threshold=args.threshold)
+        results['baseline'] = {'file': args.baseline, 'threshold': args.threshold, 'regressions': regressions}
+    results['slo'] = {'targets': [f'{op}:p{pct}={limit}' for op, pct, limit in slos],
+                      'max_error_rate': args.max_error_rate, 'violations': violations}
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存到: {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"基线已保存到: {args.baseline}")
+
+    if violations:
+        print(f"\n未达到 {len(violations)} 项目标:")
+        for item in violations:
+            print(f"  {item}")
+    if regressions:
+        print(f"\n发现 {len(regressions)} 项性能退化（阈值 {args.threshold:.0%}）:")
+        for item in regressions:
+            print(f"  [{item['operation']}] {item['metric']}: {item['baseline']} → {item['current']}（×{item['ratio']}）")
+    return 1 if violations or regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
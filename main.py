@@ -1,46 +1,172 @@
 import os
+import logging
+import threading
 import pandas as pd
-from flask import Flask, request, render_template, redirect, url_for, send_from_directory, flash
+from flask import Flask, request, render_template, redirect, url_for, send_file, flash, jsonify, Response
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge
 import tempfile
-from data_processor import process_excel_data
+import shutil
+from urllib.parse import quote
+from excel_engine import process_workbook, iter_records, ResultMemo, RECORD_FIELDS
+from excel_engine import stream_result, stream_records, OUTPUT_FORMATS, RECORD_FORMATS
+from layout_rules import default_rules
+from output_writers import write_excel
+from check_excel_structure import probe_workbook
+from job_queue import JobQueue, JobQueueFull
+from resource_guard import JobGuard, ResourceLimitExceeded, check_cell_budget
+from result_cache import ResultCache, summarize_result
+from sheet_cache import SheetCache
+from result_store import ResultStore, store_available, parse_query_args, slice_json
+from batch_processor import process_batch, province_name
+from result_preview import frame_window, parse_window_args
+from instrumentation import configure_logging, init_app, new_stats, record_processing
+from workspace import WorkspaceManager, init_app as init_workspaces
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key'
-app.config['UPLOAD_FOLDER'] = tempfile.gettempdir()
+# 工作区根目录: 每个请求的上传文件和处理结果保存在其中独立的子目录里
+app.config['UPLOAD_FOLDER'] = os.environ.get('UPLOAD_FOLDER', os.path.join(tempfile.gettempdir(), 'excel_workspaces'))
+# 工作区清理: 超过存活时间或超出磁盘预算的工作区由后台线程删除
+app.config['WORKSPACE_TTL_MINUTES'] = int(os.environ.get('WORKSPACE_TTL_MINUTES', '60'))
+app.config['WORKSPACE_MAX_MB'] = int(os.environ.get('WORKSPACE_MAX_MB', '1024'))
+app.config['JANITOR_INTERVAL_SECONDS'] = int(os.environ.get('JANITOR_INTERVAL_SECONDS', '60'))
+# 上传缓冲: 小于该大小的上传保存在内存中，超过后转存到临时文件，解析器直接读取缓冲区
+app.config['UPLOAD_SPOOL_MB'] = float(os.environ.get('UPLOAD_SPOOL_MB', '4'))
 app.config['ALLOWED_EXTENSIONS'] = {'xlsx', 'xls'}
-app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024  # 限制上传文件大小为10MB
+# 提取引擎: vectorized（默认）或 stream（逐行流式读取，内存占用与工作簿大小无关）
+app.config['PROCESSING_ENGINE'] = os.environ.get('PROCESSING_ENGINE', 'vectorized')
+# Excel读取引擎: auto（默认，按文件格式和大小选择，已安装 python-calamine 时优先使用）、openpyxl、xlrd 或 calamine
+app.config['EXCEL_READER'] = os.environ.get('EXCEL_READER', 'auto')
+# 限制上传文件大小，默认10MB；使用 stream 引擎时可以安全地调大
+app.config['MAX_UPLOAD_MB'] = int(os.environ.get('MAX_UPLOAD_MB', '10'))
+app.config['MAX_CONTENT_LENGTH'] = app.config['MAX_UPLOAD_MB'] * 1024 * 1024
+# 上传预检: 先快速探查工作簿结构，无法识别的工作簿或单元格数（行数×列数）超过上限的工作簿直接拒绝，0表示不限制
+app.config['PROBE_UPLOADS'] = os.environ.get('PROBE_UPLOADS', '1') not in ('0', 'false')
+app.config['MAX_WORKBOOK_CELLS'] = int(os.environ.get('MAX_WORKBOOK_CELLS', '5000000'))
+# 单个任务的资源上限: 处理时间（秒，同步处理和后台任务都适用，应小于 WEB_TIMEOUT）和后台任务工作进程的内存（MB），0 表示不限制
+app.config['JOB_MAX_SECONDS'] = int(os.environ.get('JOB_MAX_SECONDS', '240'))
+app.config['JOB_MAX_MEMORY_MB'] = int(os.environ.get('JOB_MAX_MEMORY_MB', '2048'))
+# 单个工作簿内并行提取工作表的进程数，默认1（顺序执行）
+app.config['SHEET_WORKERS'] = int(os.environ.get('SHEET_WORKERS', '1'))
+# 后台任务模式: 处理进程数与最多排队的任务数
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', '2'))
+app.config['JOB_QUEUE_SIZE'] = int(os.environ.get('JOB_QUEUE_SIZE', '8'))
+# 任务状态目录: 多进程部署时各工作进程通过该目录共享任务记录和进度
+app.config['JOB_STATE_DIR'] = os.environ.get('JOB_STATE_DIR', os.path.join(tempfile.gettempdir(), 'excel_jobs'))
+# 批量处理: 每个批量请求的并行进程数（默认与后台任务的进程数相同）和同时处理的批量请求数，超出时返回503
+app.config['BATCH_WORKERS'] = int(os.environ.get('BATCH_WORKERS') or app.config['JOB_WORKERS'])
+app.config['BATCH_CONCURRENCY'] = int(os.environ.get('BATCH_CONCURRENCY', '1'))
+# 结果缓存: 重复上传同一工作簿时直接返回缓存的结果，超过磁盘预算时按LRU淘汰
+app.config['RESULT_CACHE_DIR'] = os.environ.get('RESULT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'excel_result_cache'))
+app.config['RESULT_CACHE_MAX_MB'] = int(os.environ.get('RESULT_CACHE_MAX_MB', '500'))
+# 增量处理: 上传修订后的工作簿时，只重新提取内容变化的工作表，其余工作表复用上次的提取结果
+app.config['INCREMENTAL_SHEETS'] = os.environ.get('INCREMENTAL_SHEETS', '1') not in ('0', 'false')
+app.config['SHEET_CACHE_DIR'] = os.environ.get('SHEET_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'excel_sheet_cache'))
+app.config['SHEET_CACHE_MAX_MB'] = int(os.environ.get('SHEET_CACHE_MAX_MB', '200'))
+# 结果库: 每个处理过的工作簿按省份追加到列式结果库，可以通过 /api/store/query 跨省份查询（需要 pyarrow）
+app.config['RESULT_STORE'] = os.environ.get('RESULT_STORE', '1') not in ('0', 'false')
+app.config['RESULT_STORE_DIR'] = os.environ.get('RESULT_STORE_DIR', os.path.join(tempfile.gettempdir(), 'excel_result_store'))
+# 进程内结果缓存: 最近处理或访问过的结果表保留在内存中（每个工作进程各自的内存预算，MB），
+# 预览翻页、重新下载和格式转换不必从缓存目录重新读取，0 表示不保留
+app.config['RESULT_MEMORY_MB'] = int(os.environ.get('RESULT_MEMORY_MB', '256'))
+# 性能分析: 设置后带请求头 X-Profile: 1 的请求会保存 cProfile 结果到该目录
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR')
+
+# 请求耗时直方图、/metrics 接口和可选的 cProfile 钩子
+init_app(app)
+
+workspaces = WorkspaceManager(app.config['UPLOAD_FOLDER'], ttl_seconds=app.config['WORKSPACE_TTL_MINUTES'] * 60,
+                              max_bytes=app.config['WORKSPACE_MAX_MB'] * 1024 * 1024,
+                              sweep_interval=app.config['JANITOR_INTERVAL_SECONDS'])
+init_workspaces(app, workspaces, spool_bytes=int(app.config['UPLOAD_SPOOL_MB'] * 1024 * 1024))
+
+result_cache = ResultCache(app.config['RESULT_CACHE_DIR'], max_bytes=app.config['RESULT_CACHE_MAX_MB'] * 1024 * 1024)
+sheet_cache = (SheetCache(app.config['SHEET_CACHE_DIR'], max_bytes=app.config['SHEET_CACHE_MAX_MB'] * 1024 * 1024)
+               if app.config['INCREMENTAL_SHEETS'] else None)
+if app.config['RESULT_STORE'] and not store_available():
+    logger.warning('未安装 pyarrow，结果库不可用')
+result_store = (ResultStore(app.config['RESULT_STORE_DIR'])
+                if app.config['RESULT_STORE'] and store_available() else None)
+result_memory = ResultMemo(max_bytes=app.config['RESULT_MEMORY_MB'] * 1024 * 1024)
+job_queue = JobQueue(max_workers=app.config['JOB_WORKERS'], max_pending=app.config['JOB_QUEUE_SIZE'],
+                     result_cache=result_cache, sheet_cache=sheet_cache, result_store=result_store,
+                     state_dir=app.config['JOB_STATE_DIR'], max_seconds=app.config['JOB_MAX_SECONDS'],
+                     max_memory_mb=app.config['JOB_MAX_MEMORY_MB'])
+batch_slots = threading.BoundedSemaphore(app.config['BATCH_CONCURRENCY'])
+
+# 版式规则（环境变量 LAYOUT_RULES 指定的规则文件 + 内置规则集）在启动时编译，规则文件有误时直接报错
+layout_rules = default_rules()
+logger.info("版式规则: %s（签名 %s）", '、'.join(rule.name for rule in layout_rules), layout_rules.signature)
 
 # 打印上传目录信息，用于调试
-print(f"上传文件将保存在: {app.config['UPLOAD_FOLDER']}")
+logger.info(f"上传文件和处理结果将保存在工作区: {app.config['UPLOAD_FOLDER']}")
 
 # 检查文件扩展名是否允许
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
-# 处理Excel数据的核心函数 - 调用优化后的process_excel_data函数
-def process_excel(file_path):
+# 是否以后台任务方式处理上传（表单字段或查询参数 async=1）
+def wants_async():
+    return (request.form.get('async') or request.args.get('async')) in ('1', 'true')
+
+# 处理Excel数据的核心函数 - 在内存中完成 解析 → 转换 → 写出，由 excel_engine 统一实现
+# source 为文件路径或上传缓冲区；返回 (处理结果DataFrame, 原始工作簿结构统计, 处理统计)，工作簿只解析一次
+# 每处理完一个工作表检查一次处理时间，超过 JOB_MAX_SECONDS 时抛出 ResourceLimitExceeded
+def process_excel(source, output_path):
+    stats = new_stats(app.config['PROCESSING_ENGINE'])
     try:
-        # 创建临时输出文件路径
-        temp_output = os.path.join(app.config['UPLOAD_FOLDER'], f"temp_{os.path.basename(file_path)}")
-        
-        # 调用优化后的process_excel_data函数
-        process_excel_data(file_path, temp_output)
-        
-        # 读取处理后的结果
-        result_df = pd.read_excel(temp_output)
-        
-        # 尝试删除临时文件
-        try:
-            if os.path.exists(temp_output):
-                os.remove(temp_output)
-        except:
-            pass
-        
-        return result_df
+        result = process_workbook(source, output_path, index=True, engine=app.config['PROCESSING_ENGINE'],
+                                  reader=app.config['EXCEL_READER'], sheet_workers=app.config['SHEET_WORKERS'],
+                                  sheet_cache=sheet_cache, max_seconds=app.config['JOB_MAX_SECONDS'],
+                                  # 未经过上传预检时，在完整解析之前检查单元格数
+                                  max_cells=None if app.config['PROBE_UPLOADS'] else app.config['MAX_WORKBOOK_CELLS'],
+                                  stats=stats)
     except Exception as e:
-        print(f"处理Excel文件时出错: {e}")
+        logger.error(f"处理Excel文件时出错: {e}")
+        record_processing(stats, status='failed')
         raise
+    record_processing(stats)
+    return result
+
+def probe_upload(stream):
+    """
+    上传预检: 快速探查上传的工作簿，判断是否值得交给处理流程
+
+    返回: (探查结果, 拒绝原因, HTTP状态码)；可以处理时拒绝原因为None
+    """
+    try:
+        probe = probe_workbook(stream, reader=app.config['EXCEL_READER'])
+    except Exception as e:
+        return None, f"无法读取Excel文件: {e}", 400
+    finally:
+        stream.seek(0)
+    logger.info(f"预检: {probe['totals']['sheets']} 个工作表，{probe['totals']['tables']} 个表格区域，"
+                f"{probe['totals']['cells']} 个单元格，预计处理 {probe['estimate']['seconds']} 秒，"
+                f"耗时 {probe['probe_seconds']} 秒")
+    if not probe['ok']:
+        return probe, probe['issues'][-1], 422
+    limit = app.config['MAX_WORKBOOK_CELLS']
+    if limit and probe['totals']['cells'] > limit:
+        return probe, f"工作簿太大: 共 {probe['totals']['cells']} 个单元格，上限为 {limit}", 413
+    return probe, None, 200
+
+def store_result(province, result_id, result_df=None):
+    """
+    把处理结果追加到结果库，结果已在库中时跳过；结果库只是附加的查询副本，写入失败只记录日志
+
+    参数:
+    result_df: 处理结果DataFrame，为None时从结果缓存读取
+    """
+    if result_store is None or result_store.contains(province, result_id):
+        return
+    try:
+        result_store.append(province, result_id, result_df if result_df is not None else result_cache.load_result(result_id))
+    except Exception as e:
+        logger.error(f'写入结果库失败: {province}: {e}')
 
 @app.route('/', methods=['GET', 'POST'])
 def upload_file():
@@ -49,7 +175,7 @@ def upload_file():
             # 检查是否有文件部分
             if 'file' not in request.files:
                 flash('没有文件部分，请确保表单正确提交')
-                print('错误: 请求中没有文件部分')
+                logger.warning('请求中没有文件部分')
                 return redirect(request.url)
             
             file = request.files['file']
@@ -57,132 +183,416 @@ def upload_file():
             # 如果用户没有选择文件
             if file.filename == '':
                 flash('没有选择文件，请选择一个Excel文件上传')
-                print('错误: 未选择文件')
+                logger.warning('未选择文件')
                 return redirect(request.url)
             
             # 检查文件扩展名
             if not allowed_file(file.filename):
                 flash('不支持的文件格式，请上传.xlsx或.xls文件')
-                print(f'错误: 文件格式不支持: {file.filename}')
+                logger.warning(f'文件格式不支持: {file.filename}')
                 return redirect(request.url)
             
-            # 文件有效，继续处理
+            # 文件有效，继续处理；每个上传使用独立的工作区，同名文件互不覆盖
             original_filename = file.filename  # 保存原始文件名
-            filename = secure_filename(original_filename)  # 用于保存的安全文件名
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            print(f'原始文件名: {original_filename}, 保存文件名: {filename}')
+            # 写入结果库时使用的省份名称，默认取自文件名
+            province = request.form.get('province') or province_name(original_filename)
+            workspace = workspaces.create()
+            logger.info(f'原始文件名: {original_filename}, 工作区: {workspace.id}')
             
-            # 保存文件
-            try:
-                file.save(filepath)
-                print(f'成功上传文件: {filepath}')
-            except Exception as save_error:
-                flash(f"保存文件时出错: {str(save_error)}")
-                print(f'错误: 保存文件失败: {save_error}')
-                return redirect(request.url)
+            # 保存处理后的文件，使用原始文件名的信息
+            name_without_ext = os.path.splitext(original_filename)[0]
+            ext = os.path.splitext(original_filename)[1]
+            output_filename = f"processed_{name_without_ext}{ext}"
+            output_secure_filename = secure_filename(output_filename)  # 安全处理输出文件名
+            output_filepath = workspace.file_path(output_secure_filename)
             
-            # 检查文件是否成功保存
-            if not os.path.exists(filepath):
-                flash('文件上传失败，请重试')
-                print(f'错误: 文件保存后不存在: {filepath}')
-                return redirect(request.url)
+            # 上传内容在缓冲区中（小文件在内存，大文件在临时文件），直接按内容查找缓存的处理结果
+            cache_key = result_cache.make_key(file.stream, app.config['PROCESSING_ENGINE'])
+            cached = result_cache.get(cache_key)
+            if cached:
+                shutil.copyfile(cached['output_path'], output_filepath)
+                logger.info(f'命中结果缓存: {cache_key}')
+            
+            # 未命中缓存时先预检，在占用处理进程之前拒绝无法识别或过大的工作簿
+            if not cached and app.config['PROBE_UPLOADS']:
+                probe, rejection, status = probe_upload(file.stream)
+                if rejection:
+                    logger.warning(f'预检拒绝 {original_filename}: {rejection}')
+                    shutil.rmtree(workspace.path, ignore_errors=True)
+                    if wants_async():
+                        return jsonify({'error': rejection, 'probe': probe}), status
+                    flash(rejection)
+                    return redirect(request.url)
+            
+            # 后台任务模式: 立即返回任务ID，由 /jobs/<job_id> 查询进度和下载链接
+            if wants_async():
+                if cached:
+                    store_result(province, cache_key)
+                    job_id = job_queue.add_completed(output_filepath, cached['meta'],
+                                                     result_id=cache_key,
+                                                     original_filename=original_filename,
+                                                     display_filename=output_filename)
+                    return jsonify({'job_id': job_id, 'status_url': url_for('job_status', job_id=job_id)}), 202
+                # 后台任务在其他进程中处理，需要把上传内容保存到工作区
+                filepath = workspace.file_path(f"upload{ext.lower()}")
+                try:
+                    file.save(filepath)
+                except Exception as save_error:
+                    logger.error(f'保存文件失败: {save_error}')
+                    return jsonify({'error': f'保存文件时出错: {save_error}'}), 500
+                try:
+                    job_id = job_queue.submit(filepath, output_filepath,
+                                              engine=app.config['PROCESSING_ENGINE'],
+                                              sheet_workers=app.config['SHEET_WORKERS'],
+                                              cache_key=cache_key,
+                                              province=province,
+                                              reader=app.config['EXCEL_READER'],
+                                              max_cells=None if app.config['PROBE_UPLOADS'] else app.config['MAX_WORKBOOK_CELLS'],
+                                              result_id=cache_key,
+                                              original_filename=original_filename,
+                                              display_filename=output_filename)
+                except JobQueueFull as e:
+                    logger.warning(f'提交后台任务失败: {e}')
+                    return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
+                logger.info(f'已提交后台任务: {job_id}')
+                return jsonify({'job_id': job_id, 'status_url': url_for('job_status', job_id=job_id)}), 202
             
             # 处理Excel文件
             try:
-                print(f'开始处理文件: {filepath}')
-                result_df = process_excel(filepath)
-                
-                # 保存处理后的文件，使用原始文件名的信息
-                name_without_ext = os.path.splitext(original_filename)[0]
-                ext = os.path.splitext(original_filename)[1]
-                output_filename = f"processed_{name_without_ext}{ext}"
-                output_secure_filename = secure_filename(output_filename)  # 安全处理输出文件名
-                output_filepath = os.path.join(app.config['UPLOAD_FOLDER'], output_secure_filename)
-                
-                result_df.to_excel(output_filepath, index=True)
-                print(f'成功处理并保存结果文件: {output_filepath}')
-                print(f'原始文件名: {original_filename}, 下载文件名: {output_filename}, 保存文件名: {output_secure_filename}')
-                
-                # 将DataFrame转换为HTML表格，用于预览
-                html_table = result_df.to_html(classes='table table-striped table-hover', index=True, na_rep='-')
-                
-                # 获取处理后的文件大小
-                file_size = os.path.getsize(output_filepath) / 1024  # KB
-                
-                # 获取处理前后的行数和列数
-                original_df = pd.read_excel(filepath)
-                original_rows, original_cols = original_df.shape
-                processed_rows, processed_cols = result_df.shape
+                if cached:
+                    result_df = result_memory.get_or_load(cache_key, result_cache.load_result)
+                    summary = cached['meta']
+                else:
+                    logger.info(f'开始处理文件: {original_filename}')
+                    result_df, workbook_stats, stats = process_excel(file.stream, output_filepath)
+                    result_memory.put(cache_key, result_df)
+                    logger.info(f'成功处理并保存结果文件: {output_filepath}')
+                    
+                    # 获取处理后的文件大小、处理前后的行数和列数（原始数据的形状来自处理时的同一次解析）
+                    summary = summarize_result(result_df, workbook_stats, output_filepath)
+                    result_cache.put(cache_key, result_df, output_filepath, summary)
+                store_result(province, cache_key, result_df)
+                logger.debug(f'原始文件名: {original_filename}, 下载文件名: {output_filename}, 保存文件: {output_filepath}')
                 
-                # 传递处理结果到success页面
+                # 传递处理结果到success页面；预览表格由页面通过 /api/results/<id>/preview 按窗口加载
                 return render_template('success.html', 
                                       original_filename=original_filename,  # 使用原始文件名
-                                      output_filename=output_secure_filename,  # 使用安全保存的文件名用于下载
+                                      output_filename=workspace.relative(output_secure_filename),  # 工作区内的保存文件，用于下载
                                       display_filename=output_filename,  # 用于在页面上显示的文件名
-                                      html_table=html_table,
-                                      file_size=round(file_size, 2),
-                                      original_rows=original_rows,
-                                      original_cols=original_cols,
-                                      processed_rows=processed_rows,
-                                      processed_cols=processed_cols)
+                                      result_id=cache_key,  # 下载其他格式时直接使用缓存的结果
+                                      preview_api=url_for('result_window', result_id=cache_key),
+                                      file_size=summary['file_size'],
+                                      original_rows=summary['original_rows'],
+                                      original_cols=summary['original_cols'],
+                                      processed_rows=summary['processed_rows'],
+                                      processed_cols=summary['processed_cols'])
                 
             except pd.errors.EmptyDataError:
                 flash('Excel文件为空，请上传有效的Excel文件')
-                print('错误: Excel文件为空')
+                logger.warning('Excel文件为空')
                 return redirect(request.url)
             except pd.errors.ParserError:
                 flash('解析Excel文件时出错，文件格式可能不正确')
-                print('错误: Excel文件解析失败')
+                logger.error('Excel文件解析失败')
                 return redirect(request.url)
             except Exception as e:
                 flash(f"处理文件时出错: {str(e)}")
-                print(f'错误: 处理Excel文件时出错: {e}')
+                logger.error(f'处理Excel文件时出错: {e}')
                 return redirect(request.url)
-        except request.exceptions.RequestEntityTooLarge:
-            flash('文件太大，请上传小于10MB的文件')
-            print('错误: 文件大小超过10MB限制')
+        except RequestEntityTooLarge:
+            flash(f"文件太大，请上传小于{app.config['MAX_UPLOAD_MB']}MB的文件")
+            logger.warning(f"文件大小超过{app.config['MAX_UPLOAD_MB']}MB限制")
             return redirect(request.url)
         except Exception as general_error:
             flash(f"上传过程中发生错误: {str(general_error)}")
-            print(f'错误: 上传过程中的一般错误: {general_error}')
+            logger.error(f'上传过程中的一般错误: {general_error}')
             return redirect(request.url)
     
     # 渲染上传页面
     return render_template('index.html')
 
+@app.route('/api/probe', methods=['POST'])
+def probe_api():
+    """快速探查上传的工作簿: 表格区域、县域表头、行范围和处理规模估算，不执行完整处理"""
+    file = request.files.get('file')
+    if file is None or file.filename == '':
+        return jsonify({'error': '没有选择文件，请通过 file 字段上传一个Excel文件'}), 400
+    if not allowed_file(file.filename):
+        return jsonify({'error': '不支持的文件格式，请上传.xlsx或.xls文件'}), 400
+    probe, rejection, status = probe_upload(file.stream)
+    if probe is None:
+        return jsonify({'error': rejection}), status
+    probe['accepted'] = rejection is None
+    probe['rejection'] = rejection
+    return jsonify(probe)
+
+@app.route('/api/records', methods=['POST'])
+def records_api():
+    """
+    长表格式导出: 把上传的工作簿按 (county, metric, unit, value, sheet) 逐条流式返回，参数 format=csv（默认）或 ndjson
+
+    记录边扫描边编码、分块写入响应，不构建结果表，也不经过结果缓存和后台任务；
+    响应开始后出现的错误（如超过 JOB_MAX_SECONDS）只能中断传输，记录在日志中
+    """
+    file = request.files.get('file')
+    if file is None or file.filename == '':
+        return jsonify({'error': '没有选择文件，请通过 file 字段上传一个Excel文件'}), 400
+    if not allowed_file(file.filename):
+        return jsonify({'error': '不支持的文件格式，请上传.xlsx或.xls文件'}), 400
+    output_format = request.args.get('format', 'csv').lower()
+    if output_format not in RECORD_FORMATS:
+        return jsonify({'error': f"不支持的记录格式: {output_format}，可选: {', '.join(RECORD_FORMATS)}"}), 400
+
+    # 响应开始之前完成预检，无法识别或过大的工作簿仍然返回明确的错误状态
+    if app.config['PROBE_UPLOADS']:
+        probe, rejection, status = probe_upload(file.stream)
+        if rejection:
+            logger.warning(f'预检拒绝 {file.filename}: {rejection}')
+            return jsonify({'error': rejection, 'probe': probe}), status
+    else:
+        try:
+            check_cell_budget(file.stream, app.config['MAX_WORKBOOK_CELLS'], reader=app.config['EXCEL_READER'])
+        except ResourceLimitExceeded as e:
+            return jsonify({'error': str(e)}), 413
+        finally:
+            file.stream.seek(0)
+
+    # 视图函数返回时请求（连同上传缓冲区）即被关闭，上传内容先保存到工作区，传输结束后删除
+    workspace = workspaces.create()
+    filepath = workspace.file_path('upload' + os.path.splitext(file.filename)[1].lower())
+    file.save(filepath)
+    filename = file.filename
+
+    def generate():
+        try:
+            with JobGuard(max_seconds=app.config['JOB_MAX_SECONDS']) as guard:
+                records = iter_records(filepath, reader=app.config['EXCEL_READER'],
+                                       progress=lambda done, total, sheet_name: guard.check())
+                yield from stream_records(records, RECORD_FIELDS, output_format)
+        except Exception as e:
+            logger.error(f'长表格式导出中断: {filename}: {e}')
+            raise
+        finally:
+            shutil.rmtree(workspace.path, ignore_errors=True)
+
+    ext, mimetype = RECORD_FORMATS[output_format]
+    download_name = os.path.splitext(filename)[0] + '_records' + ext
+    logger.info(f'长表格式导出: {filename}, 格式: {output_format}, 工作区: {workspace.id}')
+    return Response(generate(), mimetype=mimetype,
+                    headers={'Content-Disposition': f"attachment; filename*=UTF-8''{quote(download_name)}"})
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    # 查询后台任务的状态、逐工作表进度，完成后附带下载链接
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在或已过期'}), 404
+    
+    response = {
+        'job_id': job_id,
+        'state': job['state'],
+        'progress': job.get('progress'),
+        'result': job['result'],
+        'error': job['error'],
+    }
+    if job['state'] == 'done':
+        output_path = os.path.relpath(job['output_path'], workspaces.root).replace(os.sep, '/')
+        response['download_url'] = url_for('download_file',
+                                           filename=output_path,
+                                           display_name=job['display_filename'],
+                                           result=job.get('result_id'))
+    return jsonify(response)
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    # 取消后台任务: 排队中的任务立即取消（200），处理中的任务会在短时间内中断（202），已结束的任务返回409
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': '任务不存在或已过期'}), 404
+    if job['state'] not in ('queued', 'running'):
+        return jsonify({'job_id': job_id, 'state': job['state'], 'error': '任务已结束，无法取消'}), 409
+    
+    job = job_queue.cancel(job_id)
+    response = {
+        'job_id': job_id,
+        'state': job['state'],
+        'cancel_requested': job.get('cancel_requested', False),
+        'status_url': url_for('job_status', job_id=job_id),
+    }
+    return jsonify(response), 200 if job['state'] == 'cancelled' else 202
+
+@app.route('/batch', methods=['POST'])
+def batch_upload():
+    # 一次上传多个省份的工作簿（表单字段 files），并行处理后合并为一张带'省份'列的结果表
+    files = [f for f in request.files.getlist('files') if f and f.filename]
+    if not files:
+        return jsonify({'error': '没有选择文件，请通过 files 字段上传一个或多个Excel文件'}), 400
+    
+    unsupported = [f.filename for f in files if not allowed_file(f.filename)]
+    if unsupported:
+        return jsonify({'error': f"不支持的文件格式: {', '.join(unsupported)}"}), 400
+    
+    # 与后台任务队列一样有界: 同时处理的批量请求已达上限时让客户端稍后重试
+    if not batch_slots.acquire(blocking=False):
+        return jsonify({'error': f"批量处理繁忙（最多同时处理 {app.config['BATCH_CONCURRENCY']} 个批量请求），请稍后重试"}), \
+            503, {'Retry-After': '5'}
+    try:
+        return _process_batch_upload(files)
+    finally:
+        batch_slots.release()
+
+def _process_batch_upload(files):
+    # 批量上传使用独立的工作区，省份名称取自原始文件名
+    workspace = workspaces.create()
+    saved_paths = []
+    provinces = {}
+    for i, f in enumerate(files):
+        ext = os.path.splitext(f.filename)[1].lower()
+        path = workspace.file_path(f"input_{i}{ext}")
+        f.save(path)
+        saved_paths.append(path)
+        provinces[path] = province_name(f.filename)
+    logger.info(f'批量处理 {len(saved_paths)} 个文件: {list(provinces.values())}')
+    
+    # 每个文件都受与后台任务相同的资源上限约束（批量上传的文件不经过上传预检）
+    limits = {'max_cells': app.config['MAX_WORKBOOK_CELLS'], 'max_seconds': app.config['JOB_MAX_SECONDS'],
+              'max_memory_mb': app.config['JOB_MAX_MEMORY_MB']}
+    combined, summary = process_batch(saved_paths, engine=app.config['PROCESSING_ENGINE'],
+                                      max_workers=app.config['BATCH_WORKERS'], provinces=provinces,
+                                      reader=app.config['EXCEL_READER'], limits=limits)
+    # 输入文件只在处理期间需要；删除前计算内容键，作为各省结果在结果库中的结果ID
+    if result_store is not None:
+        for path, item in zip(saved_paths, summary):
+            if item['status'] == 'ok':
+                province_rows = combined[combined['省份'] == item['province']].drop(columns='省份')
+                store_result(item['province'], result_cache.make_key(path, app.config['PROCESSING_ENGINE']), province_rows)
+    for path in saved_paths:
+        os.remove(path)
+    
+    # 汇总中不暴露服务器上的保存路径
+    for item, f in zip(summary, files):
+        item['file'] = f.filename
+    succeeded = sum(1 for item in summary if item['status'] == 'ok')
+    response = {
+        'succeeded': succeeded,
+        'failed': len(summary) - succeeded,
+        'rows': len(combined),
+        'summary': summary,
+    }
+    if succeeded:
+        output_filename = 'batch.xlsx'
+        write_excel(combined, workspace.file_path(output_filename), index=False)
+        response['download_url'] = url_for('download_file', filename=workspace.relative(output_filename),
+                                           display_name='批量处理结果.xlsx')
+    return jsonify(response)
+
+@app.route('/api/results/<result_id>/preview')
+def result_window(result_id):
+    # 分页预览: 返回结果表的一个 行 × 列 窗口（JSON），参数 row_offset/row_limit/col_offset/col_limit
+    try:
+        result_df = result_memory.get_or_load(result_id, result_cache.load_result)
+    except (OSError, ValueError):
+        return jsonify({'error': '结果不存在或已过期'}), 404
+    return jsonify(frame_window(result_df, **parse_window_args(request.args)))
+
+@app.route('/cache/stats')
+def cache_stats():
+    # 结果缓存的命中/未命中次数与磁盘占用，用于确定缓存大小；sheets 为增量处理的工作表级缓存，
+    # workspaces 为请求工作区的数量与磁盘占用，memory 为当前进程内保留的结果表
+    stats = result_cache.stats()
+    stats['sheets'] = sheet_cache.stats() if sheet_cache is not None else None
+    stats['workspaces'] = workspaces.stats()
+    stats['store'] = result_store.stats() if result_store is not None else None
+    stats['memory'] = result_memory.stats()
+    return jsonify(stats)
+
+@app.route('/api/store')
+def store_index():
+    # 结果库中各省份的当前结果: 记录数、县域数、指标数和写入时间
+    if result_store is None:
+        return jsonify({'error': '结果库未启用（需要安装 pyarrow）'}), 503
+    return jsonify([{
+        'province': entry['province'],
+        'result_id': entry['result_id'],
+        'records': entry['records'],
+        'counties': len(entry['counties']),
+        'metrics': len(entry['metrics']),
+        'stored_at': entry['stored_at'],
+    } for entry in result_store.entries()])
+
+@app.route('/api/store/query')
+def store_query():
+    # 跨省份查询 县域 × 指标 切片，参数 province / county / metric 可以重复或用逗号分隔；
+    # format=long 时返回 (省份, 县域, 指标, 取值) 记录列表
+    if result_store is None:
+        return jsonify({'error': '结果库未启用（需要安装 pyarrow）'}), 503
+    records, truncated = result_store.query(**parse_query_args(request.args))
+    if request.args.get('format') == 'long':
+        return jsonify({'records': records.to_dict('records'), 'truncated': truncated})
+    return jsonify(slice_json(records, truncated))
+
 @app.route('/test_upload', methods=['GET'])
 def test_upload_page():
     return "后端服务运行正常，文件上传功能已修复。请返回首页测试上传功能。"
 
-@app.route('/download/<filename>')
+@app.route('/download/<path:filename>')
 def download_file(filename):
     try:
-        # 安全检查文件名，防止目录遍历攻击
-        safe_filename = secure_filename(filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], safe_filename)
+        # filename 为 <工作区ID>/<文件名>，只接受工作区内的文件，防止目录遍历攻击
+        file_path = workspaces.resolve(filename)
         
-        # 检查文件是否存在
-        if not os.path.exists(file_path):
-            print(f'错误: 下载文件不存在: {file_path}')
+        # 检查文件是否存在（工作区可能已过期被清理）
+        if file_path is None:
+            logger.warning(f'下载文件不存在: {filename}')
             flash('下载文件不存在或已被删除')
-            return redirect(url_for('index'))
+            return redirect(url_for('upload_file'))
+        safe_filename = os.path.basename(file_path)
         
         # 从URL参数获取原始文件名，如果有的话
         display_name = request.args.get('display_name', safe_filename)
-        print(f'下载文件: {file_path}, 显示名称: {display_name}')
         
-        return send_from_directory(app.config['UPLOAD_FOLDER'], safe_filename, 
-                                  as_attachment=True, 
-                                  download_name=display_name)
+        # 其他格式（csv / parquet / feather）由结果表直接编码并流式写入响应，不在临时目录落盘
+        output_format = request.args.get('format', 'xlsx').lower()
+        if output_format not in OUTPUT_FORMATS:
+            flash(f"不支持的下载格式: {output_format}，可选: {', '.join(OUTPUT_FORMATS)}")
+            return redirect(url_for('upload_file'))
+        if output_format != 'xlsx':
+            result_df = load_result_frame(request.args.get('result'), file_path)
+            if result_df is None:
+                flash('下载文件不存在或已被删除')
+                return redirect(url_for('upload_file'))
+            ext, mimetype = OUTPUT_FORMATS[output_format]
+            download_name = os.path.splitext(display_name)[0] + ext
+            logger.info(f'下载文件: {safe_filename}, 格式: {output_format}, 显示名称: {download_name}')
+            return Response(stream_result(result_df, output_format), mimetype=mimetype,
+                            headers={'Content-Disposition': f"attachment; filename*=UTF-8''{quote(download_name)}"})
+        
+        logger.info(f'下载文件: {file_path}, 显示名称: {display_name}')
+        return send_file(file_path, as_attachment=True, download_name=display_name)
     except Exception as e:
-        print(f'下载文件时出错: {str(e)}')
+        logger.error(f'下载文件时出错: {str(e)}')
         flash(f'下载文件时出错: {str(e)}')
-        return redirect(url_for('index'))
+        return redirect(url_for('upload_file'))
+
+# 读取要转换格式的结果表: 优先使用进程内保留的结果表和结果缓存，否则读回已保存的xlsx输出（同样保留在内存中）
+def load_result_frame(result_id, file_path):
+    if result_id:
+        try:
+            return result_memory.get_or_load(result_id, result_cache.load_result)
+        except (OSError, ValueError):
+            logger.info(f'结果缓存中没有: {result_id}，改为读取输出文件')
+    if os.path.exists(file_path):
+        return result_memory.get_or_load(file_path, lambda path: pd.read_excel(path, index_col=0))
+    return None
 
 @app.route('/preview')
 def preview_data():
-    # 预览页面，可能需要根据实际需求调整
-    return render_template('preview.html')
+    # 预览页面: 带 result 参数时按窗口加载该结果，例如 /preview?result=<result_id>&filename=<输出文件名>
+    result_id = request.args.get('result')
+    filename = request.args.get('filename')
+    preview_api = url_for('result_window', result_id=result_id) if result_id else None
+    download_url = url_for('download_file', filename=filename) if filename else None
+    return render_template('preview.html', preview_api=preview_api, download_url=download_url)
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
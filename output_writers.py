@@ -0,0 +1,194 @@
+import io
+import csv
+import json
+import datetime
+import pandas as pd
+from openpyxl import Workbook
+
+try:
+    import xlsxwriter
+except ImportError:  # 可选依赖，未安装时使用 openpyxl 的只写模式
+    xlsxwriter = None
+
+# 支持的输出格式: 格式名 → (扩展名, MIME类型)
+OUTPUT_FORMATS = {
+    'xlsx': ('.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'csv': ('.csv', 'text/csv'),
+    'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+    'feather': ('.feather', 'application/vnd.apache.arrow.file'),
+}
+
+# 长表格式记录的流式输出格式: 格式名 → (扩展名, MIME类型)
+RECORD_FORMATS = {
+    'csv': ('.csv', 'text/csv'),
+    'ndjson': ('.ndjson', 'application/x-ndjson'),
+}
+
+# 逐块转换DataFrame行时每块的行数，限制写出过程中的临时内存
+CHUNK_ROWS = 1000
+
+
+def write_excel(result_df, target, index=False):
+    """
+    将结果表写出为xlsx
+
+    逐行写出，写出过程的内存占用与表格大小无关: 安装了 xlsxwriter 时使用其
+    constant_memory 模式，否则使用 openpyxl 的只写模式。两者生成的单元格内容与
+    DataFrame.to_excel 一致（表头不加粗）
+
+    参数:
+    result_df: 处理结果DataFrame
+    target: 输出文件路径或可写的二进制文件对象（如 io.BytesIO）
+    index: 是否写出行索引
+    """
+    rows = _iter_excel_rows(result_df, index)
+    if xlsxwriter is not None:
+        workbook = xlsxwriter.Workbook(target, {
+            'constant_memory': True,
+            'default_date_format': 'yyyy-mm-dd hh:mm:ss',
+            'nan_inf_to_errors': True,
+        })
+        worksheet = workbook.add_worksheet('Sheet1')
+        for row_number, row in enumerate(rows):
+            for col_number, value in enumerate(row):
+                if value is not None:
+                    worksheet.write(row_number, col_number, value)
+        workbook.close()
+    else:
+        workbook = Workbook(write_only=True)
+        worksheet = workbook.create_sheet('Sheet1')
+        for row in rows:
+            worksheet.append(row)
+        workbook.save(target)
+
+
+def _iter_excel_rows(result_df, index):
+    """按行产出要写入Excel的单元格值（表头 + 数据），空值为None"""
+    header = [None if name is None else str(name) for name in result_df.columns]
+    yield ([result_df.index.name] + header) if index else header
+
+    for start in range(0, len(result_df), CHUNK_ROWS):
+        chunk = result_df.iloc[start:start + CHUNK_ROWS]
+        if index:
+            chunk = chunk.reset_index()
+        # 转换为Python原生对象，空值统一为None
+        values = chunk.astype(object).where(chunk.notna(), None)
+        yield from values.to_numpy().tolist()
+
+
+def write_csv(result_df, target, index=False):
+    """
+    将结果表写出为CSV（UTF-8带BOM，Excel可直接打开中文内容）
+
+    参数:
+    target: 输出文件路径或可写的二进制文件对象
+    """
+    result_df.to_csv(target, index=index, encoding='utf-8-sig')
+
+
+def write_parquet(result_df, target, index=False):
+    """将结果表写出为Parquet（需要 pyarrow），混合类型的列转换为文本"""
+    _columnar_frame(result_df).to_parquet(target, index=index)
+
+
+def write_feather(result_df, target, index=False):
+    """将结果表写出为Feather（需要 pyarrow），混合类型的列转换为文本"""
+    frame = _columnar_frame(result_df)
+    if index:
+        frame = frame.reset_index()
+    frame.reset_index(drop=True).to_feather(target)
+
+
+def _columnar_frame(result_df):
+    """
+    列式格式要求每列类型一致: 同时含有数值和文本（如'-'、'…'）的列转换为文本，
+    空值保持为空
+    """
+    frame = result_df.copy()
+    for column in frame.columns:
+        if frame[column].dtype == object and pd.api.types.infer_dtype(frame[column], skipna=True).startswith('mixed'):
+            frame[column] = frame[column].map(lambda value: value if pd.isna(value) else str(value))
+    return frame
+
+
+WRITERS = {
+    'xlsx': write_excel,
+    'csv': write_csv,
+    'parquet': write_parquet,
+    'feather': write_feather,
+}
+
+
+def write_result(result_df, target, output_format='xlsx', index=False):
+    """按指定格式写出结果表"""
+    if output_format not in WRITERS:
+        raise ValueError(f"不支持的输出格式: {output_format}，可选: {', '.join(WRITERS)}")
+    WRITERS[output_format](result_df, target, index=index)
+
+
+def stream_result(result_df, output_format='xlsx', index=False, chunk_size=64 * 1024):
+    """
+    按指定格式生成结果文件的字节块，用于直接写入HTTP响应，不在临时目录中落盘
+
+    CSV逐块编码，首个字节块无需等待整张表编码完成；xlsx/Parquet/Feather 为整体容器格式，
+    在内存中生成后分块返回
+    """
+    if output_format == 'csv':
+        for start in range(0, max(len(result_df), 1), CHUNK_ROWS):
+            chunk = result_df.iloc[start:start + CHUNK_ROWS]
+            text = chunk.to_csv(index=index, header=(start == 0))
+            yield (('\ufeff' + text) if start == 0 else text).encode('utf-8')
+        return
+
+    buffer = io.BytesIO()
+    write_result(result_df, buffer, output_format, index=index)
+    data = buffer.getbuffer()
+    for start in range(0, len(data), chunk_size):
+        yield bytes(data[start:start + chunk_size])
+
+
+def stream_records(records, fields, output_format='csv', chunk_rows=CHUNK_ROWS):
+    """
+    把长表格式的记录（元组，字段顺序同 fields）编码为CSV或NDJSON字节块，用于分块传输的HTTP响应
+
+    CSV（UTF-8带BOM）的表头在读取第一条记录之前产出；之后每 chunk_rows 条记录产出一块，
+    记录本身不在内存中累积。NDJSON 每行一个JSON对象，日期时间转换为ISO格式文本，空值为null
+
+    参数:
+    records: 记录的可迭代对象，如 data_processor.iter_records
+    fields: 字段名，如 data_processor.RECORD_FIELDS
+    """
+    if output_format not in RECORD_FORMATS:
+        raise ValueError(f"不支持的记录格式: {output_format}，可选: {', '.join(RECORD_FORMATS)}")
+
+    buffer = io.StringIO()
+    if output_format == 'csv':
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerow(fields)
+        yield ('\ufeff' + buffer.getvalue()).encode('utf-8')
+        encode = writer.writerow
+    else:
+        def encode(record):
+            buffer.write(json.dumps(dict(zip(fields, record)), ensure_ascii=False, default=_json_value))
+            buffer.write('\n')
+
+    pending = 0
+    buffer.seek(0)
+    buffer.truncate()
+    for record in records:
+        encode(record)
+        pending += 1
+        if pending == chunk_rows:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if pending:
+        yield buffer.getvalue().encode('utf-8')
+
+
+def _json_value(value):
+    """JSON不支持的单元格值: 日期时间转换为ISO格式，其他转换为文本"""
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
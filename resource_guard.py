@@ -0,0 +1,151 @@
+import os
+import time
+import signal
+import logging
+import threading
+from check_excel_structure import probe_workbook
+
+logger = logging.getLogger(__name__)
+
+# 看门狗线程检查处理时间、内存和取消标记的间隔（秒）
+POLL_SECONDS = 0.2
+# 看门狗通知主线程中断处理时使用的信号（Windows 上没有，退回到每个工作表检查一次）
+INTERRUPT_SIGNAL = getattr(signal, 'SIGUSR1', None)
+
+
+class ResourceLimitExceeded(Exception):
+    """任务超出资源预算（单元格数、处理时间或内存）"""
+
+
+class JobCancelled(Exception):
+    """任务在排队或处理过程中被取消"""
+
+
+class JobGuard:
+    """
+    单个处理任务的资源守护（上下文管理器）: 处理时间上限、内存上限和取消
+
+    - 处理时间和取消: 由 check() 在每处理完一个工作表时检查，超时或被取消时抛出
+      ResourceLimitExceeded / JobCancelled。interrupt 为True时另有看门狗线程每 POLL_SECONDS 秒检查一次，
+      并向主线程发送信号，在主线程当前执行的位置抛出异常，单个很大的工作表也能被中断
+    - 内存: 任务期间进程的常驻内存（RSS）比开始时增加超过 max_memory_mb 时以 ResourceLimitExceeded 结束任务，
+      与处理时间一样由 check() 和看门狗线程检查（仅 Linux）。不限制内存分配本身: 虚拟内存上限会让
+      calamine 等原生扩展在分配失败时直接终止整个进程，而不是抛出 MemoryError；看门狗的中断
+      要等正在执行的单个原生调用返回后才生效
+
+    参数:
+    max_seconds: 处理时间上限（秒），None 或 0 表示不限制
+    max_memory_mb: 内存上限（MB），None 或 0 表示不限制
+    cancelled: 可选的函数，返回True表示任务已被取消
+    interrupt: 是否由看门狗中断主线程；只应在专用的工作进程中开启（需要占用 INTERRUPT_SIGNAL 信号，
+               Web服务的进程可能已经使用该信号），不在主线程中或系统不支持时自动关闭
+    """
+
+    def __init__(self, max_seconds=None, max_memory_mb=None, cancelled=None, interrupt=False):
+        self.max_seconds = max_seconds or None
+        self.max_memory_mb = max_memory_mb or None
+        self.cancelled = cancelled
+        self.started = None
+        self._error = None
+        self._active = False
+        self._stop = threading.Event()
+        self._watchdog = None
+        self._previous_handler = None
+        self._memory_base = None
+        self._interrupt = (interrupt and INTERRUPT_SIGNAL is not None and hasattr(signal, 'pthread_kill')
+                           and threading.current_thread() is threading.main_thread())
+
+    def __enter__(self):
+        self.started = time.monotonic()
+        self._active = True
+        if self.max_memory_mb:
+            self._memory_base = _resident_bytes()
+        if self._interrupt and (self.max_seconds or self._memory_base is not None or self.cancelled is not None):
+            self._previous_handler = signal.signal(INTERRUPT_SIGNAL, self._on_signal)
+            self._watchdog = threading.Thread(target=self._watch, args=(threading.main_thread().ident,),
+                                              name='job-guard', daemon=True)
+            self._watchdog.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # 先停用信号处理，之后到达的信号不再中断清理过程
+        self._active = False
+        self._stop.set()
+        if self._watchdog is not None:
+            self._watchdog.join()
+        if self._previous_handler is not None:
+            signal.signal(INTERRUPT_SIGNAL, self._previous_handler)
+        if exc_type is not None and issubclass(exc_type, MemoryError) and self.max_memory_mb:
+            raise ResourceLimitExceeded(f"处理超出内存上限: 任务最多使用 {self.max_memory_mb} MB 内存") from exc_value
+        return False
+
+    @property
+    def elapsed(self):
+        """任务已运行的秒数"""
+        return time.monotonic() - self.started if self.started is not None else 0.0
+
+    def check(self):
+        """检查处理时间、内存和取消标记，超出上限或已取消时抛出对应的异常；可以作为逐工作表的进度回调使用"""
+        if self._error is None:
+            self._error = self._violation()
+        if self._error is not None:
+            raise self._error
+
+    def _violation(self):
+        if self.max_seconds and self.elapsed > self.max_seconds:
+            return ResourceLimitExceeded(f"处理超时: 超过了 {self.max_seconds} 秒的处理时间上限")
+        if self._memory_base is not None:
+            resident = _resident_bytes()
+            if resident is not None and resident - self._memory_base > self.max_memory_mb * 1024 * 1024:
+                return ResourceLimitExceeded(f"处理超出内存上限: 任务最多使用 {self.max_memory_mb} MB 内存")
+        if self.cancelled is not None:
+            try:
+                if self.cancelled():
+                    return JobCancelled('任务已取消')
+            except Exception as e:
+                # 取消标记暂时无法读取（如共享字典所在的进程正在退出）时不影响任务
+                logger.debug("读取取消标记失败: %s", e)
+        return None
+
+    def _watch(self, main_thread_id):
+        while not self._stop.wait(POLL_SECONDS):
+            error = self._violation()
+            if error is not None:
+                self._error = error
+                if self._active:
+                    signal.pthread_kill(main_thread_id, INTERRUPT_SIGNAL)
+                return
+
+    def _on_signal(self, signum, frame):
+        if self._active and self._error is not None:
+            raise self._error
+
+
+def _resident_bytes():
+    """当前进程的常驻内存（RSS，字节），无法读取时返回None"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def check_cell_budget(source, max_cells, reader=None):
+    """
+    在完整解析之前检查工作簿的规模: 用结构探查（check_excel_structure.probe_workbook）统计
+    各工作表的单元格数（行数×列数，含格式化过的空行和空列），超过 max_cells 时抛出 ResourceLimitExceeded
+
+    参数:
+    source: Excel文件路径、二进制文件对象或已打开的 ExcelWorkbook
+    max_cells: 单元格数上限，None 或 0 表示不检查
+    reader: Excel读取引擎，见 workbook_loader.open_workbook
+
+    返回: 探查结果；未检查时返回None
+    """
+    if not max_cells:
+        return None
+    probe = probe_workbook(source, reader=reader)
+    cells = probe['totals']['cells']
+    if cells > max_cells:
+        raise ResourceLimitExceeded(f"工作簿太大: 共 {cells} 个单元格，上限为 {max_cells}")
+    return probe
@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import string
+import hashlib
+import pandas as pd
+from data_processor import cache_salt
+from sheet_cache import make_private_dir
+
+# 缓存目录中每个条目包含的文件
+RESULT_FILE = 'result.pkl'
+OUTPUT_FILE = 'output.xlsx'
+META_FILE = 'meta.json'
+
+
+class ResultCache:
+    """
+    按内容寻址的处理结果缓存：以上传文件字节的哈希加上引擎版本作为键，
+    保存处理后的输出文件、结果DataFrame以及县域/指标数量和预览统计
+
+    同一工作簿再次上传时直接命中缓存，无需重新解析；缓存总大小超过磁盘预算时
+    按最近使用时间（LRU）淘汰最旧的条目。缓存基于文件，可在多个进程间共享，
+    命中/未命中计数只统计当前进程。结果DataFrame用 pickle 保存（保留object列中每个取值的类型），
+    缓存目录必须只有当前用户可以写入（见 sheet_cache.make_private_dir）
+
+    参数:
+    cache_dir: 缓存目录
+    max_bytes: 缓存占用的磁盘预算（字节）
+    """
+
+    def __init__(self, cache_dir, max_bytes=500 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        make_private_dir(cache_dir)
+
+    def make_key(self, source, engine='vectorized'):
+        """计算缓存键: 文件内容的SHA-256 + 引擎名称 + 引擎版本 + 版式规则签名；source 为文件路径或二进制文件对象（读完后回到开头）"""
+        digest = hashlib.sha256()
+        if hasattr(source, 'read'):
+            source.seek(0)
+            for chunk in iter(lambda: source.read(1024 * 1024), b''):
+                digest.update(chunk)
+            source.seek(0)
+        else:
+            with open(source, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+        digest.update(f"|{cache_salt(engine)}".encode('utf-8'))
+        return digest.hexdigest()
+
+    def _entry_dir(self, key):
+        # 键来自URL参数，只接受SHA-256十六进制串，避免读取缓存目录之外的文件
+        if len(key) != 64 or not set(key) <= set(string.hexdigits):
+            raise ValueError(f"无效的缓存键: {key}")
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key):
+        """
+        查找缓存条目，命中时刷新其最近使用时间
+
+        返回: {'key', 'output_path', 'meta'}，未命中时返回None
+        """
+        try:
+            entry_dir = self._entry_dir(key)
+            meta_path = os.path.join(entry_dir, META_FILE)
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            os.utime(meta_path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return {'key': key, 'output_path': os.path.join(entry_dir, OUTPUT_FILE), 'meta': meta}
+
+    def load_result(self, key):
+        """读取缓存的结果DataFrame"""
+        return pd.read_pickle(os.path.join(self._entry_dir(key), RESULT_FILE))
+
+    def put(self, key, result_df, output_path, meta):
+        """
+        写入缓存条目，随后按磁盘预算淘汰旧条目
+
+        参数:
+        key: 缓存键
+        result_df: 处理结果DataFrame
+        output_path: 已写出的输出文件，会被复制到缓存中
+        meta: 县域/指标数量、预览统计等可JSON序列化的信息
+        """
+        # 先写入临时目录再整体改名，并发写入同一个键时不会读到不完整的条目
+        temp_dir = os.path.join(self.cache_dir, f".tmp-{uuid.uuid4().hex}")
+        os.makedirs(temp_dir)
+        try:
+            result_df.to_pickle(os.path.join(temp_dir, RESULT_FILE))
+            shutil.copyfile(output_path, os.path.join(temp_dir, OUTPUT_FILE))
+            with open(os.path.join(temp_dir, META_FILE), 'w', encoding='utf-8') as f:
+                json.dump(dict(meta, cached_at=time.time()), f, ensure_ascii=False)
+            os.rename(temp_dir, self._entry_dir(key))
+        except OSError:
+            # 其他进程已经写入了同一个键
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            if not os.path.exists(os.path.join(self._entry_dir(key), META_FILE)):
+                raise
+        self.evict(keep=key)
+
+    def _entries(self):
+        """返回 [(最近使用时间, 占用字节, 键)]"""
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            if key.startswith('.'):
+                continue
+            entry_dir = os.path.join(self.cache_dir, key)
+            meta_path = os.path.join(entry_dir, META_FILE)
+            if not os.path.exists(meta_path):
+                continue
+            try:
+                size = sum(entry.stat().st_size for entry in os.scandir(entry_dir))
+                entries.append((os.path.getmtime(meta_path), size, key))
+            except OSError:
+                continue
+        return entries
+
+    def evict(self, keep=None):
+        """按LRU淘汰条目，直到缓存总大小不超过磁盘预算；keep 指定的条目不会被淘汰"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
+            total -= size
+
+    def stats(self):
+        """缓存的命中统计与磁盘占用，用于确定缓存大小"""
+        entries = self._entries()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+        }
+
+
+def summarize_result(result_df, workbook_stats, output_path):
+    """汇总处理结果的县域/指标数量和预览统计（与缓存条目中保存的信息一致）"""
+    original_rows, original_cols = workbook_stats['first_sheet_shape']
+    processed_rows, processed_cols = result_df.shape
+    return {
+        'county_count': len(result_df),
+        'metric_count': len(result_df.columns) - 1,
+        'original_rows': original_rows,
+        'original_cols': original_cols,
+        'processed_rows': processed_rows,
+        'processed_cols': processed_cols,
+        'file_size': round(os.path.getsize(output_path) / 1024, 2),  # KB
+    }
@@ -0,0 +1,111 @@
+import datetime
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+# 预览窗口的默认大小与上限（行数/列数），避免一次返回整张表
+DEFAULT_ROW_LIMIT = 50
+DEFAULT_COL_LIMIT = 20
+MAX_LIMIT = 500
+
+
+def parse_window_args(args):
+    """
+    从请求参数中解析预览窗口: row_offset / row_limit / col_offset / col_limit
+
+    参数:
+    args: 类字典对象（如 request.args）
+    """
+    def read_int(name, default, upper=None):
+        try:
+            value = int(args.get(name, default))
+        except (TypeError, ValueError):
+            value = default
+        value = max(value, 0)
+        return min(value, upper) if upper is not None else value
+
+    return {
+        'row_offset': read_int('row_offset', 0),
+        'row_limit': read_int('row_limit', DEFAULT_ROW_LIMIT, MAX_LIMIT),
+        'col_offset': read_int('col_offset', 0),
+        'col_limit': read_int('col_limit', DEFAULT_COL_LIMIT, MAX_LIMIT),
+    }
+
+
+def frame_window(result_df, row_offset=0, row_limit=DEFAULT_ROW_LIMIT, col_offset=0, col_limit=DEFAULT_COL_LIMIT):
+    """
+    从内存中的结果表截取一个 行 × 列 窗口，返回可直接序列化为JSON的字典
+
+    第一列（'县域'）作为行标签始终返回，列窗口只作用于其后的指标列
+    """
+    labels = result_df.iloc[row_offset:row_offset + row_limit, 0]
+    window = result_df.iloc[row_offset:row_offset + row_limit, 1 + col_offset:1 + col_offset + col_limit]
+    return {
+        'total_rows': len(result_df),
+        'total_cols': max(len(result_df.columns) - 1, 0),
+        'row_offset': row_offset,
+        'col_offset': col_offset,
+        'label': str(result_df.columns[0]) if len(result_df.columns) else None,
+        'columns': [str(column) for column in window.columns],
+        'labels': [_json_value(value) for value in labels],
+        # 按行转换（列窗口为空时每行是空列表），与 excel_window 的结构一致
+        'rows': [[_json_value(value) for value in row] for row in window.to_numpy(dtype=object).tolist()],
+    }
+
+
+def excel_window(file_path, row_offset=0, row_limit=DEFAULT_ROW_LIMIT, col_offset=0, col_limit=DEFAULT_COL_LIMIT,
+                 label_col=0):
+    """
+    从已保存的xlsx结果文件中只读取一个 行 × 列 窗口（openpyxl 只读模式，不加载整个文件），
+    返回结构与 frame_window 相同
+
+    参数:
+    label_col: 行标签（县域）所在列的位置，从0开始；写出时包含行索引的文件为1
+    """
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        worksheet = workbook.worksheets[0]
+        total_rows = max((worksheet.max_row or 1) - 1, 0)
+        total_cols = max((worksheet.max_column or 0) - label_col - 1, 0)
+        first_col = label_col + 2 + col_offset  # openpyxl 的列号从1开始
+        last_col = first_col + col_limit - 1
+
+        header = next(worksheet.iter_rows(min_row=1, max_row=1, values_only=True), ())
+        columns = [str(value) for value in header[first_col - 1:last_col]]
+        labels = []
+        rows = []
+        if row_limit and row_offset < total_rows:
+            for row in worksheet.iter_rows(min_row=row_offset + 2, max_row=row_offset + 1 + row_limit, values_only=True):
+                labels.append(_json_value(row[label_col] if len(row) > label_col else None))
+                cells = list(row[first_col - 1:last_col])
+                cells += [None] * (len(columns) - len(cells))
+                rows.append([_json_value(value) for value in cells])
+    finally:
+        workbook.close()
+
+    return {
+        'total_rows': total_rows,
+        'total_cols': total_cols,
+        'row_offset': row_offset,
+        'col_offset': col_offset,
+        'label': str(header[label_col]) if len(header) > label_col else None,
+        'columns': columns,
+        'labels': labels,
+        'rows': rows,
+    }
+
+
+def _json_value(value):
+    """把单元格值转换为JSON可表示的值，空值为None"""
+    # pd.NaT 也是 datetime 的实例，必须先于日期判断
+    if value is None or (pd.api.types.is_scalar(value) and pd.isna(value)):
+        return None
+    if isinstance(value, np.datetime64):
+        value = pd.Timestamp(value)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and np.isinf(value):
+        return None
+    return value
@@ -0,0 +1,313 @@
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+from urllib.parse import quote
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # 可选依赖，未安装时结果库不可用
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+# 结果库中每个工作簿保存为一个Parquet文件和一个索引文件: <结果ID>.parquet / <结果ID>.json
+DATA_SUFFIX = '.parquet'
+INDEX_SUFFIX = '.json'
+# 每个行组的记录数；记录按 指标、县域 排序，查询时按行组统计信息跳过不相关的行组
+ROW_GROUP_ROWS = 16384
+# 单次查询最多返回的记录数
+QUERY_LIMIT = 100000
+
+LABEL_COLUMN = '县域'
+
+
+def store_available():
+    """结果库依赖 pyarrow"""
+    return pa is not None
+
+
+class ResultStore:
+    """
+    持久化的列式结果库: 每个处理过的工作簿都以长表（省份、县域、指标、取值）追加到库中，
+    可以跨省份按县域 × 指标查询，而不必重新打开Excel文件
+
+    目录按省份分区（province=<省份>/），同一省份的新结果写入后替换该省份之前的结果，
+    查询不会重复计数。每个Parquet文件旁边的索引文件记录其县域和指标列表，查询先按
+    索引跳过无关的省份和文件，再以内存映射方式读取，只解码匹配的行组
+
+    参数:
+    store_dir: 结果库目录
+    """
+
+    def __init__(self, store_dir):
+        if not store_available():
+            raise ImportError('结果库需要安装 pyarrow')
+        self.store_dir = store_dir
+        self._index_cache = {}
+        os.makedirs(store_dir, exist_ok=True)
+
+    def _partition(self, province):
+        return os.path.join(self.store_dir, 'province=' + quote(str(province), safe=''))
+
+    def contains(self, province, result_id):
+        """该省份的当前结果是否就是 result_id"""
+        return os.path.exists(os.path.join(self._partition(province), result_id + INDEX_SUFFIX))
+
+    def append(self, province, result_id, result_df):
+        """
+        把一个工作簿的处理结果追加到结果库，并替换同一省份之前的结果
+
+        参数:
+        province: 省份名称
+        result_id: 结果ID（上传内容的缓存键），同一结果重复追加时不做任何事
+        result_df: 处理结果DataFrame（'县域'列 + 指标列）
+
+        返回: 写入的记录数；结果已在库中时返回0
+        """
+        if self.contains(province, result_id):
+            return 0
+        partition = self._partition(province)
+        os.makedirs(partition, exist_ok=True)
+
+        records = to_records(province, result_df)
+        table = pa.Table.from_pandas(records, schema=_schema(), preserve_index=False)
+        data_path = os.path.join(partition, result_id + DATA_SUFFIX)
+        index = {
+            'province': str(province),
+            'result_id': result_id,
+            'records': len(records),
+            'counties': sorted(records['county'].unique().tolist()),
+            'metrics': sorted(records['metric'].unique().tolist()),
+            'stored_at': time.time(),
+        }
+
+        # 先写Parquet再写索引，索引存在即表示数据文件完整；都先写临时文件再改名
+        temp_path = os.path.join(partition, f".tmp-{uuid.uuid4().hex}")
+        try:
+            pq.write_table(table, temp_path, row_group_size=ROW_GROUP_ROWS)
+            os.replace(temp_path, data_path)
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(index, f, ensure_ascii=False)
+            os.replace(temp_path, os.path.join(partition, result_id + INDEX_SUFFIX))
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        for entry in self._partition_entries(partition):
+            if entry['result_id'] != result_id and entry['stored_at'] <= index['stored_at']:
+                self._remove(partition, entry['result_id'])
+        logger.info("结果库: %s 写入 %d 条记录（%d 个县域，%d 个指标）", province, len(records),
+                    len(index['counties']), len(index['metrics']))
+        return len(records)
+
+    def _remove(self, partition, result_id):
+        # 先删除索引，查询不会再选中这个文件
+        for suffix in (INDEX_SUFFIX, DATA_SUFFIX):
+            try:
+                os.remove(os.path.join(partition, result_id + suffix))
+            except OSError:
+                pass
+
+    def _partition_entries(self, partition):
+        """读取分区中的索引文件，按文件修改时间缓存"""
+        entries = []
+        try:
+            names = os.listdir(partition)
+        except OSError:
+            return entries
+        for name in names:
+            if name.startswith('.') or not name.endswith(INDEX_SUFFIX):
+                continue
+            path = os.path.join(partition, name)
+            try:
+                mtime = os.path.getmtime(path)
+                cached = self._index_cache.get(path)
+                if cached is None or cached[0] != mtime:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        cached = (mtime, json.load(f))
+                    self._index_cache[path] = cached
+            except (OSError, ValueError):
+                continue
+            entries.append(dict(cached[1], path=os.path.join(partition, name[:-len(INDEX_SUFFIX)] + DATA_SUFFIX)))
+        return entries
+
+    def entries(self, provinces=None):
+        """结果库中各省份的当前结果: [{'province', 'result_id', 'records', 'counties', 'metrics', 'stored_at', 'path'}]"""
+        if provinces is not None:
+            partitions = [self._partition(province) for province in provinces]
+        else:
+            partitions = [entry.path for entry in os.scandir(self.store_dir)
+                          if entry.is_dir() and entry.name.startswith('province=')]
+        entries = []
+        for partition in partitions:
+            current = self._partition_entries(partition)
+            if current:
+                # 替换过程中短暂存在两个结果时只取最新的
+                entries.append(max(current, key=lambda entry: entry['stored_at']))
+        return sorted(entries, key=lambda entry: entry['province'])
+
+    def query(self, provinces=None, counties=None, metrics=None, limit=QUERY_LIMIT):
+        """
+        查询县域 × 指标切片
+
+        参数:
+        provinces / counties / metrics: 名称列表，None 表示不限制
+        limit: 最多返回的记录数
+
+        返回: (长表DataFrame[province, county, metric, value], 是否因 limit 被截断)；
+        value 为数值，原始值不是数值时为原文本
+        """
+        filters = []
+        if counties is not None:
+            filters.append(('county', 'in', list(counties)))
+        if metrics is not None:
+            filters.append(('metric', 'in', list(metrics)))
+        counties = set(counties) if counties is not None else None
+        metrics = set(metrics) if metrics is not None else None
+
+        tables = []
+        total = 0
+        for entry in self.entries(provinces):
+            if counties is not None and counties.isdisjoint(entry['counties']):
+                continue
+            if metrics is not None and metrics.isdisjoint(entry['metrics']):
+                continue
+            try:
+                table = pq.read_table(entry['path'], filters=filters or None, memory_map=True)
+            except OSError:
+                # 文件在读取前被新的结果替换
+                continue
+            tables.append(table)
+            total += table.num_rows
+            if total > limit:
+                break
+
+        if not tables:
+            return pd.DataFrame(columns=['province', 'county', 'metric', 'value']), False
+        records = pa.concat_tables(tables).slice(0, limit).to_pandas()
+        values = records['value'].astype(object)
+        texts = records.pop('text')
+        values = values.where(texts.isna(), texts)
+        records['value'] = values.where(values.notna(), None)
+        return records, total > limit
+
+    def stats(self):
+        """结果库中的省份数、记录数和磁盘占用"""
+        entries = self.entries()
+        size = 0
+        for root, _, files in os.walk(self.store_dir):
+            size += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+        return {
+            'provinces': len(entries),
+            'records': sum(entry['records'] for entry in entries),
+            'bytes': size,
+        }
+
+
+def _schema():
+    return pa.schema([
+        ('province', pa.string()),
+        ('county', pa.string()),
+        ('metric', pa.string()),
+        ('value', pa.float64()),
+        ('text', pa.string()),
+    ])
+
+
+def to_records(province, result_df):
+    """
+    把处理结果（县域 × 指标的宽表）转换为长表: province, county, metric, value, text
+
+    空单元格不保存；数值保存在 value 中，'-'、'…'等非数值内容保存在 text 中。
+    记录按 指标、县域 排序，同一指标的记录集中在相邻的行组中
+    """
+    metrics = [column for column in result_df.columns if column != LABEL_COLUMN]
+    values = result_df[metrics].to_numpy(dtype=object).ravel()
+    counties = result_df[LABEL_COLUMN].astype(str).to_numpy().repeat(len(metrics))
+    records = pd.DataFrame({
+        'province': str(province),
+        'county': counties,
+        'metric': np.tile(np.array([str(metric) for metric in metrics], dtype=object), len(result_df)),
+        'original': values,
+    })
+    records = records[records['original'].notna()]
+    numbers = pd.to_numeric(records['original'], errors='coerce')
+    records['value'] = numbers.astype('float64')
+    records['text'] = records['original'].where(numbers.isna()).map(lambda value: value if pd.isna(value) else str(value))
+    records = records.drop(columns='original').sort_values(['metric', 'county'], kind='stable')
+    return records.reset_index(drop=True)
+
+
+def parse_query_args(args):
+    """
+    从请求参数中解析查询条件: province / county / metric 可以重复给出或用逗号分隔，省略表示不限制
+
+    参数:
+    args: 类 MultiDict 对象（如 request.args）
+
+    返回: {'provinces', 'counties', 'metrics'}
+    """
+    def read_list(name):
+        names = [item.strip() for value in args.getlist(name) for item in value.split(',')]
+        names = [item for item in names if item]
+        return names or None
+
+    return {'provinces': read_list('province'), 'counties': read_list('county'), 'metrics': read_list('metric')}
+
+
+def slice_json(records, truncated):
+    """查询结果转换为可直接序列化为JSON的宽表切片，结构与结果预览窗口一致"""
+    wide = pivot_records(records)
+    return {
+        'columns': [str(column) for column in wide.columns],
+        'labels': [list(label) for label in wide.index],
+        'rows': wide.astype(object).where(wide.notna(), None).to_numpy().tolist(),
+        'records': len(records),
+        'truncated': truncated,
+    }
+
+
+def pivot_records(records):
+    """查询结果转换为宽表切片: 行为 (省份, 县域)，列为指标，保持首次出现的顺序"""
+    if records.empty:
+        return pd.DataFrame()
+    labels = pd.MultiIndex.from_frame(records[['province', 'county']]).unique()
+    columns = pd.unique(records['metric'])
+    wide = records.pivot(index=['province', 'county'], columns='metric', values='value')
+    return wide.reindex(index=labels, columns=columns)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='查询结果库中的县域 × 指标切片')
+    parser.add_argument('store_dir', help='结果库目录')
+    parser.add_argument('--province', action='append', help='省份，可以重复指定（默认: 全部）')
+    parser.add_argument('--county', action='append', help='县域，可以重复指定（默认: 全部）')
+    parser.add_argument('--metric', action='append', help='指标，可以重复指定（默认: 全部）')
+    parser.add_argument('-o', '--output', help='把切片保存为xlsx文件；默认打印到终端')
+    args = parser.parse_args(argv)
+
+    if not store_available():
+        print("错误: 结果库需要安装 pyarrow")
+        return 1
+    store = ResultStore(args.store_dir)
+    records, truncated = store.query(args.province, args.county, args.metric)
+    wide = pivot_records(records)
+    if args.output:
+        wide.to_excel(args.output)
+        print(f"切片已保存到: {args.output}（{len(wide)} 行 × {len(wide.columns)} 列）")
+    else:
+        print(wide.to_string())
+    if truncated:
+        print(f"注意: 结果超过 {QUERY_LIMIT} 条记录，已截断")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
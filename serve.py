@@ -0,0 +1,157 @@
+import os
+import re
+import gc
+import sys
+import time
+import logging
+import argparse
+import importlib
+import subprocess
+
+# 进程启动的时间点，启动耗时从这里开始计算
+STARTED = time.perf_counter()
+
+logger = logging.getLogger(__name__)
+
+# 冷启动检查时列出的最慢的导入模块数
+SLOWEST_IMPORTS = 10
+
+
+def server_options():
+    """
+    从环境变量读取服务器配置
+
+    WEB_APP: 要运行的应用模块，main（默认）或 app
+    WEB_HOST / WEB_PORT: 监听地址和端口（默认 0.0.0.0:5000）
+    WEB_WORKERS: 工作进程数（默认CPU核数；Windows下只有一个进程）
+    WEB_THREADS: 每个工作进程的线程数（默认4）
+    WEB_TIMEOUT: 单个请求的超时秒数，超时的工作进程会被重启（默认300，同步处理大文件需要较长时间）
+    WEB_GRACEFUL_TIMEOUT: 重启或停止时等待进行中请求完成的秒数（默认30）
+    WEB_KEEPALIVE: keep-alive 连接的保持秒数（默认5）
+    WEB_MAX_REQUESTS: 每个工作进程处理多少个请求后自动重启，0表示不重启（默认0）
+    STARTUP_BUDGET_SECONDS: 启动耗时预算（默认3秒）
+    """
+    return {
+        'app': os.environ.get('WEB_APP', 'main'),
+        'host': os.environ.get('WEB_HOST', '0.0.0.0'),
+        'port': int(os.environ.get('WEB_PORT', '5000')),
+        'workers': int(os.environ.get('WEB_WORKERS') or os.cpu_count() or 1),
+        'threads': int(os.environ.get('WEB_THREADS', '4')),
+        'timeout': int(os.environ.get('WEB_TIMEOUT', '300')),
+        'graceful_timeout': int(os.environ.get('WEB_GRACEFUL_TIMEOUT', '30')),
+        'keepalive': int(os.environ.get('WEB_KEEPALIVE', '5')),
+        'max_requests': int(os.environ.get('WEB_MAX_REQUESTS', '0')),
+        'startup_budget': float(os.environ.get('STARTUP_BUDGET_SECONDS', '3')),
+    }
+
+
+def load_app(module_name, startup_budget):
+    """
+    在当前（父）进程中导入应用模块并返回 Flask 应用，记录启动耗时
+
+    pandas/numpy/openpyxl 等重量级库只在这里导入一次；随后冻结垃圾回收器跟踪的对象，
+    fork 出的工作进程共享这些内存页（写时复制），垃圾回收不会因为改写对象头而复制它们
+    """
+    from instrumentation import STARTUP_DURATION
+
+    app = importlib.import_module(module_name).app
+    gc.collect()
+    gc.freeze()
+
+    elapsed = time.perf_counter() - STARTED
+    STARTUP_DURATION.observe(elapsed)
+    if elapsed > startup_budget:
+        logger.warning("应用启动耗时 %.2f 秒，超过预算 %.2f 秒；可用 python serve.py --check-startup 查看最慢的导入",
+                       elapsed, startup_budget)
+    else:
+        logger.info("应用启动耗时 %.2f 秒（预算 %.2f 秒）", elapsed, startup_budget)
+    return app
+
+
+def run_gunicorn(app, options):
+    """用 gunicorn 运行（Linux/macOS）: 预加载应用后 fork 多个工作进程"""
+    from gunicorn.app.base import BaseApplication
+
+    class PreloadedApplication(BaseApplication):
+        def load_config(self):
+            settings = {
+                'bind': f"{options['host']}:{options['port']}",
+                'workers': options['workers'],
+                'threads': options['threads'],
+                'timeout': options['timeout'],
+                'graceful_timeout': options['graceful_timeout'],
+                'keepalive': options['keepalive'],
+                'max_requests': options['max_requests'],
+                'max_requests_jitter': options['max_requests'] // 10,
+                'preload_app': True,
+                'accesslog': '-',
+            }
+            for key, value in settings.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    PreloadedApplication().run()
+
+
+def run_waitress(app, options):
+    """用 waitress 运行（Windows 不支持 fork）: 单进程多线程，线程数为 WEB_WORKERS × WEB_THREADS"""
+    from waitress import serve
+
+    serve(app, host=options['host'], port=options['port'],
+          threads=max(1, options['workers'] * options['threads']),
+          channel_timeout=options['timeout'])
+
+
+def check_startup(module_name, budget):
+    """
+    在全新的解释器中导入应用模块，测量冷启动耗时并列出最慢的导入，用于部署前检查
+
+    返回: 退出码，超过预算时为1
+    """
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module_name}"],
+                               capture_output=True, text=True, env=dict(os.environ, LOG_LEVEL='WARNING'))
+    elapsed = time.perf_counter() - started
+    if completed.returncode != 0:
+        print(completed.stderr, file=sys.stderr)
+        return completed.returncode
+
+    # -X importtime 的输出: import time: 自身耗时 | 累计耗时 | 模块名（微秒）
+    imports = []
+    for line in completed.stderr.splitlines():
+        match = re.match(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)', line)
+        if match and len(match.group(3)) <= 3:
+            imports.append((int(match.group(2)) / 1e6, match.group(4)))
+
+    print(f"冷启动耗时: {elapsed:.2f} 秒（预算 {budget:.2f} 秒，含解释器启动）")
+    print("最慢的顶层导入:")
+    for seconds, name in sorted(imports, reverse=True)[:SLOWEST_IMPORTS]:
+        print(f"  {seconds:>7.3f} 秒  {name}")
+    if elapsed > budget:
+        print(f"超过启动预算 {elapsed - budget:.2f} 秒")
+        return 1
+    return 0
+
+
+def main(argv=None):
+    options = server_options()
+    parser = argparse.ArgumentParser(description='生产环境入口: 预加载应用后以多进程WSGI服务器运行')
+    parser.add_argument('--app', default=options['app'], choices=('main', 'app'), help='要运行的应用模块（默认: main）')
+    parser.add_argument('--check-startup', action='store_true', help='只测量冷启动耗时，超过 STARTUP_BUDGET_SECONDS 时退出码为1')
+    args = parser.parse_args(argv)
+
+    if args.check_startup:
+        return check_startup(args.app, options['startup_budget'])
+
+    app = load_app(args.app, options['startup_budget'])
+    if os.name == 'nt':
+        run_waitress(app, options)
+    else:
+        run_gunicorn(app, options)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,122 @@
+import os
+import uuid
+import pickle
+
+# 每个工作表的提取结果保存为一个文件: <工作表指纹>.pkl
+PARTIAL_SUFFIX = '.pkl'
+
+
+class SheetCache:
+    """
+    按工作表内容指纹保存的单表提取结果（县域、指标和数据点），用于增量处理修订后的工作簿
+
+    修订版工作簿中内容未变的工作表直接复用上次的提取结果，只重新提取指纹变化的工作表，
+    再按当前工作簿的工作表顺序合并，结果与完整处理完全一致。指纹只取决于工作表内容、
+    提取引擎和引擎版本，与文件名和工作表名称无关；缓存总大小超过磁盘预算时按最近使用时间淘汰。
+    缓存文件用 pickle 保存，缓存目录必须只有当前用户可以写入（见 make_private_dir）
+
+    参数:
+    cache_dir: 缓存目录
+    max_bytes: 缓存占用的磁盘预算（字节）
+    """
+
+    def __init__(self, cache_dir, max_bytes=200 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        make_private_dir(cache_dir)
+
+    def _path(self, fingerprint):
+        return os.path.join(self.cache_dir, fingerprint + PARTIAL_SUFFIX)
+
+    def get(self, fingerprint):
+        """返回指纹对应的单表提取结果，未命中时返回None；命中时刷新其最近使用时间"""
+        path = self._path(fingerprint)
+        try:
+            with open(path, 'rb') as f:
+                partial = pickle.load(f)
+            os.utime(path)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return partial
+
+    def put(self, fingerprint, partial):
+        """保存单表提取结果，先写临时文件再改名，并发写入同一指纹时不会读到不完整的文件"""
+        temp_path = os.path.join(self.cache_dir, f".tmp-{uuid.uuid4().hex}")
+        try:
+            with open(temp_path, 'wb') as f:
+                pickle.dump(partial, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self._path(fingerprint))
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        self.evict(keep=fingerprint)
+
+    def _entries(self):
+        """返回 [(最近使用时间, 占用字节, 指纹)]"""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.startswith('.') or not entry.name.endswith(PARTIAL_SUFFIX):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.name[:-len(PARTIAL_SUFFIX)]))
+        return entries
+
+    def evict(self, keep=None):
+        """按LRU淘汰条目，直到缓存总大小不超过磁盘预算；keep 指定的条目不会被淘汰"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, fingerprint in entries:
+            if total <= self.max_bytes:
+                break
+            if fingerprint == keep:
+                continue
+            try:
+                os.remove(self._path(fingerprint))
+            except OSError:
+                continue
+            total -= size
+
+    def stats(self):
+        """命中统计与磁盘占用"""
+        entries = self._entries()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+        }
+
+
+def make_private_dir(path):
+    """
+    创建只有当前用户可以访问的目录（0700）；目录已存在时检查属主和权限，返回 path
+
+    缓存目录中的文件会被反序列化（pickle），其他用户能在其中放入文件就能让本进程执行任意代码，
+    而默认的缓存目录位于所有用户共享的系统临时目录下、路径可以预知。目录属于其他用户或
+    其他用户可以写入时抛出 PermissionError，否则收紧为0700
+
+    参数:
+    path: 目录路径
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    # Windows 没有POSIX属主和权限位，临时目录本身按用户隔离
+    if not hasattr(os, 'getuid'):
+        return path
+    stat = os.stat(path)
+    if stat.st_uid != os.getuid():
+        raise PermissionError(f"缓存目录不属于当前用户，拒绝使用: {path}")
+    if stat.st_mode & 0o022:
+        raise PermissionError(f"缓存目录可被其他用户写入，拒绝使用: {path}（确认其中的文件可信后执行 chmod 700）")
+    if stat.st_mode & 0o077:
+        os.chmod(path, 0o700)
+    return path
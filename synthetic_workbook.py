@@ -0,0 +1,99 @@
+import random
+import argparse
+from openpyxl import Workbook
+
+# 分类行，按顺序插入到指标行之间
+CATEGORY_ROWS = ('一、基本情况', '二、经济发展', '三、财政收支', '四、农业生产', '五、工业', '六、社会事业', '七、人口', '八、其他')
+# 文本形式的缺失值，真实数据中常见
+MISSING_MARKERS = ('-', '…', '——')
+UNITS = ('万元', '亿元', '人', '万人', '公顷', '吨', '%', '个')
+
+
+def generate_workbook(output_file, sheets=4, tables_per_sheet=3, counties_per_table=20, metrics=40,
+                      category_every=8, sparsity=0.2, seed=0):
+    """
+    生成与真实省级数据结构相同的合成工作簿，用于性能测试
+
+    每个工作表包含标题行和若干个重复的 '指标|单位|县域...' 表格区域，
+    同一工作表中不同区域的县域各不相同，指标行之间按固定间隔插入"一、二、"分类行
+
+    参数:
+    output_file: 输出xlsx路径
+    sheets: 工作表数量
+    tables_per_sheet: 每个工作表中的表格区域数
+    counties_per_table: 每个表格区域的县域数
+    metrics: 每个表格区域的指标行数
+    category_every: 每隔多少个指标行插入一个分类行，0表示不插入
+    sparsity: 空单元格的比例（0~1），其中一部分写成 '-'、'…' 等文本
+    seed: 随机种子，相同参数生成完全相同的工作簿
+
+    返回: 写入的单元格总数（包括空单元格），用于估算规模
+    """
+    rnd = random.Random(seed)
+    workbook = Workbook(write_only=True)
+    metric_names = [f"指标{i:04d}" for i in range(metrics)]
+    metric_units = [rnd.choice(UNITS) for _ in range(metrics)]
+    cells = 0
+
+    for s in range(sheets):
+        worksheet = workbook.create_sheet(f"表{s + 1}")
+        worksheet.append([f"附表{s + 1} 县域主要统计指标"])
+        worksheet.append([None, None, '单位: 见各行'])
+        cells += 3
+
+        for t in range(tables_per_sheet):
+            first = (s * tables_per_sheet + t) * counties_per_table
+            counties = [f"{'县市区'[i % 3]}{first + i:05d}" for i in range(counties_per_table)]
+            header = ['指标', '单位'] + counties
+            worksheet.append(header)
+            cells += len(header)
+
+            category = 0
+            for m, (metric, unit) in enumerate(zip(metric_names, metric_units)):
+                if category_every and m % category_every == 0:
+                    worksheet.append([CATEGORY_ROWS[category % len(CATEGORY_ROWS)]])
+                    category += 1
+                    cells += 1
+                row = [metric, unit]
+                for _ in counties:
+                    draw = rnd.random()
+                    if draw < sparsity * 0.8:
+                        row.append(None)
+                    elif draw < sparsity:
+                        row.append(rnd.choice(MISSING_MARKERS))
+                    elif draw < 0.6:
+                        row.append(rnd.randint(0, 100000))
+                    else:
+                        row.append(round(rnd.random() * 10000, 2))
+                worksheet.append(row)
+                cells += len(row)
+
+            # 区域之间的空行和注释行
+            worksheet.append([])
+            worksheet.append([f"注: 表{s + 1}-{t + 1} 数据来源于统计年鉴"])
+            cells += 1
+
+    workbook.save(output_file)
+    return cells
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='生成用于性能测试的合成工作簿')
+    parser.add_argument('output', help='输出xlsx文件')
+    parser.add_argument('--sheets', type=int, default=4, help='工作表数量（默认: 4）')
+    parser.add_argument('--tables', type=int, default=3, help='每个工作表的表格区域数（默认: 3）')
+    parser.add_argument('--counties', type=int, default=20, help='每个表格区域的县域数（默认: 20）')
+    parser.add_argument('--metrics', type=int, default=40, help='每个表格区域的指标行数（默认: 40）')
+    parser.add_argument('--category-every', type=int, default=8, help='每隔多少个指标行插入分类行（默认: 8，0为不插入）')
+    parser.add_argument('--sparsity', type=float, default=0.2, help='空单元格比例（默认: 0.2）')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子（默认: 0）')
+    args = parser.parse_args(argv)
+
+    cells = generate_workbook(args.output, sheets=args.sheets, tables_per_sheet=args.tables,
+                              counties_per_table=args.counties, metrics=args.metrics,
+                              category_every=args.category_every, sparsity=args.sparsity, seed=args.seed)
+    print(f"已生成: {args.output}（{cells} 个单元格）")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+import multiprocessing
+import os
+import shutil
+
+import pytest
+
+import batch_processor
+from batch_processor import process_batch
+from excel_engine import process_workbook
+from synthetic_workbook import generate_workbook
+
+
+@pytest.fixture
+def workbooks(tmp_path):
+    paths = []
+    for seed, province in enumerate(['甲省', '乙省', '丙省'], 1):
+        path = tmp_path / f'{province}.xlsx'
+        generate_workbook(str(path), sheets=1, tables_per_sheet=2, counties_per_table=3, metrics=5, seed=seed)
+        paths.append(str(path))
+    return paths
+
+
+def test_batch_applies_resource_limits(workbooks):
+    limits = {'max_cells': 10 ** 6}
+    combined, summary = process_batch(workbooks, max_workers=2, limits=limits)
+    assert [item['status'] for item in summary] == ['ok', 'ok', 'ok']
+
+    combined, summary = process_batch(workbooks, max_workers=2, limits={'max_cells': 10})
+    assert [item['status'] for item in summary] == ['failed'] * 3
+    assert all('单元格' in item['error'] for item in summary)
+
+
+def _crash_on_marker(source, *args, **kwargs):
+    if 'crash' in os.path.basename(source):
+        os._exit(1)
+    return process_workbook(source, *args, **kwargs)
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork', reason='需要 fork 的工作进程继承替换后的函数')
+def test_worker_crash_fails_only_that_file(workbooks, tmp_path, monkeypatch):
+    # 模拟某个文件让工作进程直接退出（如原生扩展内存分配失败），同一进程池中的其他文件不受影响
+    monkeypatch.setattr(batch_processor, 'process_workbook', _crash_on_marker)
+    crash = str(tmp_path / 'crash.xlsx')
+    shutil.copyfile(workbooks[0], crash)
+    combined, summary = process_batch([workbooks[0], crash] + workbooks[1:], max_workers=2)
+    assert [item['status'] for item in summary] == ['ok', 'failed', 'ok', 'ok']
+    assert '意外退出' in summary[1]['error']
+    assert sorted(combined['省份'].unique()) == ['丙省', '乙省', '甲省']
@@ -0,0 +1,65 @@
+import os
+import stat
+
+import pytest
+
+from result_cache import ResultCache
+from sheet_cache import SheetCache, make_private_dir
+
+posix_only = pytest.mark.skipif(not hasattr(os, 'getuid'), reason='需要POSIX属主和权限位')
+
+
+def mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+@posix_only
+def test_private_dir_is_created_0700(tmp_path):
+    path = make_private_dir(str(tmp_path / 'cache'))
+    assert mode(path) == 0o700
+
+
+@posix_only
+def test_private_dir_is_tightened(tmp_path):
+    path = tmp_path / 'cache'
+    path.mkdir()
+    path.chmod(0o755)
+    make_private_dir(str(path))
+    assert mode(path) == 0o700
+
+
+@posix_only
+@pytest.mark.parametrize('permissions', [0o777, 0o775, 0o1777])
+def test_private_dir_rejects_shared_dir(tmp_path, permissions):
+    path = tmp_path / 'cache'
+    path.mkdir()
+    path.chmod(permissions)
+    with pytest.raises(PermissionError):
+        make_private_dir(str(path))
+
+
+@posix_only
+def test_private_dir_rejects_other_owner(tmp_path, monkeypatch):
+    monkeypatch.setattr(os, 'getuid', lambda: os.stat(tmp_path).st_uid + 1)
+    with pytest.raises(PermissionError):
+        make_private_dir(str(tmp_path))
+
+
+def test_sheet_cache_round_trip(tmp_path):
+    cache = SheetCache(str(tmp_path / 'sheets'))
+    assert cache.get('a' * 64) is None
+    cache.put('a' * 64, {'counties': ['甲县']})
+    assert cache.get('a' * 64) == {'counties': ['甲县']}
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+@posix_only
+def test_result_cache_uses_private_dir(tmp_path):
+    shared = tmp_path / 'results'
+    shared.mkdir()
+    shared.chmod(0o777)
+    with pytest.raises(PermissionError):
+        ResultCache(str(shared))
+    shared.chmod(0o755)
+    ResultCache(str(shared))
+    assert mode(shared) == 0o700
@@ -0,0 +1,155 @@
+import datetime
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_processor import extract_county_data
+from synthetic_workbook import generate_workbook
+from workbooks import write_rows
+
+# 合成工作簿的参数组合: 默认结构、高稀疏度、无分类行、单区域宽表、多工作表
+SYNTHETIC = {
+    'default': dict(sheets=2, tables_per_sheet=3, counties_per_table=8, metrics=20, seed=1),
+    'sparse': dict(sheets=2, tables_per_sheet=2, counties_per_table=10, metrics=15, sparsity=0.7, seed=2),
+    'no_categories': dict(sheets=1, tables_per_sheet=4, counties_per_table=5, metrics=12, category_every=0, seed=3),
+    'wide': dict(sheets=1, tables_per_sheet=1, counties_per_table=60, metrics=10, seed=4),
+    'many_sheets': dict(sheets=6, tables_per_sheet=1, counties_per_table=4, metrics=6, seed=5),
+}
+
+# 手工构造的边界情况
+EDGE_CASES = {
+    # 同一指标在后面的区域中再次出现: 结果保留最后写入的取值；同一县域出现在多个表格区域中
+    'duplicates': {'表1': [
+        ['标题'],
+        ['指标', '单位', '甲县', '乙县'],
+        ['人口', '万人', 10, 20],
+        ['人口', '万人', 11, None],
+        ['指标', '单位', '乙县', '丙县'],
+        ['人口', '万人', 21, 30],
+        ['面积', '平方公里', None, 300.5],
+    ]},
+    # 表头中有空的县域单元格、指标行比表头短、空行、没有表头的工作表
+    'ragged': {
+        '表1': [
+            ['标题'],
+            ['无关内容', None, 1],
+            ['指标', '单位', '甲县', None, '乙县'],
+            ['一、综合'],
+            ['人口', '万人', 1, 2],
+            [],
+            ['  面积 ', None, 3.5, None, 4],
+            ['注：说明文字'],
+        ],
+        '说明': [['这是说明'], ['没有表格']],
+        '空表': [],
+    },
+    # pd.read_excel 按整列推断类型: 整列为数字时数字文本转换为数值、有空单元格的整数列提升为浮点数
+    # （数字县域表头随之变为 '123.0'）、含文本的列保持原值、布尔值与0/1混合
+    'column_types': {'表1': [
+        ['标题'],
+        ['指标', '单位', 123, '456', 7.5, '乙县', True],
+        ['人口', '万人', 1, '8', None, 'NA', 1],
+        ['面积', None, None, '9.5', 2, '文本', False],
+        ['产值', '亿元', 3, ' 10 ', 4, 5, 0],
+        ['日期', None, None, None, datetime.datetime(2020, 1, 2)],
+    ]},
+    # 指标列中的布尔值: 前面出现过相等的整数时整表读取把 True 读成 1
+    'bool_labels': {'表1': [
+        ['标题'],
+        ['指标', '单位', '甲县'],
+        [1, '个', 5],
+        [True, '个', 6],
+        [False, 3, 7],
+    ]},
+}
+
+
+ENGINES = ('vectorized', 'stream', 'loop')
+
+
+def _value_type(value):
+    # loop 引擎的取值来自numpy数组（np.float64 等），与对应的Python类型视为相同
+    return type(value.item() if isinstance(value, np.generic) else value)
+
+
+def assert_same_result(expected, actual):
+    """结果表完全一致: 列、顺序、dtype 以及每个单元格的取值和类型"""
+    pd.testing.assert_frame_equal(expected, actual, check_exact=True)
+    assert ([_value_type(value) for value in expected.to_numpy().ravel()]
+            == [_value_type(value) for value in actual.to_numpy().ravel()])
+
+
+def assert_engines_agree(path):
+    results = {engine: extract_county_data(str(path), engine=engine) for engine in ENGINES}
+    for engine in ENGINES[:-1]:
+        assert_same_result(results['loop'], results[engine])
+    return results['loop']
+
+
+def random_sheet(rng):
+    """随机工作表: 混用多种版式的表头，县域表头和取值混有数字、数字文本、缺失值文本、布尔值和日期"""
+    headers = [['指标', '单位'], ['项目', '单位'], ['指标', '代码', '单位']]
+    counties = rng.randint(1, 5)
+    numeric_columns = {column for column in range(6) if rng.random() < 0.3}
+
+    def county(index):
+        return rng.choice([f'县{index}', f'县{index}', rng.randint(100, 999), round(rng.uniform(1, 99), 2),
+                           str(rng.randint(100, 999)), rng.choice([True, False, None])])
+
+    def value(numeric):
+        if numeric:
+            return rng.choice([0, 1, 2.5, None, rng.randint(-50, 1000)])
+        return rng.choice([None, rng.randint(-50, 100000), round(rng.uniform(-10, 1000), 2), str(rng.randint(0, 99)),
+                           rng.choice(['NA', '-', '#N/A', 'True', ' 7 ', '1e3']), rng.choice([True, False, 0, 1]),
+                           datetime.datetime(2020, rng.randint(1, 12), 1)])
+
+    rows = [[rng.choice(['标题', None])]]
+    for table in range(rng.randint(1, 3)):
+        header = list(rng.choice(headers))
+        rows.append(header + [county(table * 10 + index) for index in range(counties)])
+        for metric in range(rng.randint(1, 6)):
+            label = rng.choice([f'm{metric}', f'm{rng.randint(0, 8)}', rng.randint(0, 9), rng.choice([True, False]),
+                                '一、分类', None])
+            body = [rng.choice(['万人', None, 3])] + [None] * (len(header) - 2)
+            rows.append([label] + body + [value(len(header) + index in numeric_columns)
+                                          for index in range(rng.randint(0, counties))])
+    return rows
+
+
+@pytest.mark.parametrize('name', sorted(SYNTHETIC))
+def test_engines_agree_on_synthetic_workbooks(tmp_path, name):
+    path = tmp_path / f'{name}.xlsx'
+    generate_workbook(str(path), **SYNTHETIC[name])
+    assert len(assert_engines_agree(path)) > 0
+
+
+@pytest.mark.parametrize('name', sorted(EDGE_CASES))
+def test_engines_agree_on_edge_cases(tmp_path, name):
+    path = write_rows(tmp_path / f'{name}.xlsx', EDGE_CASES[name])
+    assert_engines_agree(path)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_engines_agree_on_random_workbooks(tmp_path, seed):
+    rng = random.Random(seed)
+    path = write_rows(tmp_path / f'random{seed}.xlsx', {f'表{index}': random_sheet(rng) for index in range(rng.randint(1, 3))})
+    assert_engines_agree(path)
+
+
+def test_duplicate_metrics_keep_last_value(tmp_path):
+    path = write_rows(tmp_path / 'duplicates.xlsx', EDGE_CASES['duplicates'])
+    result_df = extract_county_data(str(path)).set_index('县域')
+    assert result_df.index.tolist() == ['甲县', '乙县', '丙县']
+    assert result_df.loc['甲县', '人口'] == 11
+    assert result_df.loc['乙县', '人口'] == 21
+    assert result_df.loc['丙县', '面积'] == 300.5
+
+
+@pytest.mark.parametrize('engine', ['vectorized', 'stream'])
+def test_parallel_sheets_match_sequential(tmp_path, engine):
+    path = tmp_path / 'parallel.xlsx'
+    generate_workbook(str(path), **SYNTHETIC['many_sheets'])
+    assert_same_result(extract_county_data(str(path), engine=engine),
+                       extract_county_data(str(path), engine=engine, sheet_workers=2))
@@ -0,0 +1,89 @@
+import multiprocessing
+import os
+import shutil
+import time
+
+import pytest
+
+import job_queue
+from excel_engine import process_workbook
+from job_queue import JobQueue
+from synthetic_workbook import generate_workbook
+
+TIMEOUT = 60
+
+
+def wait(queue, job_id):
+    """等待任务结束，返回任务状态"""
+    deadline = time.monotonic() + TIMEOUT
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job['state'] not in ('queued', 'running'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"任务 {job_id} 在 {TIMEOUT} 秒内没有结束")
+
+
+@pytest.fixture
+def queue():
+    queue = JobQueue(max_workers=1, max_pending=2)
+    yield queue
+    queue.shutdown()
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    path = tmp_path / 'small.xlsx'
+    generate_workbook(str(path), sheets=3, tables_per_sheet=2, counties_per_table=4, metrics=6, seed=1)
+    return str(path)
+
+
+def test_job_reports_progress_without_console_output(queue, workbook, tmp_path, capfd):
+    job = wait(queue, queue.submit(workbook, str(tmp_path / 'out.xlsx')))
+    assert job['state'] == 'done', job['error']
+    progress = job['progress']
+    assert (progress['sheets_done'], progress['sheets_total']) == (3, 3)
+    assert progress['elapsed'] >= 0
+    # 工作进程不在服务的标准错误上绘制进度条
+    assert capfd.readouterr().err == ''
+
+
+@pytest.fixture
+def large_workbook(tmp_path):
+    # 大于 CALAMINE_MIN_BYTES，自动选择读取引擎时使用 calamine
+    path = tmp_path / 'large.xlsx'
+    generate_workbook(str(path), sheets=4, tables_per_sheet=4, counties_per_table=40, metrics=150, seed=1)
+    return str(path)
+
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/statm'), reason='内存上限需要 /proc（仅 Linux）')
+def test_memory_limit_fails_job_cleanly(large_workbook, workbook, tmp_path):
+    queue = JobQueue(max_workers=1, max_pending=2, max_memory_mb=5)
+    try:
+        job = wait(queue, queue.submit(large_workbook, str(tmp_path / 'large_out.xlsx')))
+        assert job['state'] == 'failed'
+        assert '内存上限' in job['error']
+        # 之后提交的任务不受影响
+        job = wait(queue, queue.submit(workbook, str(tmp_path / 'small_out.xlsx')))
+        assert job['state'] == 'done', job['error']
+    finally:
+        queue.shutdown()
+
+
+def _crash_on_marker(source, *args, **kwargs):
+    if 'crash' in os.path.basename(source):
+        os._exit(1)
+    return process_workbook(source, *args, **kwargs)
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork', reason='需要 fork 的工作进程继承替换后的函数')
+def test_worker_crash_does_not_break_queue(queue, workbook, tmp_path, monkeypatch):
+    # 模拟原生扩展在内存分配失败时直接终止工作进程
+    monkeypatch.setattr(job_queue, 'process_workbook', _crash_on_marker)
+    crash = tmp_path / 'crash.xlsx'
+    shutil.copyfile(workbook, crash)
+    job = wait(queue, queue.submit(str(crash), str(tmp_path / 'crash_out.xlsx')))
+    assert job['state'] == 'failed'
+    assert '意外退出' in job['error']
+    job = wait(queue, queue.submit(workbook, str(tmp_path / 'out.xlsx')))
+    assert job['state'] == 'done', job['error']
@@ -0,0 +1,131 @@
+import pandas as pd
+import pytest
+
+from layout_rules import BUILTIN_RULE_SETS, compile_rules
+from data_processor import extract_county_data, _scan_sheet, _scan_rows, ENGINES
+from workbooks import write_rows
+
+# 各版式的示例工作表（第1行为列名行，与读取Excel时一致，不参与识别）及期望的提取结果
+FIXTURES = [
+    ('standard', '四川省', [
+        ['四川省县域主要指标', None, None, None],
+        ['指标', '单位', '武侯区', '锦江区'],
+        ['一、综合', None, None, None],
+        ['地区生产总值', '亿元', 1200.5, 980.1],
+        ['常住人口', '万人', 120, None],
+        ['九、其他', None, None, None],
+        ['城镇化率', '%', 85.2, 90.1],
+        ['注：人口为年末数', None, None, None],
+        ['指标', '单位', '青羊区', None],
+        ['十、补充', None, None, None],
+        ['地区生产总值', '亿元', 1500, None],
+    ], {
+        'counties': ['武侯区', '锦江区', '青羊区'],
+        'metrics': ['地区生产总值', '城镇化率', '常住人口'],
+        'records': 6,
+    }),
+    ('project', '海南省', [
+        ['海南省市县主要经济指标', None, None, None],
+        ['项目', '单位', '海口市', '三亚市'],
+        ['一、经济', None, None, None],
+        ['地区生产总值', '亿元', 2100.0, 900.5],
+        ['九、社会', None, None, None],
+        ['常住人口', '万人', 290, 107],
+        ['资料来源：统计年鉴', None, None, None],
+    ], {
+        'counties': ['海口市', '三亚市'],
+        'metrics': ['地区生产总值', '常住人口'],
+        'records': 4,
+    }),
+    ('shifted_unit', '云南省', [
+        ['云南省县域统计', None, None, None, None],
+        ['指标', '代码', '单位', '五华区', '盘龙区'],
+        ['一、综合', None, None, None, None],
+        ['地区生产总值', 'A01', '亿元', 1300.2, 1000.8],
+        ['常住人口', 'A02', '万人', None, 98],
+    ], {
+        'counties': ['五华区', '盘龙区'],
+        'metrics': ['地区生产总值', '常住人口'],
+        'records': 3,
+    }),
+]
+
+# README 中自定义规则文件的示例
+GANSU_RULES = [{
+    'name': 'gansu',
+    'header_labels': ['主要指标'], 'unit_column': 1, 'unit_labels': ['计量单位'], 'first_county_column': 2,
+    'skip_patterns': ['^其中[:：]'],
+}]
+GANSU_ROWS = [['标题'], ['主要指标', '计量单位', '城关区'], ['其中：城镇', '万人', 80], ['常住人口', '万人', 130]]
+
+
+def scan_both(rows, rulebook):
+    """用 vectorized 和 stream 引擎分别扫描同一个示例工作表"""
+    width = max(len(row) for row in rows)
+    rows = [list(row) + [None] * (width - len(row)) for row in rows]
+    df = pd.DataFrame(rows[1:], columns=[f"列{index}" for index in range(width)])
+    return {'vectorized': _scan_sheet(df, rulebook), 'stream': _scan_rows(rows[1:], rulebook)}
+
+
+def summary(sheet):
+    return {
+        'layout': sheet['layout'],
+        'counties': sheet['counties'],
+        'metrics': sorted(set(sheet['metrics'])),
+        'records': len(sheet['record_values']),
+    }
+
+
+@pytest.mark.parametrize('layout, province, rows, expected', FIXTURES, ids=[f[0] for f in FIXTURES])
+def test_builtin_layouts(layout, province, rows, expected):
+    rulebook = compile_rules(BUILTIN_RULE_SETS)
+    wanted = dict(expected, layout=layout, metrics=sorted(expected['metrics']))
+    for engine, sheet in scan_both(rows, rulebook).items():
+        assert summary(sheet) == wanted, engine
+
+
+@pytest.mark.parametrize('layout, province, rows, expected', FIXTURES, ids=[f[0] for f in FIXTURES])
+def test_custom_rules_keep_builtin_layouts(layout, province, rows, expected):
+    # 自定义规则集排在内置规则集之前，不应改变已有版式的识别结果
+    rulebook = compile_rules(GANSU_RULES + BUILTIN_RULE_SETS)
+    wanted = dict(expected, layout=layout, metrics=sorted(expected['metrics']))
+    for engine, sheet in scan_both(rows, rulebook).items():
+        assert summary(sheet) == wanted, engine
+
+
+def test_custom_layout():
+    rulebook = compile_rules(GANSU_RULES + BUILTIN_RULE_SETS)
+    for engine, sheet in scan_both(GANSU_ROWS, rulebook).items():
+        assert summary(sheet) == {'layout': 'gansu', 'counties': ['城关区'], 'metrics': ['常住人口'],
+                                  'records': 1}, engine
+
+
+def test_invalid_rules():
+    with pytest.raises(ValueError):
+        compile_rules(BUILTIN_RULE_SETS + BUILTIN_RULE_SETS[:1])
+    with pytest.raises(ValueError):
+        compile_rules([{'name': 'broken', 'header_labels': ['指标'], 'unit_column': 1}])
+
+
+# 同一工作表中先后出现两种版式的表头: 第二个表头开始新的表格区域，不能当作上一个区域的指标行
+MIXED_ROWS = [['t'], ['项目', '单位', 'A县'], ['gdp', '亿元', 1], ['指标', '单位', 'B县'], ['pop', '万人', 2]]
+
+
+def test_mixed_layouts_in_one_sheet():
+    rulebook = compile_rules(BUILTIN_RULE_SETS)
+    for engine, sheet in scan_both(MIXED_ROWS, rulebook).items():
+        assert summary(sheet) == {'layout': 'project', 'counties': ['A县', 'B县'], 'metrics': ['gdp', 'pop'],
+                                  'records': 2}, engine
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_mixed_layouts_result(tmp_path, engine):
+    path = tmp_path / 'mixed.xlsx'
+    write_rows(path, {'Sheet1': MIXED_ROWS})
+    result_df = extract_county_data(str(path), engine=engine)
+    assert result_df.columns.tolist() == ['县域', 'gdp', 'pop']
+    assert result_df['县域'].tolist() == ['A县', 'B县']
+    assert result_df.set_index('县域').loc['A县', 'gdp'] == 1
+    assert result_df.set_index('县域').loc['B县', 'pop'] == 2
+    assert pd.isna(result_df.set_index('县域').loc['A县', 'pop'])
+    assert pd.isna(result_df.set_index('县域').loc['B县', 'gdp'])
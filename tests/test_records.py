@@ -0,0 +1,58 @@
+import random
+
+import pandas as pd
+import pytest
+
+from data_processor import extract_county_data, iter_records
+from synthetic_workbook import generate_workbook
+from test_engines import EDGE_CASES, SYNTHETIC, random_sheet
+from workbooks import write_rows
+
+
+def workbook(tmp_path, case):
+    """按用例名称生成工作簿: 合成工作簿、边界情况或随机工作簿（random<种子>）"""
+    path = tmp_path / f'{case}.xlsx'
+    if case in SYNTHETIC:
+        generate_workbook(str(path), **SYNTHETIC[case])
+    elif case in EDGE_CASES:
+        write_rows(path, EDGE_CASES[case])
+    else:
+        rng = random.Random(int(case[len('random'):]))
+        write_rows(path, {f'表{index}': random_sheet(rng) for index in range(rng.randint(1, 3))})
+    return str(path)
+
+
+def melt_result(result_df):
+    """把宽表结果展开为 {(县域, 指标): 取值}，空单元格不计入"""
+    long_df = result_df.melt(id_vars='县域', var_name='指标', value_name='取值').dropna(subset=['取值'])
+    return {(county, metric): value for county, metric, value in long_df.itertuples(index=False, name=None)}
+
+
+@pytest.mark.parametrize('case', sorted(SYNTHETIC) + sorted(EDGE_CASES) + [f'random{seed}' for seed in range(10)])
+def test_records_match_result(tmp_path, case):
+    path = workbook(tmp_path, case)
+    result_df = extract_county_data(path)
+    # 同一 (县域, 指标) 出现多次时宽表保留最后一次的取值
+    records = {}
+    for county, metric, unit, value, sheet in iter_records(path):
+        records[(county, metric)] = value
+    expected = melt_result(result_df)
+    assert records.keys() == expected.keys()
+    for key, value in expected.items():
+        assert records[key] == value, key
+        # object列保留原始类型；数值列中的整数在宽表中可能提升为浮点数
+        if result_df[key[1]].dtype == object:
+            assert type(records[key]) is type(value), key
+
+
+def test_record_units(tmp_path):
+    path = write_rows(tmp_path / 'units.xlsx', {'表1': [
+        ['标题'],
+        ['指标', '单位', '甲县'],
+        ['人口', ' 万人 ', 1],
+        ['面积', None, 2],
+        ['指标', '代码', '单位', '乙县'],
+        ['产值', 'A1', 100, 3],
+    ]})
+    assert [record[:3] for record in iter_records(str(path))] == [
+        ('甲县', '人口', '万人'), ('甲县', '面积', None), ('乙县', '产值', '100')]
@@ -0,0 +1,21 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from result_preview import frame_window
+
+
+def test_missing_values_are_null():
+    frame = pd.DataFrame({
+        '县域': ['甲县', '乙县'],
+        '日期': [pd.NaT, pd.Timestamp('2024-01-31')],
+        '人口': [np.nan, 12.5],
+    })
+    window = frame_window(frame)
+    assert window['rows'] == [[None, None], ['2024-01-31T00:00:00', 12.5]]
+
+
+def test_object_column_with_nat():
+    frame = pd.DataFrame({'县域': ['甲县', '乙县'], '日期': pd.Series([pd.NaT, datetime.date(2024, 1, 31)], dtype=object)})
+    assert frame_window(frame)['rows'] == [[None], ['2024-01-31']]
@@ -0,0 +1,39 @@
+import pytest
+
+from check_excel_structure import probe_workbook
+from data_processor import extract_county_data, ENGINES
+from workbooks import write_rows, prefix_sheet_elements
+
+ROWS = [
+    ['四川省县域主要指标', None, None, None],
+    ['指标', '单位', '武侯区', '锦江区'],
+    ['一、综合', None, None, None],
+    ['地区生产总值', '亿元', 1200.5, 980.1],
+    ['常住人口', '万人', 120, None],
+]
+
+
+def without_timing(probe):
+    return {key: value for key, value in probe.items() if key != 'probe_seconds'}
+
+
+@pytest.fixture
+def workbooks(tmp_path):
+    plain = write_rows(str(tmp_path / 'plain.xlsx'), {'Sheet1': ROWS})
+    prefixed = prefix_sheet_elements(write_rows(str(tmp_path / 'prefixed.xlsx'), {'Sheet1': ROWS}))
+    return plain, prefixed
+
+
+def test_probe_prefixed_sheet_xml(workbooks):
+    plain, prefixed = workbooks
+    probe = probe_workbook(prefixed)
+    assert probe['method'] == 'xml'
+    assert probe['ok'], probe['issues']
+    assert without_timing(probe) == without_timing(probe_workbook(plain))
+    assert probe['totals']['counties'] == 2
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_extract_prefixed_sheet_xml(workbooks, engine):
+    plain, prefixed = workbooks
+    assert extract_county_data(prefixed, engine=engine).equals(extract_county_data(plain, engine=engine))
@@ -0,0 +1,30 @@
+"""测试用的工作簿构造工具"""
+import re
+import zipfile
+
+from openpyxl import Workbook
+
+
+def write_rows(path, sheets):
+    """把 {工作表名称: 行列表} 写成xlsx文件，None 为空单元格"""
+    workbook = Workbook()
+    workbook.remove(workbook.active)
+    for sheet_name, rows in sheets.items():
+        worksheet = workbook.create_sheet(sheet_name)
+        for row in rows:
+            worksheet.append(list(row))
+    workbook.save(path)
+    return path
+
+
+def prefix_sheet_elements(path, prefix='x'):
+    """把xlsx中工作表XML的元素改写为带命名空间前缀的形式（如 <x:row>，OpenXML SDK 的写法），取值不变"""
+    with zipfile.ZipFile(path) as archive:
+        entries = [(info, archive.read(info)) for info in archive.infolist()]
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for info, data in entries:
+            if info.filename.startswith('xl/worksheets/'):
+                data = data.replace(b'xmlns="', b'xmlns:' + prefix.encode('ascii') + b'="', 1)
+                data = re.sub(rb'<(/?)(?=\w)', b'<\\1' + prefix.encode('ascii') + b':', data)
+            archive.writestr(info, data)
+    return path
@@ -0,0 +1,510 @@
+import os
+import re
+import math
+import logging
+import hashlib
+import importlib.util
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from openpyxl.cell.cell import ERROR_CODES
+from pandas._libs.parsers import STR_NA_VALUES
+from pandas.io.parsers import TextParser
+
+logger = logging.getLogger(__name__)
+
+# 共享字符串单元格（t="s"）中的字符串索引，计算指纹时替换为字符串本身
+_SHARED_STRING_CELL = re.compile(rb'<c\b[^>]*?\bt="s"[^>]*>\s*<v>(\d+)</v>')
+
+# 读取引擎（pd.ExcelFile 的 engine）及其依赖的模块
+READERS = {
+    'openpyxl': 'openpyxl',
+    'xlrd': 'xlrd',
+    'calamine': 'python_calamine',
+}
+# 各文件格式可用的读取引擎，按自动选择时的优先顺序排列；calamine 为原生实现，解析速度快数倍
+FORMAT_READERS = {
+    'xlsx': ('calamine', 'openpyxl'),
+    'xls': ('calamine', 'xlrd'),
+}
+# 小于该大小的xlsx文件自动选择时使用 openpyxl: 解析只需几毫秒，同一个容器还可以直接提供
+# 指纹、结构探查和逐行读取所需的原始XML，不必再打开一次
+CALAMINE_MIN_BYTES = 64 * 1024
+# 默认读取引擎: auto 按文件格式和大小自动选择
+DEFAULT_READER = os.environ.get('EXCEL_READER', 'auto')
+
+_FORMAT_SIGNATURES = {
+    b'PK\x03\x04': 'xlsx',
+    b'\xd0\xcf\x11\xe0': 'xls',
+}
+
+
+class ExcelWorkbook:
+    """
+    Excel工作簿加载器：只解析一次文件容器（xlsx的zip/XML或xls的BIFF），
+    由同一个解析结果依次提供各工作表的数据以及路由需要的结构统计
+
+    工作表按需逐个解析，调用方处理完一个工作表后即可释放，避免同时持有全部工作表
+
+    参数:
+    source: Excel文件路径或已打开的二进制文件对象
+    reader: 读取引擎，'auto'（默认，见 choose_readers）、'openpyxl'、'xlrd' 或 'calamine'；
+            指定的引擎未安装或不支持该格式时按自动选择的顺序退回，打开失败时依次尝试下一个引擎
+    """
+
+    def __init__(self, source, reader=None):
+        self.source = source
+        self.format = detect_format(source)
+        self._excel_file = _open_excel_file(source, choose_readers(source, reader or DEFAULT_READER))
+        # 实际使用的读取引擎
+        self.reader = self._excel_file.engine
+        # 非 openpyxl 读取的xlsx文件，需要原始XML时另外以只读方式打开的 openpyxl 工作簿
+        self._xlsx_book = None
+        self.sheet_names = list(self._excel_file.sheet_names)
+        # 已解析工作表的形状，按解析顺序记录
+        self.sheet_shapes = {}
+        # 工作簿级的指纹前缀（样式表和日期系统），首次计算工作表指纹时生成
+        self._fingerprint_prefix = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """释放底层文件句柄"""
+        self._excel_file.close()
+        if self._xlsx_book is not None:
+            self._xlsx_book.close()
+            self._xlsx_book = None
+
+    def _openpyxl_book(self):
+        """
+        xlsx 文件的 openpyxl 只读工作簿（读取原始XML、逐行读取时使用），非xlsx文件返回None
+
+        用 openpyxl 读取时直接使用同一个工作簿；用其他引擎读取时另外打开一次（只读取容器目录、
+        共享字符串表和样式，不解析工作表）
+        """
+        if self.reader == 'openpyxl':
+            return self._excel_file.book
+        if self.format != 'xlsx':
+            return None
+        if self._xlsx_book is None:
+            from openpyxl import load_workbook
+            if hasattr(self.source, 'seek'):
+                self.source.seek(0)
+            self._xlsx_book = load_workbook(self.source, read_only=True, data_only=True, keep_links=False)
+        return self._xlsx_book
+
+    def read_sheet(self, sheet_name):
+        """从已打开的工作簿解析单个工作表（与 pd.read_excel 的默认参数一致）"""
+        df = self._excel_file.parse(sheet_name)
+        self.sheet_shapes[sheet_name] = df.shape
+        return df
+
+    def iter_sheets(self):
+        """按工作表顺序逐个产出 (工作表名称, DataFrame)"""
+        for sheet_name in self.sheet_names:
+            yield sheet_name, self.read_sheet(sheet_name)
+
+    def iter_sheet_rows(self):
+        """
+        按工作表顺序逐个产出 (工作表名称, 行迭代器)，每行为单元格值列表，空单元格为None
+
+        与 read_sheet 一样把每个工作表的第一行视为列名而不产出；xlsx 文件直接从
+        openpyxl 只读工作簿逐行读取（与读取引擎无关），内存占用与工作表大小无关，其他格式退回到逐表解析
+        """
+        for sheet_name in self.sheet_names:
+            yield sheet_name, self.sheet_rows(sheet_name)
+
+    def sheet_rows(self, sheet_name):
+        """
+        返回单个工作表的行迭代器（SheetRows），规则同 iter_sheet_rows；迭代结束后该表的形状记录在 sheet_shapes 中
+
+        逐行读取时单元格值只按单元格本身转换，pd.read_excel 按整列推断的类型（例如整列为数字时把数字文本转换为数值、
+        有空单元格的整数列提升为浮点数）要在读完工作表后由 SheetRows.column_types 换算
+        """
+        book = self._openpyxl_book()
+        if book is not None:
+            worksheet = book[sheet_name]
+            worksheet.reset_dimensions()
+            column_types = ColumnTypes()
+            return SheetRows(self._stream_openpyxl_rows(sheet_name, worksheet, column_types), column_types)
+        return SheetRows(self._iter_parsed_rows(sheet_name))
+
+    def _stream_openpyxl_rows(self, sheet_name, worksheet, column_types):
+        """逐行读取只读工作表，并按 pd.read_excel 的规则转换单元格值、统计工作表形状和各列的类型推断依据"""
+        last_row = 0
+        width = 0
+        for index, row in enumerate(worksheet.iter_rows(values_only=True)):
+            # 与pandas一致: 行尾的空单元格不计入列数，末尾的空行不计入行数
+            filled = len(row)
+            while filled and (row[filled - 1] is None or row[filled - 1] == ''):
+                filled -= 1
+            if filled:
+                last_row = index
+                width = max(width, filled)
+            if index == 0:
+                continue
+            row = row[:filled]
+            column_types.add(index - 1, row)
+            yield [_convert_cell(value) for value in row]
+        # 第1行为列名行，数据行为第2行到最后一个非空行
+        column_types.finish(last_row)
+        self.sheet_shapes[sheet_name] = (last_row, width)
+
+    def _iter_parsed_rows(self, sheet_name):
+        df = self.read_sheet(sheet_name)
+        for row in df.itertuples(index=False, name=None):
+            yield [None if pd.isna(value) else value for value in row]
+
+    def sheet_xml(self, sheet_name):
+        """
+        xlsx 工作表的原始XML（未解析），以及解析单元格需要的共享字符串表
+
+        返回: (XML字节串, 共享字符串列表)；非xlsx文件返回None
+        """
+        book = self._openpyxl_book()
+        if book is None:
+            return None
+        archive = getattr(book, '_archive', None)
+        worksheet = book[sheet_name]
+        path = getattr(worksheet, '_worksheet_path', None)
+        if archive is None or path is None:
+            return None
+        # 只读模式下共享字符串表由工作表持有（book.shared_strings 是写入时使用的空表）
+        return archive.read(path), getattr(worksheet, '_shared_strings', book.shared_strings)
+
+    def sheet_fingerprint(self, sheet_name, salt=''):
+        """
+        工作表内容的指纹（SHA-256十六进制），内容不变时指纹不变，与文件名、工作表名称和位置无关
+
+        指纹覆盖工作表XML的原始内容，共享字符串索引替换为字符串本身（其他工作表增删文本导致
+        的重新编号不会改变指纹），另外包含影响取值转换的样式表和日期系统。只有xlsx文件支持，
+        其他格式返回None（调用方应视为内容已变化）
+
+        参数:
+        salt: 附加到指纹中的文本，例如提取引擎及其版本
+        """
+        raw = self.sheet_xml(sheet_name)
+        if raw is None:
+            return None
+        xml, shared_strings = raw
+
+        if self._fingerprint_prefix is None:
+            book = self._openpyxl_book()
+            try:
+                styles = book._archive.read('xl/styles.xml')
+            except KeyError:
+                styles = b''
+            self._fingerprint_prefix = (hashlib.sha256(styles).hexdigest() + f"|{book.epoch.isoformat()}|").encode('utf-8')
+
+        digest = hashlib.sha256(salt.encode('utf-8') + b'|' + self._fingerprint_prefix)
+        position = 0
+        replaced = 0
+        for match in _SHARED_STRING_CELL.finditer(xml):
+            digest.update(xml[position:match.start(1)])
+            text = str(shared_strings[int(match.group(1))]).encode('utf-8')
+            digest.update(f"{len(text)}:".encode('ascii') + text)
+            position = match.end(1)
+            replaced += 1
+        digest.update(xml[position:])
+        # 个别共享字符串单元格未被替换时（非常规写法），保守地把整个共享字符串表计入指纹
+        if replaced != xml.count(b't="s"'):
+            digest.update('\x00'.join(map(str, shared_strings)).encode('utf-8'))
+        return digest.hexdigest()
+
+    @property
+    def stats(self):
+        """
+        工作簿的结构统计
+
+        first_sheet_shape 与 pd.read_excel(文件) 读取第一个工作表得到的形状一致，
+        若第一个工作表尚未解析则会补充解析一次
+        """
+        first_sheet_shape = (0, 0)
+        if self.sheet_names:
+            first_sheet = self.sheet_names[0]
+            if first_sheet not in self.sheet_shapes:
+                self.read_sheet(first_sheet)
+            first_sheet_shape = self.sheet_shapes[first_sheet]
+
+        return {
+            'reader': self.reader,
+            'sheet_count': len(self.sheet_names),
+            'first_sheet_shape': first_sheet_shape,
+            'sheet_shapes': dict(self.sheet_shapes),
+            'total_rows': sum(rows for rows, _ in self.sheet_shapes.values()),
+            'total_cells': sum(rows * cols for rows, cols in self.sheet_shapes.values()),
+        }
+
+
+class SheetRows:
+    """
+    单个工作表的行迭代器: 每行为单元格值列表（空单元格为None），只能迭代一次
+
+    column_types 为逐行读取时记录的各列类型推断依据（ColumnTypes），读完工作表后用于把保留下来的单元格值
+    换算为 pd.read_excel 的结果；由整表解析得到的行已经是 pd.read_excel 的结果，column_types 为None
+    """
+
+    def __init__(self, rows, column_types=None):
+        self._rows = rows
+        self.column_types = column_types
+
+    def __iter__(self):
+        return iter(self._rows)
+
+
+class ColumnTypes:
+    """
+    逐行读取时记录各列中影响 pd.read_excel 类型推断的取值
+
+    pandas 按整列推断类型，某个单元格的结果取决于同一列的其他单元格（例如整列都是数字时数字文本 '8' 转换为 8，
+    有空单元格时整数提升为浮点数，县域表头 123 随之变为 '123.0'）。逐行读取时无法提前知道整列的情况，
+    因此每一列按取值的类别（空、缺失值文本、普通文本、数字文本、整数、浮点数、布尔值……）只记录每类首次出现的单元格，
+    读完工作表后把这些样例与调用方保留下来的单元格按行号顺序合在一起，用与 pd.read_excel 相同的解析器推断一次，
+    内存占用与工作表的行数无关
+    """
+
+    def __init__(self):
+        # 各列的 {取值类别: (行号, 原始值)}
+        self._samples = []
+        # 逐行递减的最短行长度 [(行号, 长度)]: 行尾缺少的单元格在 pandas 中是空单元格
+        self._short_rows = []
+        self._rows = None
+
+    def add(self, index, row):
+        """记录一个数据行（第1个数据行的行号为0）；row 为 openpyxl 读出的原始单元格值，行尾的空单元格已去除"""
+        if not self._short_rows or len(row) < self._short_rows[-1][1]:
+            self._short_rows.append((index, len(row)))
+        all_samples = self._samples
+        while len(all_samples) < len(row):
+            all_samples.append({})
+        for samples, value in zip(all_samples, row):
+            # 文本和空单元格最常见，直接分类
+            kind = _text_kind(value) if type(value) is str else _EMPTY if value is None else _cell_kind(value)
+            if kind not in samples:
+                samples[kind] = (index, _reader_value(value))
+
+    def finish(self, rows):
+        """工作表读完: rows 为数据行数（不含末尾的空行）"""
+        self._rows = rows
+
+    def needs_conversion(self, column):
+        """该列的取值是否可能被整列推断改变: 含普通文本且不含布尔值的列按文本列读取，取值保持不变"""
+        kinds = self._samples[column].keys() if column < len(self._samples) else ()
+        return _TEXT not in kinds or any(isinstance(kind, tuple) and kind[0] == 'bool' for kind in kinds)
+
+    def convert(self, column, rows, values):
+        """
+        把第 column 列中保留下来的单元格值换算为 pd.read_excel 的结果
+
+        参数:
+        column: 列号（从0开始）
+        rows: 各单元格的行号（与 add 的行号一致）
+        values: 各单元格的值（非空）
+
+        返回: 换算后的取值列表，顺序与 values 一致
+        """
+        # 绝大多数县域列都有文本表头，不需要换算
+        if not self.needs_conversion(column):
+            return list(values)
+
+        samples = self._samples[column] if column < len(self._samples) else {}
+        cells = {index: value for index, value in samples.values() if self._rows is None or index < self._rows}
+        # 行长度不到该列的第一个数据行: 该列在这一行是空单元格
+        for index, length in self._short_rows:
+            if length <= column:
+                if self._rows is None or index < self._rows:
+                    cells.setdefault(index, '')
+                break
+        cells.update(zip(rows, values))
+        order = sorted(cells)
+        parser = TextParser([[column]] + [[cells[index]] for index in order], header=0, skip_blank_lines=False)
+        converted = dict(zip(order, parser.read().iloc[:, 0].to_numpy(dtype=object)))
+        return [converted[index] for index in rows]
+
+
+# 单元格取值的类别（ColumnTypes）: 同一类别的取值对整列类型推断的影响相同
+_EMPTY = 'empty'
+_NA_TEXT = 'na'
+_TEXT = 'text'
+_NAN = 'nan'
+_INT64_MAX = 2 ** 63 - 1
+_UINT64_MAX = 2 ** 64 - 1
+_BOOL_TEXT = frozenset(('True', 'TRUE', 'true', 'False', 'FALSE', 'false'))
+_INF_TEXT = frozenset(('inf', '+inf', '-inf', 'infinity', '+infinity', '-infinity'))
+
+
+def _cell_kind(value):
+    """单元格取值的类别；0、1 与 False、True 相等，pandas 解析时会互相替换，因此单独分类"""
+    kind = type(value)
+    if value is None:
+        return _EMPTY
+    if kind is str:
+        return _text_kind(value)
+    if kind is float:
+        if value.is_integer():
+            value = int(value)
+        elif math.isnan(value):
+            return _NAN
+        else:
+            return ('float', value < 0, math.isinf(value))
+    if kind is bool:
+        return ('bool', value)
+    if isinstance(value, int):
+        if 0 <= value <= 1:
+            return ('int', value)
+        if value < 0:
+            return ('int', 'negative' if value >= -_INT64_MAX - 1 else 'negative-overflow')
+        return ('int', 'int64' if value <= _INT64_MAX else 'uint64' if value <= _UINT64_MAX else 'overflow')
+    return kind
+
+
+@lru_cache(maxsize=65536)
+def _text_kind(text):
+    if text == '':
+        return _EMPTY
+    if text in ERROR_CODES:
+        return _NAN
+    if text in STR_NA_VALUES:
+        return _NA_TEXT
+    if text in _BOOL_TEXT:
+        return ('bool-text', text)
+    # 不含数字的文本（inf 等除外）不可能是数字文本，省去一次转换尝试
+    if not any(char.isdigit() for char in text) and text.strip().lower() not in _INF_TEXT:
+        return _TEXT
+    try:
+        number = pd.to_numeric(np.array([text], dtype=object))
+    except (ValueError, TypeError):
+        return _TEXT
+    return ('number-text', number.dtype.str, bool(number[0] < 0))
+
+
+def _reader_value(value):
+    """openpyxl 单元格值在 pd.read_excel 解析器中的形式: 空为''，错误值为NaN，整数值的浮点数为整数"""
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return np.nan if value in ERROR_CODES else value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _convert_cell(value):
+    """按 pd.read_excel 的默认规则转换单元格值，缺失值（空、NA字符串、错误值）返回None"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        if value in STR_NA_VALUES or value in ERROR_CODES:
+            return None
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def reader_available(reader):
+    """读取引擎的依赖是否已安装"""
+    return importlib.util.find_spec(READERS[reader]) is not None
+
+
+def available_readers():
+    """已安装的读取引擎列表"""
+    return [reader for reader in READERS if reader_available(reader)]
+
+
+def detect_format(source):
+    """
+    按文件头判断工作簿格式: 'xlsx'（zip容器）或 'xls'（OLE2/BIFF），无法判断时返回None
+
+    参数:
+    source: 文件路径或二进制文件对象（读取后恢复原来的位置）
+    """
+    try:
+        if hasattr(source, 'read'):
+            position = source.tell()
+            head = source.read(4)
+            source.seek(position)
+        else:
+            with open(source, 'rb') as f:
+                head = f.read(4)
+    except (OSError, ValueError):
+        return None
+    return _FORMAT_SIGNATURES.get(bytes(head))
+
+
+def _source_size(source):
+    try:
+        if hasattr(source, 'seek'):
+            position = source.tell()
+            size = source.seek(0, os.SEEK_END)
+            source.seek(position)
+            return size
+        return os.path.getsize(source)
+    except (OSError, ValueError):
+        return None
+
+
+def choose_readers(source, reader='auto'):
+    """
+    按文件格式和大小确定读取引擎的尝试顺序
+
+    - xls: calamine（已安装时），其次 xlrd
+    - xlsx: 不小于 CALAMINE_MIN_BYTES 时 calamine（已安装时）优先，其次 openpyxl；更小的文件只用 openpyxl
+    - 指定的引擎已安装且支持该格式时排在最前，否则记录警告并按自动选择的顺序
+    - 无法判断格式时交给pandas按文件内容判断（指定了引擎时使用指定的引擎）
+
+    返回: 引擎名称列表（可能为 [None]，表示由pandas选择）
+    """
+    if reader != 'auto' and reader not in READERS:
+        raise ValueError(f"不支持的读取引擎: {reader}，可选: auto, {', '.join(READERS)}")
+    file_format = detect_format(source)
+    if file_format is None:
+        return [None if reader == 'auto' else reader]
+
+    candidates = [name for name in FORMAT_READERS[file_format] if reader_available(name)]
+    if file_format == 'xlsx' and len(candidates) > 1:
+        size = _source_size(source)
+        if size is not None and size < CALAMINE_MIN_BYTES:
+            candidates.remove('calamine')
+    if reader != 'auto':
+        if reader in candidates or (reader in FORMAT_READERS[file_format] and reader_available(reader)):
+            candidates = [reader] + [name for name in candidates if name != reader]
+        else:
+            logger.warning("读取引擎 %s 未安装或不支持 %s 文件，改为自动选择: %s", reader, file_format,
+                           ', '.join(candidates) or '无')
+    if not candidates:
+        raise ImportError(f"读取 {file_format} 文件需要安装以下任一依赖: "
+                          f"{', '.join(READERS[name] for name in FORMAT_READERS[file_format])}")
+    return candidates
+
+
+def _open_excel_file(source, readers):
+    """依次用各读取引擎打开工作簿，返回第一个成功打开的 pd.ExcelFile；全部失败时抛出第一个错误"""
+    first_error = None
+    for position, reader in enumerate(readers):
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        try:
+            return pd.ExcelFile(source, engine=reader)
+        except Exception as e:
+            if first_error is None:
+                first_error = e
+            if position + 1 < len(readers):
+                logger.warning("读取引擎 %s 无法打开工作簿，改用 %s: %s", reader, readers[position + 1], e)
+    raise first_error
+
+
+def open_workbook(source, reader=None):
+    """
+    打开Excel工作簿；若传入的已经是 ExcelWorkbook 则原样返回
+
+    参数:
+    reader: 读取引擎，None 表示使用 DEFAULT_READER（环境变量 EXCEL_READER，默认 auto）
+    """
+    if isinstance(source, ExcelWorkbook):
+        return source
+    return ExcelWorkbook(source, reader=reader)
@@ -0,0 +1,175 @@
+import os
+import time
+import uuid
+import shutil
+import string
+import logging
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+# 工作区目录名: uuid4 的十六进制串
+WORKSPACE_ID_LENGTH = 32
+# 超出磁盘预算时也不删除最近这段时间内使用过的工作区（秒），避免删掉正在处理的请求
+MIN_AGE_SECONDS = 60
+
+
+class Workspace:
+    """
+    单个请求的独立工作区目录，上传文件和处理结果都保存在这里，不同请求的同名文件互不覆盖
+
+    参数:
+    root: 工作区根目录
+    workspace_id: 工作区ID（目录名）
+    """
+
+    def __init__(self, root, workspace_id):
+        self.id = workspace_id
+        self.path = os.path.join(root, workspace_id)
+
+    def file_path(self, filename):
+        """工作区内文件的绝对路径"""
+        return os.path.join(self.path, filename)
+
+    def relative(self, filename):
+        """供下载链接使用的相对名称: <工作区ID>/<文件名>"""
+        return f"{self.id}/{filename}"
+
+
+class WorkspaceManager:
+    """
+    管理请求工作区，并由后台清理线程按存活时间和磁盘预算删除过期的工作区
+
+    - 超过 ttl_seconds 未被访问（写入或下载）的工作区被删除
+    - 所有工作区的总大小超过 max_bytes 时，从最久未访问的开始删除，直到不超过预算
+      （最近 MIN_AGE_SECONDS 秒内使用过的工作区除外）
+
+    多进程部署时每个进程各自运行一个清理线程，删除操作可以安全地重复执行
+
+    参数:
+    root: 工作区根目录
+    ttl_seconds: 工作区的存活时间（秒）
+    max_bytes: 工作区占用的磁盘预算（字节）
+    sweep_interval: 清理线程的扫描间隔（秒）
+    """
+
+    def __init__(self, root, ttl_seconds=3600, max_bytes=1024 * 1024 * 1024, sweep_interval=60):
+        self.root = root
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self.removed = 0
+        self._janitor_pid = None
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def create(self):
+        """创建一个新的工作区"""
+        workspace = Workspace(self.root, uuid.uuid4().hex)
+        os.makedirs(workspace.path)
+        return workspace
+
+    def resolve(self, relative):
+        """
+        把下载链接中的 <工作区ID>/<文件名> 解析为绝对路径，并刷新工作区的最近访问时间
+
+        返回: 文件路径；名称不合法或文件不存在时返回None
+        """
+        workspace_id, _, filename = relative.partition('/')
+        if (len(workspace_id) != WORKSPACE_ID_LENGTH or not set(workspace_id) <= set(string.hexdigits)
+                or not filename or '/' in filename or '\\' in filename or filename in ('.', '..')):
+            return None
+        path = os.path.join(self.root, workspace_id, filename)
+        if not os.path.isfile(path):
+            return None
+        try:
+            os.utime(os.path.join(self.root, workspace_id))
+        except OSError:
+            pass
+        return path
+
+    def _entries(self):
+        """返回 [(最近访问时间, 占用字节, 工作区路径)]，最近访问时间取目录及其中文件的最新修改时间"""
+        entries = []
+        for entry in os.scandir(self.root):
+            if not entry.is_dir(follow_symlinks=False) or len(entry.name) != WORKSPACE_ID_LENGTH:
+                continue
+            try:
+                last_used = entry.stat().st_mtime
+                size = 0
+                for item in os.scandir(entry.path):
+                    stat = item.stat(follow_symlinks=False)
+                    last_used = max(last_used, stat.st_mtime)
+                    size += stat.st_size
+            except OSError:
+                continue
+            entries.append((last_used, size, entry.path))
+        return entries
+
+    def sweep(self, now=None):
+        """执行一次清理，返回删除的工作区数"""
+        now = time.time() if now is None else now
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for last_used, size, path in entries:
+            age = now - last_used
+            if age <= self.ttl_seconds and (total <= self.max_bytes or age < MIN_AGE_SECONDS):
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            removed += 1
+        if removed:
+            self.removed += removed
+            logger.info("清理了 %d 个过期工作区，剩余占用 %.1f MB", removed, total / 1024 / 1024)
+        return removed
+
+    def ensure_janitor(self):
+        """在当前进程中启动后台清理线程（每个进程只启动一次，fork 出的子进程会各自重新启动）"""
+        if self._janitor_pid == os.getpid():
+            return
+        with self._lock:
+            if self._janitor_pid == os.getpid():
+                return
+            self._janitor_pid = os.getpid()
+            threading.Thread(target=self._run_janitor, name='workspace-janitor', daemon=True).start()
+
+    def _run_janitor(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error("清理工作区时出错: %s", e)
+            time.sleep(self.sweep_interval)
+
+    def stats(self):
+        """工作区数量与磁盘占用"""
+        entries = self._entries()
+        return {
+            'workspaces': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+            'ttl_seconds': self.ttl_seconds,
+            'removed': self.removed,
+        }
+
+
+def init_app(app, workspaces, spool_bytes):
+    """
+    为Flask应用启用上传缓冲和工作区清理
+
+    上传文件小于 spool_bytes 时保存在内存中，超过后转存到工作区根目录下的匿名临时文件，
+    解析器直接读取这个缓冲区；每个进程在处理第一个请求时启动清理线程
+    """
+    from flask import Request
+
+    class SpooledRequest(Request):
+        def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+            return tempfile.SpooledTemporaryFile(max_size=spool_bytes, mode='rb+', dir=workspaces.root)
+
+    app.request_class = SpooledRequest
+
+    @app.before_request
+    def _start_janitor():
+        workspaces.ensure_janitor()